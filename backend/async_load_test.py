@@ -0,0 +1,61 @@
+"""
+Fires N concurrent chat requests at a running server and reports latency
+percentiles and throughput. Used for the WSGI vs ASGI comparison in ASYNC.md.
+
+Usage:
+    python async_load_test.py http://127.0.0.1:8000/api/chat/ --concurrency 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(url, concurrency, requests_per_client, timeout):
+    payload = {'messages': [{'sender': 'user', 'text': 'I need a rental agreement.'}]}
+    latencies, failures = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal failures
+            for _ in range(requests_per_client):
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{url}: {concurrency} clients x {requests_per_client} requests in {elapsed:.1f}s")
+    print(f"  ok={len(latencies)} failed={failures} throughput={len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(
+            f"  p50={percentile(latencies, 0.50):.2f}s p95={percentile(latencies, 0.95):.2f}s "
+            f"p99={percentile(latencies, 0.99):.2f}s mean={statistics.mean(latencies):.2f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=1, help='requests per client')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.requests, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
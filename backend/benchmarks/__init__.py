@@ -0,0 +1,7 @@
+"""
+Offline benchmark and load-test suite for the generator API; see BENCHMARKS.md.
+
+    python -m benchmarks routes --requests 50 --concurrency 4
+    python -m benchmarks pdf conversations
+    python -m benchmarks all --compare bench-results/baseline.json
+"""
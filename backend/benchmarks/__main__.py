@@ -0,0 +1,78 @@
+import argparse
+import sys
+
+from . import __doc__ as usage
+from . import environment, results
+
+
+SUITES = ('routes', 'pdf', 'conversations', 'coldstart')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=usage, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('suites', nargs='+', choices=SUITES + ('all',))
+    parser.add_argument('--mongo-uri', help='A scratch database on a local mongod. Defaults to an in-memory Mongo double (mongomock).')
+    parser.add_argument('--reset', action='store_true', help='Allow emptying a --mongo-uri database that already has data.')
+    parser.add_argument('--requests', type=int, default=30, help='Timed requests per route scenario.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients per route scenario (writes run serially).')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests before each scenario.')
+    parser.add_argument('--only', help='Only run route scenarios whose name contains this text.')
+    parser.add_argument('--conversations', type=int, default=100, help='Background conversations seeded for the route scenarios.')
+    parser.add_argument('--versions', type=int, default=10, help='Versions of the benchmarked conversation.')
+    parser.add_argument('--document-chars', type=int, default=20000, help='Size of the benchmarked document.')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds the fake LLM takes per reply.')
+    parser.add_argument('--llm-output-chars', type=int, default=8000, help='Size of the document in each fake LLM reply.')
+    parser.add_argument('--cloudinary-latency', type=float, default=0.0, help='Seconds the fake Cloudinary takes per request.')
+    parser.add_argument('--pdf-workers', type=int, default=0, help='PDF render processes (0 renders inline).')
+    parser.add_argument('--pdf-sections', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--collection-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per micro-benchmark (fresh processes for coldstart).')
+    parser.add_argument('--first-request-delay', type=float, default=2.0, help='Seconds between boot and the first request in coldstart runs with warm-up.')
+    parser.add_argument('--output', default='bench-results', help='Directory results are saved in.')
+    parser.add_argument('--compare', metavar='RESULTS_JSON', help='Earlier results to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Slowdown (fraction of p50/p95) reported as a regression.')
+    args = parser.parse_args()
+    suites = SUITES if 'all' in args.suites else args.suites
+
+    env = environment.setup(
+        mongo_uri=args.mongo_uri,
+        reset=args.reset,
+        pdf_workers=args.pdf_workers,
+        llm_latency=args.llm_latency,
+        llm_output_chars=args.llm_output_chars,
+        cloudinary_latency=args.cloudinary_latency,
+    )
+    from . import coldstart, micro, routes
+
+    rows = []
+    try:
+        if 'coldstart' in suites:
+            # Fresh interpreters, so run before this process has imported everything.
+            rows += coldstart.run(args.runs, args.mongo_uri, args.first_request_delay, report=results.print_row)
+        if 'routes' in suites:
+            rows += routes.run(
+                env, args.requests, args.concurrency, args.warmup, args.only,
+                conversations=args.conversations, versions=args.versions, document_chars=args.document_chars,
+                report=results.print_row,
+            )
+        if 'pdf' in suites:
+            rows += micro.run_pdf(args.pdf_sections, args.runs, report=results.print_row)
+        if 'conversations' in suites:
+            rows += micro.run_conversations(env, args.collection_sizes, args.runs, report=results.print_row)
+    finally:
+        env.cloudinary.stop()
+
+    options = {key: value for key, value in vars(args).items() if key not in ('mongo_uri', 'output', 'compare')}
+    # The URI may carry credentials; record only which kind of Mongo was used.
+    options['mongo'] = 'mongod' if args.mongo_uri else 'in-memory'
+    path = results.save(rows, args.output, options)
+    print(f'\nSaved {len(rows)} results to {path}')
+    if args.compare:
+        regressions = results.compare(rows, args.compare, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s).')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
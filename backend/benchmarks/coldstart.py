@@ -0,0 +1,83 @@
+"""
+Cold start: each run boots the app in a fresh interpreter and times startup
+(WSGI application and URLconf) and the first request of each kind, with the
+background warm-up off and on.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .results import summarize
+
+
+FIRST_REQUESTS = (
+    ('GET /api/conversations/', 'get', '/api/conversations/', None),
+    ('POST /api/chat/', 'post', '/api/chat/', {'messages': [{'sender': 'user', 'text': 'I need a lease.'}]}),
+    ('POST /api/download-pdf/', 'post', '/api/download-pdf/', {'document_content': '# Lease\n\nThe rent is **$1,250.00**.\n'}),
+)
+
+# How long a freshly booted instance typically waits for its first request
+# (health check, load balancer registration).
+DEFAULT_FIRST_REQUEST_DELAY = 2.0
+
+
+def run(runs=5, mongo_uri=None, first_request_delay=DEFAULT_FIRST_REQUEST_DELAY, report=print):
+    rows = []
+    for warmup in (False, True):
+        samples = [_run_child(mongo_uri, warmup, first_request_delay) for _ in range(runs)]
+        suffix = f' (warm-up on, first request after {first_request_delay:g}s)' if warmup else ''
+        for key in samples[0]:
+            rows.append(summarize('coldstart', f'{key}{suffix}', [sample[key] for sample in samples]))
+            report(rows[-1])
+    return rows
+
+
+def _run_child(mongo_uri, warmup, first_request_delay):
+    env = dict(os.environ, WARMUP_ON_START='true' if warmup else 'false', LLM_PROVIDERS='fake', PDF_RENDER_WORKERS='0')
+    env['PDF_CACHE_DIR'] = tempfile.mkdtemp(prefix='docgen-coldstart-')
+    if mongo_uri:
+        env['BENCH_MONGO_URI'] = mongo_uri
+    args = [sys.executable, '-m', 'benchmarks.coldstart', str(first_request_delay if warmup else 0)]
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _child(first_request_delay):
+    from .environment import _use_in_memory_mongo
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'legal_doc_generator.settings'
+    os.environ['LOG_LEVEL'] = 'WARNING'
+    if os.environ.get('BENCH_MONGO_URI'):
+        os.environ['MONGO_URI'] = os.environ['BENCH_MONGO_URI']
+    else:
+        # The stand-in's own import time is not part of the app's cold start.
+        _use_in_memory_mongo()
+
+    timings = {}
+    started = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application  # noqa: F401 (timed)
+    from django.urls import get_resolver
+    import legal_doc_generator.wsgi  # noqa: F401 (boots the app and starts the warm-up)
+    get_resolver().url_patterns
+    timings['startup (WSGI application + URLconf)'] = time.perf_counter() - started
+
+    time.sleep(first_request_delay)
+    from django.test import Client
+    client = Client(HTTP_HOST='localhost')
+    for name, method, path, data in FIRST_REQUESTS:
+        started = time.perf_counter()
+        if data is None:
+            response = getattr(client, method)(path)
+        else:
+            response = getattr(client, method)(path, data, content_type='application/json')
+        timings[f'first {name}'] = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise SystemExit(f'{name} returned {response.status_code}')
+    print(json.dumps(timings))
+
+
+if __name__ == '__main__':
+    _child(float(sys.argv[1]))
@@ -0,0 +1,112 @@
+"""
+Brings up Django against offline stand-ins: an in-memory Mongo double (or a
+local mongod), a fake Cloudinary HTTP server and a fake LLM provider. Must run
+before anything imports Django settings or the generator modules.
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+
+
+class BenchEnvironment:
+    def __init__(self, cloudinary, mongo_uri, workdir):
+        self.cloudinary = cloudinary
+        self.mongo_uri = mongo_uri
+        self.workdir = workdir
+
+    @property
+    def in_memory(self):
+        return self.mongo_uri is None
+
+    def reset_database(self):
+        """Empties the collections the app writes to."""
+        from generator import mongo_client
+        for collection in (
+            mongo_client.conversations_collection,
+            mongo_client.versions_collection,
+            mongo_client.signature_assets_collection,
+            mongo_client.pdf_jobs_collection,
+            mongo_client.version_diffs_collection,
+        ):
+            collection.delete_many({})
+
+
+def fake_document(chars):
+    """A generated lease of about `chars` characters."""
+    from pdf_benchmark import build_document
+
+    sections = 1
+    while len(build_document(sections)) < chars:
+        sections *= 2
+    return build_document(sections)[:chars]
+
+
+def fake_reply(chars):
+    """A model reply carrying a full document, in the format the chat views parse."""
+    return '```json' + json.dumps({'type': 'document', 'text': fake_document(chars)}) + '```'
+
+
+def setup(mongo_uri=None, reset=False, pdf_workers=0, llm_latency=0.0, llm_output_chars=8000, cloudinary_latency=0.0):
+    from .fake_cloudinary import FakeCloudinary
+
+    workdir = tempfile.mkdtemp(prefix='docgen-bench-')
+    cloudinary = FakeCloudinary(latency=cloudinary_latency).start()
+    os.environ.update({
+        'DJANGO_SETTINGS_MODULE': 'legal_doc_generator.settings',
+        'LLM_PROVIDERS': 'fake',
+        'CLOUDINARY_CLOUD_NAME': cloudinary.cloud_name,
+        'CLOUDINARY_API_KEY': 'bench',
+        'CLOUDINARY_API_SECRET': 'bench',
+        'SIGNATURE_ALLOWED_HOSTS': '127.0.0.1',
+        # Fresh caches, so the first request of each kind pays for its render.
+        'PDF_CACHE_DIR': os.path.join(workdir, 'pdf_cache'),
+        'SIGNATURE_CACHE_DIR': os.path.join(workdir, 'signature_cache'),
+        'PDF_RENDER_WORKERS': str(pdf_workers),
+        'PDF_ANALYZE_WORKERS': str(pdf_workers),
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    })
+
+    if mongo_uri:
+        os.environ['MONGO_URI'] = mongo_uri
+    else:
+        _use_in_memory_mongo()
+
+    import django
+    django.setup()
+    # xhtml2pdf warns about unsupported CSS on every render.
+    logging.getLogger('xhtml2pdf').setLevel(logging.ERROR)
+    import cloudinary as cloudinary_sdk
+    cloudinary_sdk.config(upload_prefix=cloudinary.url)
+
+    from generator import llm_providers
+    llm_providers._router = llm_providers.LLMRouter([
+        llm_providers.FakeProvider(name='gemini', reply=fake_reply(llm_output_chars), latency=llm_latency),
+    ])
+
+    environment = BenchEnvironment(cloudinary, mongo_uri, workdir)
+    from generator.mongo_client import conversations_collection
+    if conversations_collection.estimated_document_count() and not reset:
+        sys.exit(f'{mongo_uri} already has conversations; the benchmark empties its database. Pass --reset to allow that.')
+    environment.reset_database()
+    if mongo_uri:
+        from generator.mongo_client import ensure_indexes
+        ensure_indexes()
+    return environment
+
+
+def _use_in_memory_mongo():
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit('The in-memory Mongo double needs mongomock (pip install mongomock); or pass --mongo-uri for a local mongod.')
+    import pymongo
+
+    class InMemoryMongoClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop('tlsCAFile', None)
+            super().__init__(*args, **kwargs)
+
+    pymongo.MongoClient = InMemoryMongoClient
+    os.environ['MONGO_URI'] = 'mongodb://localhost:27017/docgen_bench'
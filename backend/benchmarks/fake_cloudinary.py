@@ -0,0 +1,84 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+
+_PUBLIC_ID_RE = re.compile(rb'name="public_id"\r\n\r\n([^\r]+)')
+
+
+def signature_png(variant=0):
+    """A small signature-sized PNG with some ink on it; each `variant` has different bytes."""
+    image = Image.new('RGBA', (300, 120), (255, 255, 255, 0))
+    for x in range(20, 280):
+        image.putpixel((x, 60 + (x // 10) % 20), (0, 0, 80, 255))
+    image.putpixel((variant % 300, 0), (0, 0, variant // 300 % 256, 255))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class FakeCloudinary:
+    """
+    A local HTTP server answering Cloudinary's upload API and serving the
+    uploaded images back, with a configurable delay per request. Point the
+    Cloudinary SDK at it with `upload_prefix=server.url`.
+    """
+
+    def __init__(self, cloud_name='bench', latency=0.0):
+        self.cloud_name = cloud_name
+        self.latency = latency
+        self.uploads = 0
+        self.image = signature_png()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def image_url(self, public_id):
+        return f'{self.url}/{self.cloud_name}/image/upload/{public_id}.png'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-cloudinary').start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(fake.latency)
+                fake.uploads += 1
+                match = _PUBLIC_ID_RE.search(body)
+                public_id = match.group(1).decode() if match else f'upload-{fake.uploads}'
+                self._send(200, 'application/json', json.dumps({
+                    'public_id': public_id,
+                    'secure_url': fake.image_url(public_id),
+                    'resource_type': 'image',
+                    'format': 'png',
+                    'bytes': len(body),
+                }).encode())
+
+            def do_GET(self):
+                time.sleep(fake.latency)
+                self._send(200, 'image/png', fake.image)
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,74 @@
+"""
+Micro-benchmarks: PDF rendering across document sizes and renderers, and
+get_all_conversations across collection sizes.
+"""
+import time
+import tracemalloc
+
+from pdf_benchmark import build_document
+
+from .environment import fake_document
+from .results import summarize
+
+
+def _timings(func, runs):
+    func()  # warm-up: imports, font loading, caches
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_pdf(sections=(1, 10, 50, 200), runs=5, report=print):
+    """Renders generated leases inline (no pool, no PDF cache) with every renderer."""
+    from generator.pdf_pool import section_html_cache, signature_cache
+    from generator.pdf_renderer import PDF_RENDERERS, render_pdf
+
+    rows = []
+    for count in sections:
+        markdown_content = build_document(count)
+        for renderer in PDF_RENDERERS:
+            def render():
+                return render_pdf(markdown_content, renderer, signature_cache)
+            timings = _timings(render, runs)
+
+            tracemalloc.start()
+            size = len(render())
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append(summarize(
+                'pdf', f'render_pdf {renderer} {count} sections', timings,
+                markdown_kb=round(len(markdown_content) / 1024, 1), pdf_kb=round(size / 1024, 1), peak_heap_mb=round(peak / 2**20, 2),
+            ))
+            report(rows[-1])
+
+        # What the xhtml2pdf path costs when only one section changed since the last render.
+        section_html_cache.clear()
+        section_html_cache.render(markdown_content)
+        edited = markdown_content.replace('Section 1\n', 'Section 1 (amended)\n', 1)
+        timings = _timings(lambda: section_html_cache.render(edited), runs)
+        rows.append(summarize('pdf', f'markdown sections {count} sections, one edited', timings))
+        report(rows[-1])
+    return rows
+
+
+def run_conversations(environment, sizes=(10, 100, 1000), runs=5, report=print):
+    """Times get_all_conversations and the first list_conversations page as the collection grows."""
+    from generator.mongo_client import get_all_conversations, list_conversations, save_conversation
+
+    environment.reset_database()
+    document = fake_document(4000)
+    messages = [{'sender': 'user', 'text': 'I need a lease.'}, {'sender': 'bot', 'text': 'Who are the parties?'}]
+    rows = []
+    seeded = 0
+    for size in sorted(sizes):
+        for number in range(seeded, size):
+            save_conversation(f'Lease {number}', messages, document, uploaded_by='bench')
+        seeded = size
+        rows.append(summarize('conversations', f'get_all_conversations {size} conversations', _timings(get_all_conversations, runs)))
+        report(rows[-1])
+        rows.append(summarize('conversations', f'list_conversations page of 20, {size} conversations', _timings(lambda: list_conversations(20), runs)))
+        report(rows[-1])
+    return rows
@@ -0,0 +1,92 @@
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(suite, name, latencies, elapsed=None, errors=0, concurrency=1, **extra):
+    """One result row: latency percentiles in milliseconds and throughput."""
+    row = {'suite': suite, 'name': name, 'requests': len(latencies) + errors, 'errors': errors, 'concurrency': concurrency}
+    if latencies:
+        row.update({
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        })
+        if elapsed:
+            row['throughput_rps'] = round(len(latencies) / elapsed, 2)
+    row.update(extra)
+    return row
+
+
+def print_row(row):
+    if 'p50_ms' not in row:
+        print(f"{row['suite']:<13} {row['name']:<58} failed ({row['errors']} errors)")
+        return
+    throughput = f"{row['throughput_rps']:>8.1f}/s" if 'throughput_rps' in row else ' ' * 10
+    errors = f"  errors={row['errors']}" if row['errors'] else ''
+    print(
+        f"{row['suite']:<13} {row['name']:<58} p50={row['p50_ms']:>9.1f}ms p95={row['p95_ms']:>9.1f}ms "
+        f"p99={row['p99_ms']:>9.1f}ms {throughput}{errors}"
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def save(rows, directory, options):
+    """Writes a results file named after the time and commit; returns its path."""
+    commit = git_commit()
+    created_at = datetime.now(timezone.utc)
+    path = Path(directory) / f"{created_at:%Y%m%dT%H%M%SZ}{'-' + commit if commit else ''}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'created_at': created_at.isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'options': options,
+        'results': rows,
+    }, indent=2) + '\n')
+    return path
+
+
+def compare(rows, baseline_path, tolerance, noise_ms=1.0):
+    """
+    Prints each result against the same one in a baseline file and returns the
+    names that regressed: p50 or p95 slower by more than `tolerance` (a
+    fraction) and by more than `noise_ms`.
+    """
+    baseline = {(row['suite'], row['name']): row for row in json.loads(Path(baseline_path).read_text())['results']}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for row in rows:
+        before = baseline.get((row['suite'], row['name']))
+        if not before or 'p50_ms' not in before or 'p50_ms' not in row:
+            continue
+        changes = []
+        regressed = False
+        for key in ('p50_ms', 'p95_ms'):
+            ratio = row[key] / before[key] if before[key] else 1.0
+            changes.append(f"{key[:3]} {before[key]:.1f} -> {row[key]:.1f}ms ({ratio - 1:+.0%})")
+            if ratio > 1 + tolerance and row[key] - before[key] > noise_ms:
+                regressed = True
+        if regressed:
+            regressions.append(f"{row['suite']}: {row['name']}")
+        print(f"{'REGRESSED' if regressed else 'ok':<10}{row['suite']:<13} {row['name']:<58} {', '.join(changes)}")
+    return regressions
@@ -0,0 +1,253 @@
+"""
+Load scenarios for every route in generator/urls.py, driven in-process through
+Django's test clients (no sockets besides the fake Cloudinary server). Each
+scenario sends `requests` requests from `concurrency` workers after a short
+warm-up, and reports latency percentiles and throughput.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, Client
+
+from generator.mongo_client import get_conversation_summary, get_document_version_content, save_conversation, update_conversation
+from generator.pdf_renderer import render_pdf
+from generator.version_store import make_delta
+
+from .environment import fake_document
+from .fake_cloudinary import signature_png
+from .results import summarize
+
+
+class Scenario:
+    """
+    One benchmarked request. `route` is the URL pattern it covers (as written
+    in generator/urls.py); `prepare(i)` returns the path and client keyword
+    arguments for the i-th request and runs outside the timed region.
+    """
+
+    def __init__(self, name, route, method, prepare, expect=(200,), serial=False, is_async=False, needs_mongod=False):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.prepare = prepare
+        self.expect = expect
+        # Writes that must see each other's results (e.g. version numbers) run one at a time.
+        self.serial = serial
+        self.is_async = is_async
+        # The in-memory double lacks $text and motor support.
+        self.needs_mongod = needs_mongod or is_async
+
+
+def _messages(count):
+    return [
+        {'sender': 'user' if index % 2 == 0 else 'bot', 'text': f'Message {index}: the rent is due on the first of each month.'}
+        for index in range(count)
+    ]
+
+
+def _json(path, data):
+    return lambda i: (path, {'data': data, 'content_type': 'application/json'})
+
+
+def _get(path):
+    return lambda i: (path, {})
+
+
+def _amend(content, number):
+    """Inserts an amendment clause in the middle of a document."""
+    lines = content.split('\n')
+    middle = len(lines) // 2
+    return '\n'.join(lines[:middle] + [f'Amendment {number}: the notice period is {number + 30} days.', ''] + lines[middle:])
+
+
+def seed(environment, conversations, versions, document_chars):
+    """Creates the conversations the scenarios read and write; returns their ids."""
+    for number in range(conversations):
+        save_conversation(f'Lease {number}', _messages(6), fake_document(2000), uploaded_by='bench')
+
+    document = fake_document(document_chars)
+    document += f"\n\n**Tenant signature:** ![Signature]({environment.cloudinary.image_url('signatures/bench')})\n"
+    # An uploaded lease for the analyzer, laid out by the app's own renderer.
+    fixture = {'document': document, 'pdf': render_pdf(document, 'native')}
+    for key in ('pk', 'put_pk', 'patch_pk', 'chat_pk'):
+        fixture[key] = save_conversation(f'Benchmark lease ({key})', _messages(30), document, uploaded_by='bench')
+    content = document
+    for number in range(1, versions):
+        content = _amend(content, number)
+        update_conversation(fixture['pk'], 'Benchmark lease', [], content, uploaded_by='bench')
+    fixture['latest'] = versions - 1
+    fixture['middle'] = (versions - 1) // 2
+    return fixture
+
+
+def scenarios(fixture):
+    pk, latest, middle = fixture['pk'], fixture['latest'], fixture['middle']
+    document = fixture['document']
+    conversation = f'/api/conversations/{pk}'
+    chat_body = {'messages': [{'sender': 'user', 'text': 'I need a residential lease for a flat in Berlin.'}]}
+    stored_chat_body = {'conversation_id': fixture['chat_pk'], 'message': 'Make the notice period three months.'}
+
+    def chat_with_signature(i):
+        signature = SimpleUploadedFile('signature.png', signature_png(i), content_type='image/png')
+        return '/api/chat/', {'data': {'messages': json.dumps(chat_body['messages']), 'signature': signature}}
+
+    def upload_signature(i):
+        signature = SimpleUploadedFile('signature.png', signature_png(i), content_type='image/png')
+        return '/api/upload-signature/', {'data': {'signature': signature}}
+
+    def analyze_pdf(i):
+        upload = SimpleUploadedFile('lease.pdf', fixture['pdf'], content_type='application/pdf')
+        return '/api/analyze-pdf/', {'data': {'file': upload}}
+
+    def download_new_pdf(i):
+        # A different document every time, so each request renders.
+        return '/api/download-pdf/', {'data': {'document_content': f'{document}\n\nCopy {i}.\n'}, 'content_type': 'application/json'}
+
+    def put_version(i):
+        content = _amend(document, i)
+        body = {'title': 'Benchmark lease (put_pk)', 'new_messages': _messages(2), 'new_document_content': content}
+        return f"/api/conversations/{fixture['put_pk']}/", {'data': body, 'content_type': 'application/json'}
+
+    def patch_version(i):
+        base_version = get_conversation_summary(fixture['patch_pk'])['latest_version']
+        base = get_document_version_content(fixture['patch_pk'], base_version)
+        body = {'new_messages': _messages(2), 'base_version': base_version, 'document_delta': make_delta(base, _amend(base, i))}
+        return f"/api/conversations/{fixture['patch_pk']}/", {'data': body, 'content_type': 'application/json'}
+
+    def delete_conversation(i):
+        doomed = save_conversation(f'Doomed {i}', _messages(4), document, uploaded_by='bench')
+        return f'/api/conversations/{doomed}/', {}
+
+    def create_conversation(i):
+        body = {'title': f'New lease {i}', 'messages': _messages(10), 'initial_document_content': document}
+        return '/api/conversations/', {'data': body, 'content_type': 'application/json'}
+
+    return [
+        Scenario('POST /api/chat/', 'chat/', 'post', _json('/api/chat/', chat_body)),
+        Scenario('POST /api/chat/ (stored conversation)', 'chat/', 'post', _json('/api/chat/', stored_chat_body)),
+        Scenario('POST /api/chat/ (signature upload)', 'chat/', 'post', chat_with_signature),
+        Scenario('POST /api/chat/stream/', 'chat/stream/', 'post', _json('/api/chat/stream/', chat_body)),
+        Scenario('POST /api/download-pdf/ (uncached)', 'download-pdf/', 'post', download_new_pdf),
+        Scenario('POST /api/analyze-pdf/', 'analyze-pdf/', 'post', analyze_pdf),
+        Scenario('POST /api/upload-signature/', 'upload-signature/', 'post', upload_signature, expect=(201,)),
+        Scenario('POST /api/export/ (all versions)', 'export/', 'post', _json('/api/export/', {'conversation_ids': [pk], 'versions': 'all'})),
+        Scenario('GET /api/metrics/', 'metrics/', 'get', _get('/api/metrics/')),
+        Scenario('GET /api/conversations/', 'conversations/', 'get', _get('/api/conversations/')),
+        Scenario('POST /api/conversations/', 'conversations/', 'post', create_conversation, expect=(201,)),
+        Scenario('GET /api/conversations/search/', 'conversations/search/', 'get', _get('/api/conversations/search/?q=tenant+rent'), needs_mongod=True),
+        Scenario('GET /api/conversations/search/?versions=true', 'conversations/search/', 'get', _get('/api/conversations/search/?q=amendment+notice&versions=true'), needs_mongod=True),
+        Scenario('GET /api/conversations/<pk>/', 'conversations/<str:pk>/', 'get', _get(f'{conversation}/')),
+        Scenario('PUT /api/conversations/<pk>/', 'conversations/<str:pk>/', 'put', put_version, serial=True),
+        Scenario('PATCH /api/conversations/<pk>/ (delta)', 'conversations/<str:pk>/', 'patch', patch_version, serial=True),
+        Scenario('DELETE /api/conversations/<pk>/', 'conversations/<str:pk>/', 'delete', delete_conversation, expect=(204,)),
+        Scenario('GET /api/conversations/<pk>/download/', 'conversations/<str:pk>/download/', 'get', _get(f'{conversation}/download/')),
+        Scenario('GET .../versions/<n>/content/', 'conversations/<str:pk>/versions/<int:version_number>/content/', 'get', _get(f'{conversation}/versions/{middle}/content/')),
+        Scenario('GET .../versions/<n>/download/', 'conversations/<str:pk>/versions/<int:version_number>/download/', 'get', _get(f'{conversation}/versions/{middle}/download/')),
+        Scenario('GET .../versions/<a>/diff/<b>/?mode=patch', 'conversations/<str:pk>/versions/<int:version_a>/diff/<int:version_b>/', 'get', _get(f'{conversation}/versions/0/diff/{latest}/?mode=patch')),
+        Scenario('GET .../versions/<a>/diff/<b>/?mode=html', 'conversations/<str:pk>/versions/<int:version_a>/diff/<int:version_b>/', 'get', _get(f'{conversation}/versions/0/diff/{latest}/?mode=html')),
+        Scenario('GET .../versions/<a>/diff/<b>/?mode=pdf', 'conversations/<str:pk>/versions/<int:version_a>/diff/<int:version_b>/', 'get', _get(f'{conversation}/versions/0/diff/{latest}/?mode=pdf')),
+        Scenario('GET /api/conversations/<pk>/preview/', 'conversations/<str:pk>/preview/', 'get', _get(f'{conversation}/preview/')),
+        Scenario('GET .../versions/<n>/preview/', 'conversations/<str:pk>/versions/<int:version_number>/preview/', 'get', _get(f'{conversation}/versions/{middle}/preview/')),
+        Scenario('POST /api/async/chat/', 'async/chat/', 'post', _json('/api/async/chat/', chat_body), is_async=True),
+        Scenario('POST /api/async/chat/stream/', 'async/chat/stream/', 'post', _json('/api/async/chat/stream/', chat_body), is_async=True),
+        Scenario('GET /api/async/conversations/', 'async/conversations/', 'get', _get('/api/async/conversations/'), is_async=True),
+        Scenario('GET /api/async/conversations/<pk>/', 'async/conversations/<str:pk>/', 'get', _get(f'/api/async/conversations/{pk}/'), is_async=True),
+        Scenario('GET /api/async/.../versions/<n>/content/', 'async/conversations/<str:pk>/versions/<int:version_number>/content/', 'get', _get(f'/api/async/conversations/{pk}/versions/{middle}/content/'), is_async=True),
+    ]
+
+
+def run_sync(scenario, requests, concurrency, warmup):
+    counter = itertools.count()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def send(client, i):
+        path, kwargs = scenario.prepare(i)
+        started = time.perf_counter()
+        response = getattr(client, scenario.method)(path, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed
+
+    client = Client(HTTP_HOST='localhost')
+    for _ in range(warmup):
+        send(client, next(counter))
+
+    def worker():
+        client = Client(HTTP_HOST='localhost')
+        while True:
+            i = next(counter) - warmup
+            if i >= requests:
+                return
+            status, elapsed = send(client, i + warmup)
+            with lock:
+                (latencies if status in scenario.expect else errors).append(elapsed)
+
+    workers = 1 if scenario.serial else concurrency
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize('routes', scenario.name, latencies, time.perf_counter() - started, len(errors), workers)
+
+
+async def run_async(scenario, requests, concurrency, warmup):
+    counter = itertools.count()
+    latencies, errors = [], []
+
+    async def send(client, i):
+        path, kwargs = scenario.prepare(i)
+        started = time.perf_counter()
+        response = await getattr(client, scenario.method)(path, **kwargs)
+        if response.streaming:
+            [chunk async for chunk in response.streaming_content]
+        return response.status_code, time.perf_counter() - started
+
+    client = AsyncClient(HTTP_HOST='localhost')
+    for _ in range(warmup):
+        await send(client, next(counter))
+
+    async def worker():
+        client = AsyncClient(HTTP_HOST='localhost')
+        while True:
+            i = next(counter) - warmup
+            if i >= requests:
+                return
+            status, elapsed = await send(client, i + warmup)
+            (latencies if status in scenario.expect else errors).append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize('routes', scenario.name, latencies, time.perf_counter() - started, len(errors), concurrency)
+
+
+def run(environment, requests, concurrency, warmup=2, only=None, conversations=100, versions=10, document_chars=20000, report=print):
+    """Runs every scenario (or those whose name contains `only`) and returns result rows."""
+    if environment.in_memory and concurrency > 1:
+        print('Note: the in-memory Mongo double is not thread-safe; use --mongo-uri for concurrent load numbers.')
+    fixture = seed(environment, conversations, versions, document_chars)
+    selected = [scenario for scenario in scenarios(fixture) if not only or only in scenario.name]
+    if environment.in_memory and any(scenario.needs_mongod for scenario in selected):
+        print('Skipping search and /api/async/ routes: they need a real server (pass --mongo-uri).')
+        selected = [scenario for scenario in selected if not scenario.needs_mongod]
+    rows = []
+    for scenario in selected:
+        if not scenario.is_async:
+            rows.append(run_sync(scenario, requests, concurrency, warmup))
+            report(rows[-1])
+
+    async_scenarios = [scenario for scenario in selected if scenario.is_async]
+    if async_scenarios:
+        async def run_all():
+            for scenario in async_scenarios:
+                rows.append(await run_async(scenario, requests, concurrency, warmup))
+                report(rows[-1])
+        asyncio.run(run_all())
+    return rows
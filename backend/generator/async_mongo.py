@@ -0,0 +1,208 @@
+"""
+Async (motor) twins of the read/append helpers in mongo_client, used by the
+ASGI views in async_views. Query shapes and return values match the sync
+helpers exactly so both paths can serve the same API.
+"""
+import logging
+from datetime import datetime
+
+import certifi
+from bson.objectid import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+from .mongo_client import (
+    CONVERSATION_EXCLUDED_FIELDS, LIST_PROJECTION, VERSION_METADATA_PROJECTION, _latest_version, decode_cursor, encode_cursor,
+)
+from .metrics import timed
+from .version_store import content_hash, rebuild_version
+
+
+logger = logging.getLogger(__name__)
+
+
+_client = None
+
+
+def get_async_db():
+    """Returns the motor database, connecting on first use (motor binds to the running loop lazily)."""
+    global _client
+    mongo_uri = settings.MONGO_URI
+    if not mongo_uri:
+        raise Exception("MONGO_URI is not configured in your environment variables.")
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _client = AsyncIOMotorClient(mongo_uri, tlsCAFile=certifi.where())
+    return _client.get_default_database()
+
+
+def _conversations():
+    return get_async_db()['conversations']
+
+
+def _versions():
+    return get_async_db()['document_versions']
+
+
+@timed('mongo.list_conversations')
+async def list_conversations(limit=20, cursor=None):
+    """Async twin of mongo_client.list_conversations."""
+    query = {}
+    if cursor:
+        updated_at, last_id = decode_cursor(cursor)
+        query = {'$or': [
+            {'updated_at': {'$lt': updated_at}},
+            {'updated_at': updated_at, '_id': {'$lt': last_id}},
+        ]}
+    try:
+        page = await (
+            _conversations().find(query, LIST_PROJECTION)
+            .sort([('updated_at', DESCENDING), ('_id', DESCENDING)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+    except Exception as e:
+        logger.error("Error listing conversations: %s", e)
+        return [], None
+
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    result = []
+    for conv in page[:limit]:
+        conv['_id'] = str(conv['_id'])
+        conv.setdefault('latest_preview', '')
+        conv.setdefault('latest_size', 0)
+        result.append(conv)
+    return result, next_cursor
+
+
+@timed('mongo.get_conversation_by_id')
+async def get_conversation_by_id(conversation_id):
+    """Async twin of mongo_client.get_conversation_by_id."""
+    try:
+        conversation = await _conversations().find_one({'_id': ObjectId(conversation_id)}, CONVERSATION_EXCLUDED_FIELDS)
+        if conversation:
+            conversation['document_versions'] = await list_document_versions(conversation['_id'])
+            conversation['_id'] = str(conversation['_id'])
+        return conversation
+    except Exception as e:
+        logger.error("Error fetching conversation by ID: %s", e)
+        return None
+
+
+@timed('mongo.get_conversation_summary')
+async def get_conversation_summary(conversation_id):
+    """Async twin of mongo_client.get_conversation_summary."""
+    try:
+        summary = await _conversations().find_one({'_id': ObjectId(conversation_id)}, {'title': 1, 'version_count': 1})
+        if summary and 'version_count' not in summary:
+            versions = await list_document_versions(conversation_id)
+            summary['version_count'] = versions[-1]['version_number'] + 1 if versions else 0
+        if summary:
+            summary['latest_version'] = _latest_version(summary)
+        return summary
+    except Exception as e:
+        logger.error("Error fetching conversation summary: %s", e)
+        return None
+
+
+@timed('mongo.list_document_versions')
+async def list_document_versions(conversation_id):
+    """Async twin of mongo_client.list_document_versions."""
+    try:
+        versions = await (
+            _versions().find({'conversation_id': ObjectId(conversation_id)}, VERSION_METADATA_PROJECTION)
+            .sort('version_number', ASCENDING)
+            .to_list(length=None)
+        )
+        if versions:
+            return versions
+        legacy = await _conversations().find_one(
+            {'_id': ObjectId(conversation_id)},
+            {f'document_versions.{field}': 1 for field in ('version_number', 'uploaded_at', 'uploaded_by', 'notes')}
+        )
+        return (legacy or {}).get('document_versions', [])
+    except Exception as e:
+        logger.error("Error listing document versions: %s", e)
+        return []
+
+
+@timed('mongo.get_document_version_content')
+async def get_document_version_content(conversation_id, version_number):
+    """
+    Async twin of mongo_client.get_document_version_content. Records are read
+    newest first and only until the nearest snapshot.
+    """
+    try:
+        cursor = (
+            _versions().find(
+                {'conversation_id': ObjectId(conversation_id), 'version_number': {'$lte': version_number}},
+                {'kind': 1, 'data': 1, 'version_number': 1}
+            )
+            .sort('version_number', DESCENDING)
+            .batch_size(settings.VERSION_SNAPSHOT_INTERVAL)
+        )
+        records = []
+        async for record in cursor:
+            if not records and record['version_number'] != version_number:
+                break
+            records.append(record)
+            if record['kind'] == 'snapshot':
+                break
+        if records:
+            return rebuild_version(records)
+
+        conversation = await _conversations().find_one(
+            {'_id': ObjectId(conversation_id)},
+            {'document_versions': {'$elemMatch': {'version_number': version_number}}}
+        )
+        if conversation and conversation.get('document_versions'):
+            return conversation['document_versions'][0]['content']
+        return None
+    except Exception as e:
+        logger.error("Error retrieving document version content: %s", e)
+        return None
+
+
+@timed('mongo.get_document_version_hash')
+async def get_document_version_hash(conversation_id, version_number):
+    """Async twin of mongo_client.get_document_version_hash."""
+    try:
+        record = await _versions().find_one(
+            {'conversation_id': ObjectId(conversation_id), 'version_number': version_number},
+            {'_id': 0, 'content_hash': 1}
+        )
+        if record:
+            return record['content_hash']
+        content = await get_document_version_content(conversation_id, version_number)
+        return content_hash(content) if content is not None else None
+    except Exception as e:
+        logger.error("Error retrieving document version hash: %s", e)
+        return None
+
+
+@timed('mongo.get_conversation_revision')
+async def get_conversation_revision(conversation_id):
+    """Async twin of mongo_client.get_conversation_revision."""
+    try:
+        return await _conversations().find_one({'_id': ObjectId(conversation_id)}, {'updated_at': 1, 'version_count': 1})
+    except Exception as e:
+        logger.error("Error fetching conversation revision: %s", e)
+        return None
+
+
+@timed('mongo.append_conversation_messages')
+async def append_conversation_messages(conversation_id, new_messages):
+    """Async twin of mongo_client.append_conversation_messages."""
+    try:
+        result = await _conversations().update_one(
+            {'_id': ObjectId(conversation_id)},
+            {
+                '$push': {'messages': {'$each': new_messages}},
+                '$set': {'updated_at': datetime.utcnow()},
+            }
+        )
+        return result.matched_count == 1
+    except Exception as e:
+        logger.error("Error appending conversation messages: %s", e)
+        return False
@@ -0,0 +1,211 @@
+"""
+Async versions of the chat and read-only conversation endpoints, mounted under
+/api/async/. Under ASGI (uvicorn) these never block the event loop on Mongo,
+the LLM or Cloudinary, so a single process can hold hundreds of slow model
+calls open at once. Responses match the sync DRF views in views.py.
+"""
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import async_mongo
+from .chat_requests import (
+    NO_PROVIDER_ERROR, STREAM_OPEN, ChatEventEncoder, ChatRequestError,
+    conversation_messages, latest_version_number, parse_chat_request, turn_messages,
+)
+from .http_caching import conversation_etag, etag_matches, has_conditional_request, not_modified, set_validators, version_etag
+from .llm_providers import get_llm_router
+from .version_store import content_hash
+from .views import (
+    CONVERSATION_PAGE_SIZE, MAX_CONVERSATION_PAGE_SIZE, PATCH_SYSTEM_INSTRUCTION, SYSTEM_INSTRUCTION,
+    _apply_edit_reply, _attach_signature, _parse_model_reply, _start_chat_session,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _request_data(request):
+    """Returns the JSON body, or the form fields for multipart requests."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+async def _uploaded_by(request):
+    user = await request.auser()
+    return user.username if user.is_authenticated else 'anonymous'
+
+
+async def _resolve_chat_messages(request, streaming=False):
+    """Async twin of views._resolve_chat_messages, reading the body itself."""
+    data = _request_data(request)
+    if data is None:
+        raise ChatRequestError('Invalid JSON body')
+    messages, conversation_id, new_message, patch_mode = parse_chat_request(data, streaming)
+    if messages is not None:
+        return messages, None, patch_mode
+
+    conversation = await async_mongo.get_conversation_by_id(conversation_id)
+    if not conversation:
+        raise ChatRequestError('Conversation not found', 404)
+    version_number = latest_version_number(conversation)
+    conversation['latest_document'] = None
+    if version_number is not None:
+        conversation['latest_document'] = await async_mongo.get_document_version_content(conversation_id, version_number)
+    return conversation_messages(conversation, new_message), conversation, patch_mode
+
+
+async def _store_chat_turn(conversation_id, user_message, payload):
+    if not await async_mongo.append_conversation_messages(conversation_id, turn_messages(user_message, payload)):
+        logger.error("Error storing chat turn for conversation %s", conversation_id)
+
+
+@csrf_exempt
+@require_POST
+async def chat(request):
+    """
+    Async variant of views.chat.
+    """
+    if not get_llm_router().providers:
+        return JsonResponse({'error': NO_PROVIDER_ERROR}, status=500)
+
+    try:
+        messages, conversation, patch_mode = await _resolve_chat_messages(request)
+    except ChatRequestError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    user_message = messages[-1]['text']
+
+    try:
+        # Reading and hashing the upload (and the first Cloudinary import) would
+        # block the event loop; the upload itself runs on a worker thread while
+        # the model generates.
+        signature_upload = await asyncio.to_thread(_attach_signature, request, messages)
+
+        system_instruction = PATCH_SYSTEM_INSTRUCTION if patch_mode else SYSTEM_INSTRUCTION
+        chat_session, current_message = _start_chat_session(messages, system_instruction)
+        response = await chat_session.send_message_async(current_message)
+        if signature_upload:
+            await signature_upload.wait_async()
+
+        document_data = _parse_model_reply(response.text)
+        if patch_mode and document_data.get('type') in ('patch', 'document'):
+            # Patching and version writes are rare next to chat turns; reuse the
+            # sync implementation in a worker thread.
+            uploaded_by = await _uploaded_by(request)
+            document_data = await asyncio.to_thread(_apply_edit_reply, chat_session, conversation, document_data, uploaded_by)
+
+        if conversation:
+            await _store_chat_turn(conversation['_id'], user_message, document_data)
+        return JsonResponse(document_data)
+
+    except Exception as e:
+        logger.exception("Error in async chat view: %s", e)
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def _chat_event_stream(model_stream, on_complete=None, signature_upload=None):
+    """Async twin of views._chat_event_stream."""
+    encoder = ChatEventEncoder()
+    yield STREAM_OPEN
+    try:
+        async for chunk in model_stream:
+            for frame in encoder.chunk(chunk):
+                yield frame
+        frames, payload = encoder.end()
+        for frame in frames:
+            yield frame
+        if signature_upload:
+            await signature_upload.wait_async()
+        yield encoder.done(payload)
+        if on_complete:
+            await on_complete(payload)
+    except Exception as e:
+        logger.exception("Error in async chat_stream: %s", e)
+        yield encoder.error(e)
+
+
+@csrf_exempt
+@require_POST
+async def chat_stream(request):
+    """
+    Async variant of views.chat_stream (Server-Sent Events).
+    """
+    if not get_llm_router().providers:
+        return JsonResponse({'error': NO_PROVIDER_ERROR}, status=500)
+
+    try:
+        messages, conversation, _ = await _resolve_chat_messages(request, streaming=True)
+    except ChatRequestError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    user_message = messages[-1]['text']
+
+    try:
+        signature_upload = await asyncio.to_thread(_attach_signature, request, messages)
+        chat_session, current_message = _start_chat_session(messages)
+        model_stream = chat_session.stream_message_async(current_message)
+    except Exception as e:
+        logger.exception("Error in async chat_stream view: %s", e)
+        return JsonResponse({'error': str(e)}, status=500)
+
+    on_complete = None
+    if conversation:
+        on_complete = lambda payload: _store_chat_turn(conversation['_id'], user_message, payload)
+
+    response = StreamingHttpResponse(_chat_event_stream(model_stream, on_complete, signature_upload), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def conversation_list(request):
+    """
+    Async variant of the GET side of views.conversation_list.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', CONVERSATION_PAGE_SIZE)), 1), MAX_CONVERSATION_PAGE_SIZE)
+        conversations, next_cursor = await async_mongo.list_conversations(limit, request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': conversations, 'next_cursor': next_cursor})
+
+
+@require_GET
+async def conversation_detail(request, pk):
+    """
+    Async variant of the GET side of views.conversation_detail.
+    """
+    if has_conditional_request(request):
+        revision = await async_mongo.get_conversation_revision(pk)
+        if revision and etag_matches(request, conversation_etag(revision)):
+            return not_modified(conversation_etag(revision), 'no-cache')
+
+    conversation = await async_mongo.get_conversation_by_id(pk)
+    if conversation:
+        return set_validators(JsonResponse(conversation), conversation_etag(conversation), 'no-cache')
+    return JsonResponse({'error': 'Conversation not found'}, status=404)
+
+
+@require_GET
+async def get_version_content(request, pk, version_number):
+    """
+    Async variant of views.get_version_content.
+    """
+    if has_conditional_request(request):
+        version_hash = await async_mongo.get_document_version_hash(pk, version_number)
+        if version_hash and etag_matches(request, version_etag(version_hash)):
+            return not_modified(version_etag(version_hash), settings.VERSION_CACHE_CONTROL)
+
+    content = await async_mongo.get_document_version_content(pk, version_number)
+    if content is not None:
+        return set_validators(JsonResponse({'content': content}), version_etag(content_hash(content)), settings.VERSION_CACHE_CONTROL)
+    return JsonResponse({'error': 'Version content not found'}, status=404)
@@ -0,0 +1,170 @@
+import json
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .mongo_client import get_conversation_summary, get_document_version_content, list_conversations
+from .pdf_renderer import DEFAULT_PDF_RENDERER
+from .version_store import content_hash
+
+
+MANIFEST_NAME = 'manifest.ndjson'
+
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w\- ]+')
+
+
+def export_items(conversation_ids=None, all_versions=False):
+    """
+    Yields {conversation_id, title, version_number} for every version to export:
+    the latest version of each conversation, or all of them. Without
+    `conversation_ids`, every conversation is exported, newest first.
+    Conversations are looked up lazily, one at a time.
+    """
+    for conversation_id in conversation_ids if conversation_ids is not None else _all_conversation_ids():
+        summary = get_conversation_summary(conversation_id)
+        if not summary or summary.get('latest_version') is None:
+            yield {'conversation_id': conversation_id, 'title': (summary or {}).get('title'), 'version_number': None}
+            continue
+        latest = summary['latest_version']
+        for version_number in range(latest + 1) if all_versions else [latest]:
+            yield {'conversation_id': conversation_id, 'title': summary.get('title'), 'version_number': version_number}
+
+
+def _all_conversation_ids():
+    cursor = None
+    while True:
+        page, cursor = list_conversations(limit=100, cursor=cursor)
+        for conversation in page:
+            yield conversation['_id']
+        if not cursor:
+            return
+
+
+def export_filename(item):
+    title = _UNSAFE_FILENAME_RE.sub('', item.get('title') or 'legal_document').strip()[:80] or 'legal_document'
+    return f"{title} ({str(item['conversation_id'])[-8:]})/v{item['version_number']}.pdf"
+
+
+def render_export(items, pool, cache=None, renderer=DEFAULT_PDF_RENDERER, max_in_flight=4, timeout=None):
+    """
+    Renders export items in parallel and yields (item, pdf_bytes, error) as
+    renders finish, not in input order. At most `max_in_flight` documents are
+    read or rendered at a time, so memory does not grow with the export size.
+    PDFs already in `cache` (e.g. precomputed ones) are not rendered again.
+    A render still running `timeout` seconds after it was started is given up
+    (see PdfRenderPool.abandon) and reported as an error.
+    """
+    in_flight = {}
+    items = iter(items)
+    while True:
+        while len(in_flight) < max_in_flight:
+            item = next(items, None)
+            if item is None:
+                break
+            future, content = _start_render(item, pool, cache, renderer)
+            in_flight[future] = (item, content, _deadline(timeout), False)
+        if not in_flight:
+            return
+
+        deadlines = [deadline for _, _, deadline, _ in in_flight.values() if deadline is not None]
+        wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+        done, _ = wait(in_flight, timeout=wait_for, return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        expired = [future for future, (_, _, deadline, _) in in_flight.items() if future not in done and deadline is not None and deadline <= now]
+        for future in done:
+            item, content, _, retried = in_flight.pop(future)
+            try:
+                data = future.result()
+            except BrokenProcessPool as e:
+                if retried or content is None:
+                    yield item, None, str(e) or 'The PDF render worker died.'
+                    continue
+                # Most likely killed along with another document's hung render.
+                in_flight[pool.submit(content, renderer)] = (item, content, _deadline(timeout), True)
+                continue
+            except Exception as e:
+                yield item, None, str(e)
+                continue
+            if cache is not None and content is not None:
+                cache.store(content, renderer, data)
+            yield item, data, None
+        for future in expired:
+            item, _, _, _ = in_flight.pop(future)
+            pool.abandon(future)
+            yield item, None, f'PDF generation timed out after {timeout} seconds.'
+
+
+def _deadline(timeout):
+    return time.monotonic() + timeout if timeout else None
+
+
+def _start_render(item, pool, cache, renderer):
+    """Returns (future, content); content is None when nothing needs storing afterwards."""
+    future = Future()
+    if item['version_number'] is None:
+        future.set_exception(LookupError('Conversation not found or has no document versions.'))
+        return future, None
+    content = get_document_version_content(item['conversation_id'], item['version_number'])
+    if content is None:
+        future.set_exception(LookupError('Version content not found.'))
+        return future, None
+    item['content_hash'] = content_hash(content)
+    cached = cache.lookup(content, renderer) if cache is not None else None
+    if cached is not None:
+        future.set_result(cached)
+        return future, None
+    return pool.submit(content, renderer), content
+
+
+class _ChunkSink:
+    """A write-only file for zipfile that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+
+def stream_export_zip(results):
+    """
+    Writes (item, pdf_bytes, error) results into a ZIP archive and yields it in
+    chunks as each entry is written; the archive is never held in memory. The
+    last entry, manifest.ndjson, has one JSON line per item, including failed ones.
+    """
+    sink = _ChunkSink()
+    manifest = []
+    # zipfile falls back to data descriptors when the file cannot seek, which
+    # is what allows writing the archive front to back.
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for item, data, error in results:
+            record = {
+                'conversation_id': str(item['conversation_id']),
+                'title': item.get('title'),
+                'version_number': item['version_number'],
+                'content_hash': item.get('content_hash'),
+            }
+            if error is None:
+                record['file'] = export_filename(item)
+                entry = zipfile.ZipInfo(record['file'], date_time=time.localtime()[:6])
+                # PDFs are already compressed.
+                entry.compress_type = zipfile.ZIP_STORED
+                archive.writestr(entry, data)
+            else:
+                record['error'] = error
+            manifest.append(json.dumps(record))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        archive.writestr(MANIFEST_NAME, '\n'.join(manifest) + '\n', compress_type=zipfile.ZIP_DEFLATED)
+    yield sink.drain()
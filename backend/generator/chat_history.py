@@ -0,0 +1,82 @@
+DOCUMENT_CONTEXT_PREFIX = "Here is the legal document we are working on. Please use this as the basis for any updates.\n\n---\n\n"
+DOCUMENT_CONTEXT_ACK = "Okay, I have the document. What changes would you like to make?"
+DOCUMENT_UPDATED_REPLY = "I have updated the document for you. You can review the changes and ask for more updates if needed."
+TRUNCATED_MARKER = "[…] "
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for history budgeting."""
+    return len(text) // 4 + 1
+
+
+def _is_document_message(message):
+    return message.get('type') == 'document_context' or '```json' in (message.get('text') or '')
+
+
+def _summarize_document(text):
+    """Replaces an older, superseded document draft with a one-line placeholder."""
+    title = next((line.lstrip('#').strip() for line in text.splitlines() if line.startswith('#')), '')
+    label = f' "{title}"' if title else ''
+    return f"[Earlier draft of the document{label} omitted ({len(text.split())} words). The latest version is provided at the start of this conversation.]"
+
+
+def _truncate(text, budget_tokens):
+    """The end of `text`, cut to fit `budget_tokens`; empty if even the marker does not fit."""
+    keep = (budget_tokens - 1) * 4 - len(TRUNCATED_MARKER)
+    if keep <= 0:
+        return ''
+    return TRUNCATED_MARKER + text[-keep:]
+
+
+def build_budgeted_history(messages, latest_document, budget_tokens):
+    """
+    Rebuilds the model history for a stored conversation within a token budget.
+
+    The latest document version is always sent verbatim, once, at the start.
+    Older document-bearing turns are collapsed to a placeholder, and the oldest
+    turns are dropped once the budget is spent (the latest one is shortened
+    rather than dropped), so the prompt stays roughly the same size no matter
+    how many edits the conversation has been through.
+    Returns messages in the client format ({'sender', 'text'}).
+    """
+    messages = messages or []
+    if latest_document is None:
+        latest_document = next((m['text'] for m in reversed(messages) if m.get('type') == 'document_context'), None)
+
+    head = []
+    remaining = budget_tokens
+    if latest_document:
+        head = [
+            {'sender': 'user', 'text': f"{DOCUMENT_CONTEXT_PREFIX}{latest_document}"},
+            {'sender': 'bot', 'text': DOCUMENT_CONTEXT_ACK},
+        ]
+        remaining -= estimate_tokens(latest_document)
+
+    tail = []
+    for message in reversed(messages):
+        text = message.get('text') or ''
+        if _is_document_message(message):
+            text = _summarize_document(text)
+        cost = estimate_tokens(text)
+        if cost > remaining and not tail:
+            # The latest turn is what the new message usually answers; keep its end.
+            text = _truncate(text, remaining)
+            if not text:
+                break
+            cost = estimate_tokens(text)
+        if cost > remaining:
+            break
+        remaining -= cost
+        tail.append({'sender': message.get('sender', 'user'), 'text': text})
+
+    return head + tail[::-1]
+
+
+def reply_to_messages(payload):
+    """Converts a chat reply payload into the messages the frontend would store for it."""
+    if payload.get('type') == 'document':
+        return [
+            {'sender': 'bot', 'type': 'document_context', 'text': payload.get('text', '')},
+            {'sender': 'bot', 'type': 'display', 'text': DOCUMENT_UPDATED_REPLY},
+        ]
+    return [{'sender': 'bot', 'type': 'display', 'text': payload.get('text', '')}]
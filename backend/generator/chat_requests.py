@@ -0,0 +1,114 @@
+"""
+Chat request handling shared by the sync views (views.py) and their async
+twins (async_views.py). Everything here is free of I/O; each view module
+only does its own Mongo, LLM and Cloudinary calls around it.
+"""
+import json
+
+from django.conf import settings
+
+from .chat_history import build_budgeted_history, reply_to_messages
+from .streaming import ChatStreamParser, sse_event
+
+
+NO_PROVIDER_ERROR = 'No LLM provider is configured. Set GEMINI_API_KEY (or another provider key) in your .env file.'
+
+STREAM_OPEN = b': stream-open\n\n'
+
+
+class ChatRequestError(Exception):
+    """Raised for chat requests that cannot be served, with the HTTP status to answer."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_chat_request(data, streaming=False):
+    """
+    Validates a chat request body. Returns (messages, conversation_id,
+    new_message, patch_mode); raises ChatRequestError.
+
+    Clients either send the full `messages` array, or a stored `conversation_id`
+    plus the new `message`. In the latter case `messages` is None: the caller
+    loads the conversation and passes it to conversation_messages().
+    """
+    patch_mode = data.get('edit_mode') == 'patch'
+    if patch_mode and streaming:
+        raise ChatRequestError('edit_mode "patch" is not supported when streaming; use the non-streaming chat endpoint.')
+
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        if patch_mode:
+            raise ChatRequestError('edit_mode "patch" requires a conversation_id')
+        messages = data.get('messages', [])
+        if isinstance(messages, str):
+            # Multipart requests (with a signature attached) send the history as a JSON string.
+            try:
+                messages = json.loads(messages) if messages else []
+            except ValueError:
+                raise ChatRequestError('messages must be a JSON array')
+        if not messages:
+            raise ChatRequestError('Messages are required')
+        if not isinstance(messages, list) or not all(isinstance(m, dict) and isinstance(m.get('text'), str) for m in messages):
+            raise ChatRequestError('messages must be a list of message objects with a "text" string')
+        return messages, None, None, patch_mode
+
+    new_message = data.get('message')
+    if not new_message or not isinstance(new_message, str):
+        raise ChatRequestError('Message is required when conversation_id is given')
+    return None, conversation_id, new_message, patch_mode
+
+
+def latest_version_number(conversation):
+    """The number of the conversation's latest document version, or None."""
+    versions = conversation.get('document_versions') or []
+    return versions[-1]['version_number'] if versions else None
+
+
+def conversation_messages(conversation, new_message):
+    """
+    The model history for a stored conversation (with its `latest_document`
+    loaded), trimmed to CHAT_HISTORY_TOKEN_BUDGET, followed by the new message.
+    """
+    messages = build_budgeted_history(conversation.get('messages'), conversation['latest_document'], settings.CHAT_HISTORY_TOKEN_BUDGET)
+    messages.append({'sender': 'user', 'text': new_message})
+    return messages
+
+
+def turn_messages(user_message, payload):
+    """The messages stored for one chat turn: the user's message and the model's reply."""
+    return [{'sender': 'user', 'type': 'display', 'text': user_message}] + reply_to_messages(payload)
+
+
+class ChatEventEncoder:
+    """
+    Turns model stream chunks into Server-Sent Event frames: `question` /
+    `document_start` / `document` events while the model is generating, then a
+    final `done` event carrying the same payload the non-streaming `chat`
+    view returns, or an `error` event. The sync and async streams only differ
+    in how they iterate the model and wait for the signature upload.
+    """
+
+    def __init__(self):
+        self.parser = ChatStreamParser()
+
+    def chunk(self, chunk):
+        """Frames for one model chunk (none for empty chunks)."""
+        text = getattr(chunk, 'text', '')
+        if not text:
+            return []
+        return [sse_event(event, data) for event, data in self.parser.feed(text)]
+
+    def end(self):
+        """Frames for text held back at the end of the stream, and the final payload."""
+        frames = [sse_event(event, data) for event, data in self.parser.flush()]
+        return frames, self.parser.finish()
+
+    @staticmethod
+    def done(payload):
+        return sse_event('done', payload)
+
+    @staticmethod
+    def error(e):
+        return sse_event('error', {'error': str(e)})
@@ -0,0 +1,133 @@
+import re
+
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+
+
+class PatchError(Exception):
+    """Raised when a patch does not apply cleanly to the document."""
+
+
+def _normalize_title(title):
+    title = re.sub(r'[*_`]', '', title)
+    return re.sub(r'\s+', ' ', title).strip().lower()
+
+
+def parse_sections(markdown_content):
+    """
+    Splits a markdown document into heading-delimited sections.
+
+    Returns a list of dicts with the heading `level`, normalized heading `path`
+    (titles of all enclosing headings, outermost first) and the `start`/`end`
+    line span. A section's span includes its subsections.
+    """
+    lines = markdown_content.split('\n')
+    sections = []
+    stack = []
+    in_fence = False
+    for index, line in enumerate(lines):
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else HEADING_RE.match(line)
+        if not match:
+            continue
+        level = len(match.group(1))
+        while stack and stack[-1]['level'] >= level:
+            stack.pop()
+        title = _normalize_title(match.group(2))
+        section = {
+            'level': level,
+            'path': tuple(s['title'] for s in stack) + (title,),
+            'title': title,
+            'start': index,
+        }
+        stack.append(section)
+        sections.append(section)
+
+    for index, section in enumerate(sections):
+        section['end'] = next(
+            (s['start'] for s in sections[index + 1:] if s['level'] <= section['level']),
+            len(lines),
+        )
+    return sections
+
+
+def _replace_section(document, heading_path, text):
+    if isinstance(heading_path, str):
+        heading_path = [heading_path]
+    path = tuple(_normalize_title(part.lstrip('#')) for part in heading_path)
+    if not path:
+        raise PatchError('replace_section requires a non-empty heading path.')
+
+    matches = [s for s in parse_sections(document) if s['path'][-len(path):] == path]
+    if len(matches) != 1:
+        raise PatchError(f'Heading path {list(heading_path)} matched {len(matches)} sections, expected exactly one.')
+
+    section = matches[0]
+    lines = document.split('\n')
+    replacement = text.rstrip('\n').split('\n')
+    # Keep the blank line that separated this section from the next one.
+    if section['end'] < len(lines) and replacement[-1].strip():
+        replacement.append('')
+    return '\n'.join(lines[:section['start']] + replacement + lines[section['end']:])
+
+
+def _replace_text(document, find, replace):
+    if not find:
+        raise PatchError('replace_text requires a non-empty "find" string.')
+    occurrences = document.count(find)
+    if occurrences != 1:
+        raise PatchError(f'Text to replace was found {occurrences} times, expected exactly once.')
+    return document.replace(find, replace, 1)
+
+
+def apply_patches(document, patches):
+    """
+    Applies a list of patch operations to a markdown document, in order.
+
+    Supported operations:
+      {"op": "replace_section", "path": ["Heading", "Sub-heading"], "text": "## Sub-heading\\n..."}
+      {"op": "replace_text", "find": "exact old text", "replace": "new text"}
+
+    Raises PatchError if any operation is ambiguous, does not match, or leaves
+    an obviously broken document behind.
+    """
+    if not isinstance(patches, list) or not patches:
+        raise PatchError('Patch must be a non-empty list of operations.')
+
+    patched = document
+    for patch in patches:
+        if not isinstance(patch, dict):
+            raise PatchError('Each patch operation must be an object.')
+        op = patch.get('op')
+        if op == 'replace_section':
+            path = patch.get('path') or []
+            if not isinstance(patch.get('text'), str):
+                raise PatchError('replace_section requires a "text" string.')
+            if not (isinstance(path, str) or (isinstance(path, list) and all(isinstance(part, str) for part in path))):
+                raise PatchError('replace_section requires a "path" list of heading titles.')
+            patched = _replace_section(patched, path, patch['text'])
+        elif op == 'replace_text':
+            if not isinstance(patch.get('replace'), str):
+                raise PatchError('replace_text requires a "replace" string.')
+            if not isinstance(patch.get('find'), str):
+                raise PatchError('replace_text requires a "find" string.')
+            patched = _replace_text(patched, patch['find'], patch['replace'])
+        else:
+            raise PatchError(f'Unknown patch operation: {op!r}')
+
+    _validate_patched(document, patched)
+    return patched
+
+
+def _validate_patched(original, patched):
+    if not patched.strip():
+        raise PatchError('Patched document is empty.')
+    if '```json' in patched:
+        raise PatchError('Patched document contains a raw JSON block.')
+    original_titles = [s['path'] for s in parse_sections(original) if s['level'] == 1]
+    patched_titles = [s['path'] for s in parse_sections(patched) if s['level'] == 1]
+    if original_titles and not patched_titles:
+        raise PatchError('Patched document lost its title heading.')
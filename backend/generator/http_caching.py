@@ -0,0 +1,68 @@
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import parse_etags
+
+from .pdf_renderer import DEFAULT_PDF_RENDERER, REDLINE_RENDERER, render_fingerprint
+
+
+def version_etag(content_hash):
+    """Strong ETag for a document version's content."""
+    return f'"{content_hash}"'
+
+
+def pdf_etag(content_hash, renderer=DEFAULT_PDF_RENDERER):
+    """Strong ETag for a rendered version; changes with the stylesheet/renderer too."""
+    return f'"{content_hash}-pdf-{render_fingerprint(renderer)[:16]}"'
+
+
+def preview_etag(content_hash):
+    """Strong ETag for a version's HTML preview; changes with the stylesheet too."""
+    return f'"{content_hash}-html-{render_fingerprint()[:16]}"'
+
+
+def diff_etag(old_hash, new_hash, mode):
+    """Strong ETag for a diff between two version contents in the given output mode."""
+    etag = f'{old_hash[:24]}-{new_hash[:24]}-diff-{mode}'
+    if mode != 'patch':
+        etag += f'-{render_fingerprint(REDLINE_RENDERER)[:16]}'
+    return f'"{etag}"'
+
+
+def conversation_etag(conversation):
+    """
+    ETag for a conversation detail response. Every write bumps updated_at (and
+    version writes bump version_count), so these fields identify the revision.
+    """
+    updated_at = conversation.get('updated_at')
+    revision = f"{conversation['_id']}|{updated_at.isoformat() if updated_at else ''}|{conversation.get('version_count')}"
+    return f'"{hashlib.sha256(revision.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def has_conditional_request(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META
+
+
+def etag_matches(request, etag):
+    """
+    True when the client's If-None-Match names `etag`. Compression marks ETags
+    weak, so comparison ignores the W/ prefix (the weak comparison RFC 9110 uses
+    for If-None-Match).
+    """
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in client_etags:
+        return True
+    return etag in [e.removeprefix('W/') for e in client_etags]
+
+
+def not_modified(etag, cache_control):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def set_validators(response, etag, cache_control):
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
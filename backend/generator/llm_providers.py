@@ -0,0 +1,548 @@
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .metrics import span
+
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(Exception):
+    """Raised when every configured provider failed for a request."""
+
+
+class ChatReply:
+    """A model reply (or streamed chunk of one), mirroring the `.text` of Gemini responses."""
+
+    def __init__(self, text, provider=None):
+        self.text = text
+        self.provider = provider
+
+    def __repr__(self):
+        return f"ChatReply(provider={self.provider!r}, chars={len(self.text)})"
+
+
+class ProviderStats:
+    """Rolling latency and error-rate window for a single provider."""
+
+    def __init__(self, window):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def count(self):
+        return len(self._samples)
+
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentile(self, pct):
+        """Latency percentile over successful calls, or None without data."""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+
+class LLMProvider:
+    """
+    Base class for chat-completion backends.
+
+    `contents` is a list of {'role': 'user' | 'model', 'parts': [text]} dicts, the
+    same shape the chat views build for Gemini.
+    """
+
+    name = 'base'
+
+    def __init__(self, stats_window=50):
+        self.stats = ProviderStats(stats_window)
+
+    def complete(self, system_instruction, contents):
+        raise NotImplementedError
+
+    def stream(self, system_instruction, contents):
+        yield self.complete(system_instruction, contents)
+
+    async def acomplete(self, system_instruction, contents):
+        return await asyncio.to_thread(self.complete, system_instruction, contents)
+
+    async def astream(self, system_instruction, contents):
+        yield await self.acomplete(system_instruction, contents)
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google.generativeai; models are built once per system prompt."""
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name, timeout, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+
+        self._genai = genai
+        self._genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.timeout = timeout
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, system_instruction):
+        with self._lock:
+            model = self._models.get(system_instruction)
+            if model is None:
+                model = self._genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+                self._models[system_instruction] = model
+            return model
+
+    def complete(self, system_instruction, contents):
+        response = self._model(system_instruction).generate_content(
+            contents, request_options={'timeout': self.timeout}
+        )
+        return response.text
+
+    def stream(self, system_instruction, contents):
+        response = self._model(system_instruction).generate_content(
+            contents, stream=True, request_options={'timeout': self.timeout}
+        )
+        for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+    async def acomplete(self, system_instruction, contents):
+        response = await self._model(system_instruction).generate_content_async(
+            contents, request_options={'timeout': self.timeout}
+        )
+        return response.text
+
+    async def astream(self, system_instruction, contents):
+        response = await self._model(system_instruction).generate_content_async(
+            contents, stream=True, request_options={'timeout': self.timeout}
+        )
+        async for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any OpenAI-style /chat/completions API (OpenAI, Groq, DeepSeek) over a pooled HTTP session."""
+
+    def __init__(self, name, api_key, base_url, model_name, timeout, **kwargs):
+        super().__init__(**kwargs)
+        import requests
+
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.headers.update({'Authorization': f'Bearer {api_key}'})
+        self._api_key = api_key
+        self._async_client = None
+
+    def _get_async_client(self):
+        # Created lazily so it binds to the running event loop (ASGI only).
+        if self._async_client is None:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(
+                headers={'Authorization': f'Bearer {self._api_key}'},
+                timeout=self.timeout,
+            )
+        return self._async_client
+
+    def _payload(self, system_instruction, contents, stream):
+        messages = [{'role': 'system', 'content': system_instruction}]
+        for content in contents:
+            role = 'user' if content['role'] == 'user' else 'assistant'
+            messages.append({'role': role, 'content': ''.join(content['parts'])})
+        return {'model': self.model_name, 'messages': messages, 'stream': stream}
+
+    def complete(self, system_instruction, contents):
+        response = self._session.post(
+            f'{self.base_url}/chat/completions',
+            json=self._payload(system_instruction, contents, stream=False),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+
+    def stream(self, system_instruction, contents):
+        with self._session.post(
+            f'{self.base_url}/chat/completions',
+            json=self._payload(system_instruction, contents, stream=True),
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data: '):
+                    continue
+                data = line[len('data: '):]
+                if data == '[DONE]':
+                    break
+                text = json.loads(data)['choices'][0]['delta'].get('content')
+                if text:
+                    yield text
+
+    async def acomplete(self, system_instruction, contents):
+        response = await self._get_async_client().post(
+            f'{self.base_url}/chat/completions',
+            json=self._payload(system_instruction, contents, stream=False),
+        )
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+
+    async def astream(self, system_instruction, contents):
+        async with self._get_async_client().stream(
+            'POST',
+            f'{self.base_url}/chat/completions',
+            json=self._payload(system_instruction, contents, stream=True),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data: '):
+                    continue
+                data = line[len('data: '):]
+                if data == '[DONE]':
+                    break
+                text = json.loads(data)['choices'][0]['delta'].get('content')
+                if text:
+                    yield text
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline stand-in for a real model, used for local development and tests.
+
+    `reply` may be a string or a callable taking (system_instruction, contents).
+    `latency` is a fixed delay in seconds (or a callable returning one) and
+    `fail_rate` the probability of raising instead of answering.
+    """
+
+    def __init__(self, name='fake', reply='This is a fake model reply.', latency=0.0, fail_rate=0.0, chunk_size=64, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.reply = reply
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _answer(self, system_instruction, contents):
+        self.calls += 1
+        time.sleep(self.latency() if callable(self.latency) else self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise LLMUnavailable(f'{self.name} failed (simulated)')
+        return self.reply(system_instruction, contents) if callable(self.reply) else self.reply
+
+    def complete(self, system_instruction, contents):
+        return self._answer(system_instruction, contents)
+
+    def stream(self, system_instruction, contents):
+        text = self._answer(system_instruction, contents)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    async def _aanswer(self, system_instruction, contents):
+        self.calls += 1
+        await asyncio.sleep(self.latency() if callable(self.latency) else self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise LLMUnavailable(f'{self.name} failed (simulated)')
+        return self.reply(system_instruction, contents) if callable(self.reply) else self.reply
+
+    async def acomplete(self, system_instruction, contents):
+        return await self._aanswer(system_instruction, contents)
+
+    async def astream(self, system_instruction, contents):
+        text = await self._aanswer(system_instruction, contents)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+
+class LLMRouter:
+    """
+    Routes chat requests across providers.
+
+    Healthy providers (error rate below `max_error_rate` over the rolling window)
+    are preferred, fastest median latency first; providers with no samples yet
+    keep their configured order behind measured ones. Failed calls fail over to
+    the next provider. With `hedge=True`, a second request is sent to the next
+    provider once the first has been outstanding longer than its p95 latency,
+    and whichever answers first wins.
+    """
+
+    def __init__(self, providers, hedge=False, hedge_percentile=95, min_samples=5, max_error_rate=0.5):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.providers) * 4), thread_name_prefix='llm')
+
+    def _is_healthy(self, provider):
+        return provider.stats.count() < self.min_samples or provider.stats.error_rate() < self.max_error_rate
+
+    def ranked_providers(self):
+        def sort_key(item):
+            index, provider = item
+            median = provider.stats.percentile(50)
+            return (not self._is_healthy(provider), median is None, median or 0, index)
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=sort_key)]
+
+    def _submit(self, provider, system_instruction, contents):
+        # The call runs in a copy of the request context so its span is reported with the request.
+        return self._executor.submit(contextvars.copy_context().run, self._call, provider, system_instruction, contents)
+
+    def _call(self, provider, system_instruction, contents):
+        started = time.monotonic()
+        try:
+            with span(f'llm.{provider.name}'):
+                text = provider.complete(system_instruction, contents)
+        except Exception:
+            provider.stats.record(time.monotonic() - started, False)
+            raise
+        provider.stats.record(time.monotonic() - started, True)
+        return ChatReply(text, provider.name)
+
+    def complete(self, system_instruction, contents):
+        """Returns a ChatReply from the first provider to answer successfully."""
+        candidates = self.ranked_providers()
+        if not candidates:
+            raise LLMUnavailable('No LLM provider is configured.')
+
+        primary, backups = candidates[0], iter(candidates[1:])
+        hedge_after = None
+        if self.hedge and primary.stats.count() >= self.min_samples:
+            hedge_after = primary.stats.percentile(self.hedge_percentile)
+
+        pending = {self._submit(primary, system_instruction, contents): primary}
+        errors = []
+        while pending:
+            done, _ = wait(pending, timeout=hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                # The primary is slower than its own p95: send a hedged request.
+                hedge_after = None
+                backup = next(backups, None)
+                if backup:
+                    pending[self._submit(backup, system_instruction, contents)] = backup
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning("LLM provider %s failed: %s", provider.name, e)
+                    errors.append(f'{provider.name}: {e}')
+            if not pending:
+                backup = next(backups, None)
+                if backup:
+                    pending[self._submit(backup, system_instruction, contents)] = backup
+        raise LLMUnavailable('All LLM providers failed: ' + '; '.join(errors))
+
+    def stream(self, system_instruction, contents):
+        """
+        Yields ChatReply chunks from the best provider. Failover only happens
+        before the first chunk; once output has reached the client it cannot be
+        retried elsewhere.
+        """
+        errors = []
+        for provider in self.ranked_providers():
+            started = time.monotonic()
+            yielded = False
+            try:
+                with span(f'llm.{provider.name}'):
+                    for text in provider.stream(system_instruction, contents):
+                        yielded = True
+                        yield ChatReply(text, provider.name)
+            except Exception as e:
+                provider.stats.record(time.monotonic() - started, False)
+                if yielded:
+                    raise
+                logger.warning("LLM provider %s failed: %s", provider.name, e)
+                errors.append(f'{provider.name}: {e}')
+                continue
+            provider.stats.record(time.monotonic() - started, True)
+            return
+        if not errors:
+            raise LLMUnavailable('No LLM provider is configured.')
+        raise LLMUnavailable('All LLM providers failed: ' + '; '.join(errors))
+
+    async def _acall(self, provider, system_instruction, contents):
+        started = time.monotonic()
+        try:
+            with span(f'llm.{provider.name}'):
+                text = await provider.acomplete(system_instruction, contents)
+        except Exception:
+            provider.stats.record(time.monotonic() - started, False)
+            raise
+        provider.stats.record(time.monotonic() - started, True)
+        return ChatReply(text, provider.name)
+
+    async def acomplete(self, system_instruction, contents):
+        """Async twin of complete(); the losing hedged request is cancelled."""
+        candidates = self.ranked_providers()
+        if not candidates:
+            raise LLMUnavailable('No LLM provider is configured.')
+
+        primary, backups = candidates[0], iter(candidates[1:])
+        hedge_after = None
+        if self.hedge and primary.stats.count() >= self.min_samples:
+            hedge_after = primary.stats.percentile(self.hedge_percentile)
+
+        pending = {asyncio.ensure_future(self._acall(primary, system_instruction, contents)): primary}
+        errors = []
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than its own p95: send a hedged request.
+                    hedge_after = None
+                    backup = next(backups, None)
+                    if backup:
+                        pending[asyncio.ensure_future(self._acall(backup, system_instruction, contents))] = backup
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.warning("LLM provider %s failed: %s", provider.name, e)
+                        errors.append(f'{provider.name}: {e}')
+                if not pending:
+                    backup = next(backups, None)
+                    if backup:
+                        pending[asyncio.ensure_future(self._acall(backup, system_instruction, contents))] = backup
+        finally:
+            for task in pending:
+                task.cancel()
+        raise LLMUnavailable('All LLM providers failed: ' + '; '.join(errors))
+
+    async def astream(self, system_instruction, contents):
+        """Async twin of stream(), with the same failover-before-first-chunk rule."""
+        errors = []
+        for provider in self.ranked_providers():
+            started = time.monotonic()
+            yielded = False
+            try:
+                with span(f'llm.{provider.name}'):
+                    async for text in provider.astream(system_instruction, contents):
+                        yielded = True
+                        yield ChatReply(text, provider.name)
+            except Exception as e:
+                provider.stats.record(time.monotonic() - started, False)
+                if yielded:
+                    raise
+                logger.warning("LLM provider %s failed: %s", provider.name, e)
+                errors.append(f'{provider.name}: {e}')
+                continue
+            provider.stats.record(time.monotonic() - started, True)
+            return
+        if not errors:
+            raise LLMUnavailable('No LLM provider is configured.')
+        raise LLMUnavailable('All LLM providers failed: ' + '; '.join(errors))
+
+    def start_chat(self, system_instruction, history=None):
+        return ChatSession(self, system_instruction, history or [])
+
+
+class ChatSession:
+    """Multi-turn chat on top of an LLMRouter, with the same send_message API as Gemini chats."""
+
+    def __init__(self, router, system_instruction, history):
+        self.router = router
+        self.system_instruction = system_instruction
+        self.history = list(history)
+
+    def send_message(self, text, stream=False):
+        contents = self.history + [{'role': 'user', 'parts': [text]}]
+        if stream:
+            return self._stream(contents)
+        reply = self.router.complete(self.system_instruction, contents)
+        self.history = contents + [{'role': 'model', 'parts': [reply.text]}]
+        return reply
+
+    def _stream(self, contents):
+        parts = []
+        for chunk in self.router.stream(self.system_instruction, contents):
+            parts.append(chunk.text)
+            yield chunk
+        self.history = contents + [{'role': 'model', 'parts': [''.join(parts)]}]
+
+    async def send_message_async(self, text):
+        contents = self.history + [{'role': 'user', 'parts': [text]}]
+        reply = await self.router.acomplete(self.system_instruction, contents)
+        self.history = contents + [{'role': 'model', 'parts': [reply.text]}]
+        return reply
+
+    async def stream_message_async(self, text):
+        contents = self.history + [{'role': 'user', 'parts': [text]}]
+        parts = []
+        async for chunk in self.router.astream(self.system_instruction, contents):
+            parts.append(chunk.text)
+            yield chunk
+        self.history = contents + [{'role': 'model', 'parts': [''.join(parts)]}]
+
+
+OPENAI_COMPATIBLE_ENDPOINTS = {
+    'openai': ('OPENAI_API_KEY', 'https://api.openai.com/v1', 'OPENAI_MODEL'),
+    'groq': ('GROQ_API_KEY', 'https://api.groq.com/openai/v1', 'GROQ_MODEL'),
+    'deepseek': ('DEEPSEEK_API_KEY', 'https://api.deepseek.com/v1', 'DEEPSEEK_MODEL'),
+}
+
+
+def build_providers():
+    """Instantiates the providers listed in LLM_PROVIDERS that have an API key configured."""
+    providers = []
+    for name in settings.LLM_PROVIDERS:
+        common = {'stats_window': settings.LLM_STATS_WINDOW}
+        if name == 'gemini':
+            if settings.GEMINI_API_KEY:
+                providers.append(GeminiProvider(settings.GEMINI_API_KEY, settings.GEMINI_MODEL, settings.LLM_REQUEST_TIMEOUT, **common))
+        elif name in OPENAI_COMPATIBLE_ENDPOINTS:
+            key_setting, base_url, model_setting = OPENAI_COMPATIBLE_ENDPOINTS[name]
+            api_key = getattr(settings, key_setting)
+            if api_key:
+                providers.append(OpenAICompatibleProvider(name, api_key, base_url, getattr(settings, model_setting), settings.LLM_REQUEST_TIMEOUT, **common))
+        elif name == 'fake':
+            providers.append(FakeProvider(latency=settings.LLM_FAKE_LATENCY, **common))
+        else:
+            logger.warning("Unknown LLM provider in LLM_PROVIDERS: %s", name)
+    return providers
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router():
+    """Returns the process-wide router, building providers and clients on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter(
+                    build_providers(),
+                    hedge=settings.LLM_HEDGE_REQUESTS,
+                    hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+                )
+    return _router
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from generator.mongo_client import backfill_document_summaries, backfill_version_search_text, ensure_indexes
+
+
+class Command(BaseCommand):
+    help = 'Creates the MongoDB indexes used by the conversation API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill-previews',
+            action='store_true',
+            help='Also store preview/size/search fields on conversations saved before they existed.',
+        )
+        parser.add_argument(
+            '--backfill-search',
+            action='store_true',
+            help='Also store search text on document versions saved before it existed (slow: rebuilds every version).',
+        )
+
+    def handle(self, *args, **options):
+        for name in ensure_indexes():
+            self.stdout.write(f'Ensured index {name}')
+        if options['backfill_previews']:
+            updated = backfill_document_summaries()
+            self.stdout.write(f'Backfilled previews for {updated} conversations')
+        if options['backfill_search']:
+            updated = backfill_version_search_text()
+            self.stdout.write(f'Backfilled search text for {updated} document versions')
+        self.stdout.write(self.style.SUCCESS('MongoDB indexes are up to date.'))
@@ -0,0 +1,59 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Exports conversations as a ZIP of PDFs (plus manifest.ndjson), rendering them in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write, or "-" for stdout.')
+        parser.add_argument('--conversation', action='append', dest='conversation_ids', help='Conversation ID to export (repeatable). Defaults to all conversations.')
+        parser.add_argument('--all-versions', action='store_true', help='Export every version instead of only the latest one.')
+        parser.add_argument('--renderer', default=settings.PDF_RENDERER, help='PDF renderer to use.')
+        parser.add_argument('--processes', type=int, default=settings.PDF_RENDER_WORKERS or 1, help='Number of render processes.')
+
+    def handle(self, *args, **options):
+        from generator.bulk_export import export_items, render_export, stream_export_zip
+        from generator.pdf_cache import PdfCache
+        from generator.pdf_pool import PdfRenderPool, section_html_cache, signature_cache
+        from generator.pdf_renderer import PDF_RENDERERS
+
+        if options['renderer'] not in PDF_RENDERERS:
+            raise CommandError(f"Unknown PDF renderer. Use one of: {', '.join(PDF_RENDERERS)}.")
+        processes = max(options['processes'], 1)
+        pool = PdfRenderPool(
+            max_workers=processes,
+            max_queue=processes,
+            timeout=settings.PDF_RENDER_TIMEOUT,
+            retry_after=settings.PDF_RENDER_RETRY_AFTER,
+            image_cache=signature_cache,
+            section_cache=section_html_cache,
+        )
+        results = render_export(
+            export_items(options['conversation_ids'], all_versions=options['all_versions']),
+            pool,
+            cache=PdfCache(max_memory_bytes=0, directory=settings.PDF_CACHE_DIR),
+            renderer=options['renderer'],
+            max_in_flight=processes * 2,
+        )
+
+        counts = {'exported': 0, 'failed': 0}
+
+        def counted(results):
+            for item, data, error in results:
+                counts['failed' if error else 'exported'] += 1
+                if error:
+                    self.stderr.write(f"Could not export {item['conversation_id']} v{item['version_number']}: {error}")
+                yield item, data, error
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in stream_export_zip(counted(results)):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        # stdout may be the archive itself, so the summary goes to stderr.
+        self.stderr.write(self.style.SUCCESS(f"Exported {counts['exported']} PDFs ({counts['failed']} failed)."))
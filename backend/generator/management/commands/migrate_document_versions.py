@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from generator.mongo_client import ensure_indexes, migrate_embedded_versions
+
+
+class Command(BaseCommand):
+    help = 'Moves document versions embedded in conversations into the delta-compressed version store.'
+
+    def handle(self, *args, **options):
+        ensure_indexes()
+        moved = migrate_embedded_versions()
+        self.stdout.write(self.style.SUCCESS(f'Migrated {moved} document versions.'))
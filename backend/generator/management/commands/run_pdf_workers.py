@@ -0,0 +1,59 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _worker_main(stop):
+    # Spawned processes start from scratch, so Django is set up again here.
+    import django
+    django.setup()
+    from generator.pdf_jobs import work
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop)
+
+
+class Command(BaseCommand):
+    help = 'Runs worker processes that precompute PDFs for newly saved document versions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.PDF_RENDER_WORKERS or 1, help='Number of worker processes.')
+        parser.add_argument('--drain', action='store_true', help='Process the jobs that are due in this process, then exit.')
+
+    def handle(self, *args, **options):
+        if not settings.PDF_CACHE_DIR:
+            raise CommandError('PDF_CACHE_DIR must be set: workers hand rendered PDFs to the web processes through it.')
+
+        if options['drain']:
+            from generator.pdf_jobs import work
+            processed = work(drain=True)
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} PDF jobs.'))
+            return
+
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+
+        def start_worker():
+            worker = context.Process(target=_worker_main, args=(stop,), daemon=True)
+            worker.start()
+            return worker
+
+        workers = [start_worker() for _ in range(options['processes'])]
+        self.stdout.write(f'Started {len(workers)} PDF workers. Press Ctrl+C to stop.')
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            while not stop.is_set():
+                for index, worker in enumerate(workers):
+                    worker.join(timeout=1)
+                    if not worker.is_alive() and not stop.is_set():
+                        # A crashed worker's job is picked up again once its lease expires.
+                        self.stderr.write(f'PDF worker {worker.pid} exited with code {worker.exitcode}; restarting it.')
+                        workers[index] = start_worker()
+        except KeyboardInterrupt:
+            stop.set()
+        self.stdout.write('Stopping PDF workers after their current job...')
+        for worker in workers:
+            worker.join()
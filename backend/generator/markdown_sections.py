@@ -0,0 +1,98 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import markdown
+
+from .metrics import span
+
+
+# ATX headings (what the model writes). Setext headings are left inside their section.
+HEADING_RE = re.compile(r'^ {0,3}#{1,6}(?:[ \t]|$)')
+
+# Constructs whose meaning depends on text in other sections: reference-style link
+# definitions and raw HTML blocks (which python-markdown lets span blank lines).
+_UNSPLITTABLE_RE = re.compile(r'^ {0,3}(?:\[[^\]]+\]:|<[A-Za-z!/])', re.MULTILINE)
+
+
+def split_sections(markdown_content):
+    """
+    Splits markdown into heading-delimited sections: each starts at an ATX
+    heading that follows a blank line (or at the start of the document).
+    Converting the sections one by one and joining the HTML with newlines gives
+    the same HTML as converting the whole document. Documents using constructs
+    that cross section boundaries come back as a single section.
+    """
+    if _UNSPLITTABLE_RE.search(markdown_content):
+        return [markdown_content]
+
+    sections = []
+    current = []
+    previous_blank = True
+    for line in markdown_content.splitlines(keepends=True):
+        # A heading right after a text line could be a lazy continuation
+        # (e.g. of a blockquote), so only split after a blank line.
+        if current and previous_blank and HEADING_RE.match(line):
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+        previous_blank = not line.strip()
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+
+class SectionHtmlCache:
+    """
+    Converts markdown to HTML section by section, caching each section's HTML
+    by content hash in a byte-bounded LRU.
+
+    Consecutive document versions usually differ in a clause or two, so
+    rendering a new version only converts the sections that changed.
+    """
+
+    def __init__(self, max_bytes, extensions=()):
+        self.max_bytes = max_bytes
+        self.extensions = list(extensions)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def render(self, markdown_content):
+        """Returns the HTML body for `markdown_content`."""
+        with span('markdown.convert'):
+            return self._render(markdown_content)
+
+    def _render(self, markdown_content):
+        parts = []
+        for section in split_sections(markdown_content):
+            key = hashlib.sha256(section.encode('utf-8')).hexdigest()
+            with self._lock:
+                html = self._entries.get(key)
+                if html is not None:
+                    self._entries.move_to_end(key)
+            if html is None:
+                html = markdown.markdown(section, extensions=self.extensions)
+                self._put(key, html)
+            if html:
+                parts.append(html)
+        return '\n'.join(parts)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, html):
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = html
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
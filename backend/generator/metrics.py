@@ -0,0 +1,106 @@
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, REGISTRY, generate_latest
+
+
+# Latency buckets in seconds, from a cached Mongo read up to a long LLM call.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+stage_duration = Histogram(
+    'docgen_stage_duration_seconds',
+    'Time spent in one stage of request handling (LLM call, Mongo operation, PDF render, ...).',
+    ['stage'],
+    buckets=BUCKETS,
+)
+request_duration = Histogram(
+    'docgen_request_duration_seconds',
+    'Time to produce a response, by route pattern (not including streamed bodies).',
+    ['method', 'route', 'status'],
+    buckets=BUCKETS,
+)
+
+# Spans recorded while handling the current request, as [stage, seconds] pairs.
+# None outside a request (management commands, render processes), where spans
+# only feed the histograms.
+_request_spans = ContextVar('docgen_request_spans', default=None)
+
+
+def start_request():
+    """Starts collecting spans for the current request; returns a token for end_request()."""
+    return _request_spans.set([])
+
+
+def end_request(token):
+    """Stops collecting spans and returns the ones recorded since start_request()."""
+    spans = _request_spans.get()
+    _request_spans.reset(token)
+    return spans or []
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.labels(stage).observe(elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def timed(stage):
+    """Decorator version of span(), for plain and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(spans, total=None):
+    """
+    Formats spans as a Server-Timing header value. Repeated stages are summed
+    into one entry whose description gives the number of calls.
+    """
+    totals = {}
+    for stage, elapsed in spans:
+        seconds, count = totals.get(stage, (0.0, 0))
+        totals[stage] = (seconds + elapsed, count + 1)
+
+    entries = []
+    for stage, (seconds, count) in totals.items():
+        entry = f'{stage};dur={seconds * 1000:.1f}'
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def exposition():
+    """Returns (body, content_type) for the metrics endpoint."""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Several server processes (e.g. gunicorn workers): merge their samples.
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
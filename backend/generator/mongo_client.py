@@ -1,136 +1,444 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson.objectid import ObjectId
 from django.conf import settings
+import base64
+import html
+from itertools import chain
 import certifi
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
+import logging
+import threading
+
+from .metrics import timed
+from .search import highlight, highlight_pattern, make_snippets, searchable_text, version_search_text
+from .version_store import content_hash, encode_version, rebuild_version
+
+
+logger = logging.getLogger(__name__)
+
+
+_db = None
+_db_lock = threading.Lock()
 
 
 def get_db():
-    mongo_uri = settings.MONGO_URI
-    if not mongo_uri:
-        raise Exception("MONGO_URI is not configured in your environment variables.")
-    client = MongoClient(mongo_uri, tlsCAFile=certifi.where())
-    db = client.get_default_database() # The database name is part of the connection string
-    return db
+    """
+    Returns the database, creating the client on first use. Importing this
+    module (e.g. for collectstatic or a cold-starting server) opens no connection.
+    """
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                mongo_uri = settings.MONGO_URI
+                if not mongo_uri:
+                    raise Exception("MONGO_URI is not configured in your environment variables.")
+                client = MongoClient(mongo_uri, tlsCAFile=certifi.where())
+                _db = client.get_default_database() # The database name is part of the connection string
+    return _db
+
+
+class LazyCollection:
+    """Stands in for a pymongo Collection and resolves it (connecting if needed) on first use."""
+
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = get_db()[self._name]
+        return getattr(self._collection, attr)
+
+
+conversations_collection = LazyCollection('conversations')
+versions_collection = LazyCollection('document_versions')
+# Uploaded signature images keyed by the sha256 of their bytes.
+signature_assets_collection = LazyCollection('signature_assets')
+# Durable queue of background PDF renders, one job per document version.
+pdf_jobs_collection = LazyCollection('pdf_jobs')
+# Computed diffs between two version contents, keyed by both content hashes.
+version_diffs_collection = LazyCollection('version_diffs')
+
+PREVIEW_LENGTH = 300
+
+LIST_PROJECTION = {'title': 1, 'created_at': 1, 'updated_at': 1, 'latest_preview': 1, 'latest_size': 1}
+
+
+# Left out of every read that returns a whole conversation document.
+CONVERSATION_EXCLUDED_FIELDS = {'document_versions': 0, 'search_text': 0}
 
-db = get_db()
-conversations_collection = db['conversations']
+def _document_summary(content):
+    """Preview and search fields stored alongside a conversation whenever a document version is written."""
+    return {
+        'latest_preview': ' '.join(content[:PREVIEW_LENGTH * 2].split())[:PREVIEW_LENGTH],
+        'latest_size': len(content),
+        'search_text': searchable_text(content),
+    }
+
+def encode_cursor(conversation):
+    """Opaque keyset cursor pointing just after `conversation` in (updated_at, _id) order."""
+    payload = json.dumps({'u': conversation['updated_at'].isoformat(), 'i': str(conversation['_id'])})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(payload['u']), ObjectId(payload['i'])
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+def ensure_indexes():
+    """Creates the indexes the conversation queries rely on. Safe to run repeatedly."""
+    return [
+        conversations_collection.create_index([('updated_at', DESCENDING), ('_id', DESCENDING)], name='updated_at_id'),
+        versions_collection.create_index([('conversation_id', ASCENDING), ('version_number', DESCENDING)], name='conversation_version', unique=True),
+        pdf_jobs_collection.create_index([('conversation_id', ASCENDING), ('version_number', ASCENDING)], name='job_conversation_version', unique=True),
+        pdf_jobs_collection.create_index([('status', ASCENDING), ('run_after', ASCENDING)], name='job_status_run_after'),
+        pdf_jobs_collection.create_index([('status', ASCENDING), ('locked_until', ASCENDING)], name='job_status_locked_until'),
+        # Finished jobs are only kept for inspection.
+        pdf_jobs_collection.create_index('finished_at', name='job_finished_ttl', expireAfterSeconds=7 * 24 * 3600),
+        # Diffs can always be recomputed, so unused ones are allowed to expire.
+        version_diffs_collection.create_index('created_at', name='diff_created_ttl', expireAfterSeconds=30 * 24 * 3600),
+        # Full-text search; a collection can only have one text index.
+        conversations_collection.create_index(
+            [('title', TEXT), ('search_text', TEXT)], name='conversation_text',
+            weights={'title': 10, 'search_text': 1}, default_language=settings.SEARCH_LANGUAGE,
+        ),
+        versions_collection.create_index([('search_text', TEXT)], name='version_text', default_language=settings.SEARCH_LANGUAGE),
+    ]
 
+@timed('mongo.list_conversations')
+def list_conversations(limit=20, cursor=None):
+    """
+    Returns one page of conversations, newest first, without any document bodies.
+    The result is (conversations, next_cursor); next_cursor is None on the last page.
+    """
+    query = {}
+    if cursor:
+        updated_at, last_id = decode_cursor(cursor)
+        query = {'$or': [
+            {'updated_at': {'$lt': updated_at}},
+            {'updated_at': updated_at, '_id': {'$lt': last_id}},
+        ]}
+    try:
+        page = list(
+            conversations_collection.find(query, LIST_PROJECTION)
+            .sort([('updated_at', DESCENDING), ('_id', DESCENDING)])
+            .limit(limit + 1)
+        )
+    except Exception as e:
+        logger.error("Error listing conversations: %s", e)
+        return [], None
+
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    result = []
+    for conv in page[:limit]:
+        conv['_id'] = str(conv['_id'])
+        conv.setdefault('latest_preview', '')
+        conv.setdefault('latest_size', 0)
+        result.append(conv)
+    return result, next_cursor
+
+def backfill_document_summaries():
+    """Stores preview and search fields on conversations written before they existed. Returns the count updated."""
+    updated = 0
+    cursor = conversations_collection.find(
+        {'$or': [{'latest_preview': {'$exists': False}}, {'search_text': {'$exists': False}}]},
+        {'version_count': 1},
+    )
+    for conv in cursor:
+        content = ''
+        if _latest_version(conv) is not None:
+            content = get_document_version_content(conv['_id'], _latest_version(conv)) or ''
+        conversations_collection.update_one({'_id': conv['_id']}, {'$set': _document_summary(content)})
+        updated += 1
+    return updated
+
+def backfill_version_search_text():
+    """Stores search text on document versions written before it existed. Returns the count updated."""
+    updated = 0
+    for conversation_id in versions_collection.distinct('conversation_id', {'search_text': {'$exists': False}}):
+        missing = versions_collection.find(
+            {'conversation_id': conversation_id, 'search_text': {'$exists': False}}, {'version_number': 1}
+        ).sort('version_number', ASCENDING)
+        for version in missing:
+            number = version['version_number']
+            content = get_document_version_content(conversation_id, number)
+            previous_content = get_document_version_content(conversation_id, number - 1) if number > 0 else None
+            if content is None:
+                continue
+            versions_collection.update_one({'_id': version['_id']}, {'$set': {'search_text': version_search_text(content, previous_content)}})
+            updated += 1
+    return updated
+
+@timed('mongo.get_all_conversations')
 def get_all_conversations():
     """Fetches all conversations, returning the id, title, created_at, and the latest document content."""
     try:
-        conversations = conversations_collection.find({}, {'title': 1, 'created_at': 1, 'document_versions': 1})
+        conversations = conversations_collection.find({}, {'title': 1, 'created_at': 1, 'version_count': 1})
         # Convert ObjectId to string for JSON serialization and get latest document
         result = []
         for conv in conversations:
+            conv['latest_document'] = ''
+            if _latest_version(conv) is not None:
+                conv['latest_document'] = get_document_version_content(conv['_id'], _latest_version(conv)) or ''
             conv['_id'] = str(conv['_id'])
-            if 'document_versions' in conv and conv['document_versions']:
-                conv['latest_document'] = conv['document_versions'][-1]['content']
-            else:
-                conv['latest_document'] = ''
             result.append(conv)
         return result
     except Exception as e:
-        print(f"Error fetching all conversations: {e}")
+        logger.error("Error fetching all conversations: %s", e)
         return []
 
+@timed('mongo.get_conversation_by_id')
 def get_conversation_by_id(conversation_id):
-    """Fetches a single conversation by its ID."""
+    """
+    Fetches a single conversation by its ID. `document_versions` lists version
+    metadata only; use get_document_version_content for a version's text.
+    """
     try:
-        conversation = conversations_collection.find_one({'_id': ObjectId(conversation_id)})
+        conversation = conversations_collection.find_one({'_id': ObjectId(conversation_id)}, CONVERSATION_EXCLUDED_FIELDS)
         if conversation:
+            conversation['document_versions'] = list_document_versions(conversation['_id'])
             conversation['_id'] = str(conversation['_id'])
         return conversation
     except Exception as e:
-        print(f"Error fetching conversation by ID: {e}")
+        logger.error("Error fetching conversation by ID: %s", e)
         return None
 
+def _latest_version(conversation):
+    count = conversation.get('version_count')
+    return count - 1 if count else None
+
+@timed('mongo.get_conversation_summary')
+def get_conversation_summary(conversation_id):
+    """Fetches only the title and latest version number of a conversation."""
+    try:
+        summary = conversations_collection.find_one({'_id': ObjectId(conversation_id)}, {'title': 1, 'version_count': 1})
+        if summary and 'version_count' not in summary:
+            # Conversations saved before the version store keep versions embedded.
+            versions = list_document_versions(conversation_id)
+            summary['version_count'] = versions[-1]['version_number'] + 1 if versions else 0
+        if summary:
+            summary['latest_version'] = _latest_version(summary)
+        return summary
+    except Exception as e:
+        logger.error("Error fetching conversation summary: %s", e)
+        return None
+
+def _store_document_version(conversation_id, version_number, content, uploaded_at, uploaded_by, notes, previous_content=None):
+    """
+    Writes one version record, as a delta against its predecessor where possible.
+    The predecessor's content is read back unless the caller already has it.
+    """
+    if previous_content is None and version_number > 0:
+        previous_content = get_document_version_content(conversation_id, version_number - 1)
+    record = {
+        'conversation_id': ObjectId(conversation_id),
+        'version_number': version_number,
+        'uploaded_at': uploaded_at,
+        'uploaded_by': uploaded_by,
+        'notes': notes,
+        **encode_version(content, version_number, previous_content, settings.VERSION_SNAPSHOT_INTERVAL),
+        'search_text': version_search_text(content, previous_content),
+    }
+    versions_collection.insert_one(record)
+
+@timed('mongo.save_conversation')
 def save_conversation(title, messages, initial_document_content=None, uploaded_by=None, notes=None):
     """Saves a new conversation to the database, creating the first document version."""
     current_time = datetime.utcnow()
-    document_versions = []
-    if initial_document_content is not None:
-        document_versions.append({
-            'version_number': 0, # Initial version is 0
-            'content': initial_document_content,
-            'uploaded_at': current_time,
-            'uploaded_by': uploaded_by,
-            'notes': notes or 'Initial Document',
-        })
-
     try:
         conversation_doc = {
             'title': title,
             'messages': messages,
-            'document_versions': document_versions,
+            # Number of versions allocated so far, i.e. the next version number.
+            'version_count': 1 if initial_document_content is not None else 0,
             'created_at': current_time,
             'updated_at': current_time,
+            **_document_summary(initial_document_content or ''),
         }
         result = conversations_collection.insert_one(conversation_doc)
-        print(f"[DEBUG] New conversation saved with ID: {result.inserted_id}")
-        if document_versions:
-            print(f"[DEBUG] Initial version (0) content length: {len(document_versions[0]['content'])}")
+        logger.debug("New conversation saved with ID: %s", result.inserted_id)
+        if initial_document_content is not None:
+            # Initial version is 0
+            _store_document_version(result.inserted_id, 0, initial_document_content, current_time, uploaded_by, notes or 'Initial Document')
+            if settings.PDF_PRECOMPUTE:
+                enqueue_pdf_render(result.inserted_id, 0)
+            logger.debug("Initial version (0) content length: %d", len(initial_document_content))
         return str(result.inserted_id)
     except Exception as e:
-        print(f"Error saving conversation: {e}")
+        logger.error("Error saving conversation: %s", e)
         return None
 
-def update_conversation(conversation_id, title, messages, new_document_content=None, uploaded_by=None, notes=None):
-    """Updates an existing conversation, appending a new document version."""
+class VersionConflict(Exception):
+    """Raised when a save names a base version that is no longer the latest one."""
+
+    def __init__(self, latest_version):
+        super().__init__(f'The document has changed; the latest version is {latest_version}.')
+        self.latest_version = latest_version
+
+
+@timed('mongo.update_conversation')
+def update_conversation(conversation_id, title, new_messages=None, new_document_content=None, uploaded_by=None, notes=None, messages=None, base_version=None, base_content=None):
+    """
+    Updates an existing conversation, appending new messages and a new document version.
+
+    The version number is allocated atomically by incrementing the conversation's
+    version_count in the same find_one_and_update that applies the other changes,
+    so concurrent saves never get the same number and no prior read is needed.
+    `new_messages` are appended with $push/$each; `messages` (full replacement)
+    is only kept for older clients. Passing None leaves a field untouched.
+
+    With `base_version`, the update only applies while that is still the latest
+    version, otherwise VersionConflict is raised and nothing is written.
+    `base_content` (the base version's content) saves re-reading it to store
+    the new version as a delta.
+    Returns True on success, False on error.
+    """
     current_time = datetime.utcnow()
     update_doc = {
         '$set': {
-            'title': title,
-            'messages': messages,
             'updated_at': current_time,
         }
     }
+    if title is not None:
+        update_doc['$set']['title'] = title
+    if messages is not None:
+        update_doc['$set']['messages'] = messages
+    elif new_messages:
+        update_doc['$push'] = {'messages': {'$each': new_messages}}
+    if new_document_content is not None:
+        update_doc['$inc'] = {'version_count': 1}
+        update_doc['$set'].update(_document_summary(new_document_content))
 
-    existing_conv = get_conversation_by_id(conversation_id)
-    print(f"[DEBUG] update_conversation called for ID: {conversation_id}")
-    print(f"[DEBUG] Existing conversation found: {bool(existing_conv)}")
-
-    if existing_conv:
-        # Determine the next version number
-        next_version_number = 0
-        if 'document_versions' in existing_conv and existing_conv['document_versions']:
-            next_version_number = max(v['version_number'] for v in existing_conv['document_versions']) + 1
-        print(f"[DEBUG] Next version number: {next_version_number}")
-        
-        # Append the new document content as a new version
-        if new_document_content is not None:
-            new_version_entry = {
-                'version_number': next_version_number,
-                'content': new_document_content,
-                'uploaded_at': current_time,
-                'uploaded_by': uploaded_by,
-                'notes': notes or f'Version {next_version_number} update',
-            }
-            update_doc['$push'] = {'document_versions': new_version_entry}
-            print(f"[DEBUG] Pushing new version entry: Version {new_version_entry['version_number']}, Content length: {len(new_version_entry['content'])}")
-        else:
-            print("[DEBUG] new_document_content is None, not pushing new version.")
+    query = {'_id': ObjectId(conversation_id)}
+    if base_version is not None:
+        query['version_count'] = base_version + 1
+    elif new_document_content is not None:
+        # Conversations saved before the version store have no counter yet; see below.
+        query['version_count'] = {'$exists': True}
 
     try:
-        result = conversations_collection.update_one({'_id': ObjectId(conversation_id)}, update_doc)
-        print(f"[DEBUG] MongoDB update result: Matched {result.matched_count}, Modified {result.modified_count}")
+        updated = conversations_collection.find_one_and_update(
+            query,
+            update_doc,
+            projection={'version_count': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not updated and new_document_content is not None:
+            legacy = conversations_collection.find_one({'_id': ObjectId(conversation_id), 'version_count': {'$exists': False}}, {'document_versions': 1})
+            if legacy:
+                # Numbering new versions from a missing counter would collide with
+                # the embedded ones, so move those into the version store first.
+                _migrate_conversation(legacy)
+                updated = conversations_collection.find_one_and_update(
+                    query, update_doc, projection={'version_count': 1}, return_document=ReturnDocument.AFTER,
+                )
+        if not updated:
+            current = conversations_collection.find_one({'_id': ObjectId(conversation_id)}, {'version_count': 1}) if base_version is not None else None
+            if current:
+                raise VersionConflict(_latest_version(current))
+            logger.error("Error updating conversation: %s not found", conversation_id)
+            return False
+        if new_document_content is not None:
+            version_number = updated['version_count'] - 1
+            try:
+                _store_document_version(
+                    conversation_id, version_number, new_document_content, current_time, uploaded_by,
+                    notes or f'Version {version_number} update',
+                    previous_content=base_content if base_version == version_number - 1 else None,
+                )
+            except Exception:
+                # Give the number back unless a later save has taken the next one; then
+                # the gap stays, which reads tolerate (the next version is stored in full).
+                conversations_collection.update_one(
+                    {'_id': ObjectId(conversation_id), 'version_count': version_number + 1},
+                    {'$inc': {'version_count': -1}},
+                )
+                raise
+            if settings.PDF_PRECOMPUTE:
+                enqueue_pdf_render(conversation_id, version_number)
         return True
+    except VersionConflict:
+        raise
+    except Exception as e:
+        logger.error("Error updating conversation: %s", e)
+        return False
+
+@timed('mongo.append_conversation_messages')
+def append_conversation_messages(conversation_id, new_messages):
+    """Appends messages to a conversation without rewriting the existing ones."""
+    try:
+        result = conversations_collection.update_one(
+            {'_id': ObjectId(conversation_id)},
+            {
+                '$push': {'messages': {'$each': new_messages}},
+                '$set': {'updated_at': datetime.utcnow()},
+            }
+        )
+        return result.matched_count == 1
     except Exception as e:
-        print(f"Error updating conversation: {e}")
+        logger.error("Error appending conversation messages: %s", e)
         return False
 
+@timed('mongo.delete_conversation')
 def delete_conversation(conversation_id):
-    """Deletes a conversation from the database."""
+    """Deletes a conversation and its document versions from the database."""
     try:
         conversations_collection.delete_one({'_id': ObjectId(conversation_id)})
+        versions_collection.delete_many({'conversation_id': ObjectId(conversation_id)})
+        pdf_jobs_collection.delete_many({'conversation_id': ObjectId(conversation_id)})
         return True
     except Exception as e:
-        print(f"Error deleting conversation: {e}")
+        logger.error("Error deleting conversation: %s", e)
         return False
 
+VERSION_METADATA_PROJECTION = {'_id': 0, 'version_number': 1, 'uploaded_at': 1, 'uploaded_by': 1, 'notes': 1, 'size': 1, 'content_hash': 1}
+
+@timed('mongo.list_document_versions')
+def list_document_versions(conversation_id):
+    """Lists version metadata (no content) for a conversation, oldest first."""
+    try:
+        versions = list(
+            versions_collection.find({'conversation_id': ObjectId(conversation_id)}, VERSION_METADATA_PROJECTION)
+            .sort('version_number', ASCENDING)
+        )
+        if versions:
+            return versions
+        # Conversations saved before the version store keep versions embedded.
+        legacy = conversations_collection.find_one(
+            {'_id': ObjectId(conversation_id)},
+            {f'document_versions.{field}': 1 for field in ('version_number', 'uploaded_at', 'uploaded_by', 'notes')}
+        )
+        return (legacy or {}).get('document_versions', [])
+    except Exception as e:
+        logger.error("Error listing document versions: %s", e)
+        return []
+
+@timed('mongo.get_document_version_content')
 def get_document_version_content(conversation_id, version_number):
-    """Retrieves the content of a specific document version from a conversation."""
+    """
+    Retrieves the content of a specific document version from a conversation.
+    Only the records from the nearest snapshot up to the requested version are read.
+    """
     try:
+        records = (
+            versions_collection.find(
+                {'conversation_id': ObjectId(conversation_id), 'version_number': {'$lte': version_number}},
+                {'kind': 1, 'data': 1, 'version_number': 1}
+            )
+            .sort('version_number', DESCENDING)
+            .batch_size(settings.VERSION_SNAPSHOT_INTERVAL)
+        )
+        first = next(records, None)
+        if first is not None and first['version_number'] == version_number:
+            return rebuild_version(chain([first], records))
+
+        # Conversations saved before the version store keep versions embedded.
         conversation = conversations_collection.find_one(
             {'_id': ObjectId(conversation_id)},
             {'document_versions': {'$elemMatch': {'version_number': version_number}}}
@@ -139,5 +447,281 @@ def get_document_version_content(conversation_id, version_number):
             return conversation['document_versions'][0]['content']
         return None
     except Exception as e:
-        print(f"Error retrieving document version content: {e}")
+        logger.error("Error retrieving document version content: %s", e)
+        return None
+
+@timed('mongo.get_document_version_hash')
+def get_document_version_hash(conversation_id, version_number):
+    """
+    Returns the content hash of a version without reading or rebuilding its
+    content, so conditional requests can be answered from metadata alone.
+    """
+    try:
+        record = versions_collection.find_one(
+            {'conversation_id': ObjectId(conversation_id), 'version_number': version_number},
+            {'_id': 0, 'content_hash': 1}
+        )
+        if record:
+            return record['content_hash']
+        # Legacy embedded versions carry no hash; derive it from the content.
+        content = get_document_version_content(conversation_id, version_number)
+        return content_hash(content) if content is not None else None
+    except Exception as e:
+        logger.error("Error retrieving document version hash: %s", e)
+        return None
+
+SEARCH_RESULT_PROJECTION = {'score': {'$meta': 'textScore'}, 'title': 1, 'created_at': 1, 'updated_at': 1, 'version_count': 1}
+
+# Matches only in earlier versions count for half as much as matches in the latest one.
+EARLIER_VERSION_WEIGHT = 0.5
+
+# Versions per conversation that get a snippet.
+MAX_VERSION_SNIPPETS = 3
+
+@timed('mongo.search_conversations')
+def search_conversations(query, limit=20, offset=0, include_versions=False):
+    """
+    Ranked full-text search over conversation titles and latest document
+    content, and with `include_versions` also over the text each earlier
+    version added. Returns (results, has_more); each result carries
+    highlighted HTML snippets instead of the documents themselves.
+
+    Ranking across both indexes is done on the top offset + limit + 1 hits
+    of each, so deep pages are approximate.
+    """
+    try:
+        window = offset + limit + 1
+        scores, conversations = {}, {}
+        for conv in (
+            conversations_collection.find({'$text': {'$search': query}}, SEARCH_RESULT_PROJECTION)
+            .sort([('score', {'$meta': 'textScore'})])
+            .limit(window)
+        ):
+            scores[conv['_id']] = conv['score']
+            conversations[conv['_id']] = conv
+
+        version_hits = {}
+        if include_versions:
+            for hit in versions_collection.aggregate([
+                {'$match': {'$text': {'$search': query}}},
+                {'$sort': {'score': {'$meta': 'textScore'}}},
+                {'$group': {'_id': '$conversation_id', 'score': {'$max': {'$meta': 'textScore'}}, 'versions': {'$push': '$version_number'}}},
+                {'$sort': {'score': DESCENDING}},
+                {'$limit': window},
+            ]):
+                version_hits[hit['_id']] = hit['versions'][:MAX_VERSION_SNIPPETS]
+                scores[hit['_id']] = scores.get(hit['_id'], 0) + hit['score'] * EARLIER_VERSION_WEIGHT
+
+        ranked = sorted(scores, key=lambda conversation_id: (-scores[conversation_id], str(conversation_id)))
+        page = ranked[offset:offset + limit]
+        missing = [conversation_id for conversation_id in page if conversation_id not in conversations]
+        for conv in conversations_collection.find({'_id': {'$in': missing}}, {key: 1 for key in SEARCH_RESULT_PROJECTION if key != 'score'}):
+            conversations[conv['_id']] = conv
+        latest_text = {
+            conv['_id']: conv.get('search_text', '')
+            for conv in conversations_collection.find({'_id': {'$in': page}}, {'search_text': 1})
+        }
+        version_text = {}
+        wanted = [{'conversation_id': conversation_id, 'version_number': number} for conversation_id in page for number in version_hits.get(conversation_id, [])]
+        if wanted:
+            for version in versions_collection.find({'$or': wanted}, {'conversation_id': 1, 'version_number': 1, 'search_text': 1}):
+                version_text[(version['conversation_id'], version['version_number'])] = version.get('search_text', '')
+
+        pattern = highlight_pattern(query)
+        results = []
+        for conversation_id in page:
+            conv = conversations.get(conversation_id)
+            if conv is None:
+                # Deleted between the two queries.
+                continue
+            latest_version = _latest_version(conv)
+            snippets = [
+                {'version_number': latest_version, 'latest': True, 'html': snippet}
+                for snippet in make_snippets(latest_text.get(conversation_id, ''), pattern)
+            ]
+            for number in sorted(version_hits.get(conversation_id, []), reverse=True):
+                if number == latest_version:
+                    continue
+                for snippet in make_snippets(version_text.get((conversation_id, number), ''), pattern, max_snippets=1):
+                    snippets.append({'version_number': number, 'latest': False, 'html': snippet})
+            results.append({
+                '_id': str(conversation_id),
+                'title': conv.get('title', ''),
+                'title_html': highlight(conv.get('title', ''), pattern) if pattern else html.escape(conv.get('title', '')),
+                'created_at': conv.get('created_at'),
+                'updated_at': conv.get('updated_at'),
+                'latest_version': latest_version,
+                'score': round(scores[conversation_id], 3),
+                'snippets': snippets,
+            })
+        return results, len(ranked) > offset + limit
+    except Exception as e:
+        logger.error("Error searching conversations: %s", e)
+        return [], False
+
+@timed('mongo.get_conversation_revision')
+def get_conversation_revision(conversation_id):
+    """Fetches only the fields that identify a conversation's current revision."""
+    try:
+        return conversations_collection.find_one({'_id': ObjectId(conversation_id)}, {'updated_at': 1, 'version_count': 1})
+    except Exception as e:
+        logger.error("Error fetching conversation revision: %s", e)
+        return None
+
+@timed('mongo.find_signature_asset')
+def find_signature_asset(image_hash):
+    """Looks up a previously uploaded image by content hash (a primary-key read)."""
+    try:
+        return signature_assets_collection.find_one({'_id': image_hash}, {'public_id': 1, 'secure_url': 1})
+    except Exception as e:
+        logger.error("Error looking up signature asset: %s", e)
+        return None
+
+@timed('mongo.record_signature_asset')
+def record_signature_asset(image_hash, public_id, secure_url):
+    """Remembers an uploaded image so identical uploads can reuse it."""
+    try:
+        signature_assets_collection.update_one(
+            {'_id': image_hash},
+            {'$setOnInsert': {'public_id': public_id, 'secure_url': secure_url, 'created_at': datetime.utcnow()}},
+            upsert=True,
+        )
+        return True
+    except Exception as e:
+        logger.error("Error recording signature asset: %s", e)
+        return False
+
+@timed('mongo.find_version_diff')
+def find_version_diff(old_hash, new_hash):
+    """Returns the stored diff between two version contents, or None."""
+    try:
+        record = version_diffs_collection.find_one({'_id': f'{old_hash}:{new_hash}'}, {'patch': 1})
+        return record['patch'] if record else None
+    except Exception as e:
+        logger.error("Error looking up version diff: %s", e)
         return None
+
+@timed('mongo.record_version_diff')
+def record_version_diff(old_hash, new_hash, patch):
+    """Stores a computed diff; the same pair of contents always has the same diff."""
+    try:
+        version_diffs_collection.update_one(
+            {'_id': f'{old_hash}:{new_hash}'},
+            {'$setOnInsert': {'patch': patch, 'created_at': datetime.utcnow()}},
+            upsert=True,
+        )
+        return True
+    except Exception as e:
+        logger.error("Error recording version diff: %s", e)
+        return False
+
+@timed('mongo.enqueue_pdf_render')
+def enqueue_pdf_render(conversation_id, version_number):
+    """Queues a background PDF render for a stored version. Re-queuing the same version is a no-op."""
+    now = datetime.utcnow()
+    try:
+        pdf_jobs_collection.update_one(
+            {'conversation_id': ObjectId(conversation_id), 'version_number': version_number},
+            {'$setOnInsert': {'status': 'pending', 'attempts': 0, 'run_after': now, 'created_at': now}},
+            upsert=True,
+        )
+        return True
+    except Exception as e:
+        logger.error("Error queueing PDF render: %s", e)
+        return False
+
+@timed('mongo.claim_pdf_job')
+def claim_pdf_job(worker_id, lease_seconds, max_attempts):
+    """
+    Atomically takes the next due job, or one whose worker's lease has expired
+    (a worker that crashed mid-render). Returns the job or None. Expired jobs
+    that have used up their attempts are marked failed instead of retried, so
+    a job that keeps killing its worker does not circulate forever.
+    """
+    now = datetime.utcnow()
+    pdf_jobs_collection.update_many(
+        {'status': 'running', 'locked_until': {'$lt': now}, 'attempts': {'$gte': max_attempts}},
+        {
+            '$set': {'status': 'failed', 'finished_at': now, 'last_error': 'The worker stopped before finishing the render.'},
+            '$unset': {'locked_until': ''},
+        }
+    )
+    return pdf_jobs_collection.find_one_and_update(
+        {'$or': [
+            {'status': 'pending', 'run_after': {'$lte': now}},
+            {'status': 'running', 'locked_until': {'$lt': now}, 'attempts': {'$lt': max_attempts}},
+        ]},
+        {
+            '$set': {'status': 'running', 'worker': worker_id, 'locked_until': now + timedelta(seconds=lease_seconds)},
+            '$inc': {'attempts': 1},
+        },
+        sort=[('run_after', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+@timed('mongo.renew_pdf_job')
+def renew_pdf_job(job, lease_seconds):
+    """Extends a running job's lease; False if another worker has taken it over."""
+    result = pdf_jobs_collection.update_one(
+        {'_id': job['_id'], 'worker': job['worker'], 'status': 'running'},
+        {'$set': {'locked_until': datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+    )
+    return result.modified_count == 1
+
+@timed('mongo.complete_pdf_job')
+def complete_pdf_job(job):
+    pdf_jobs_collection.update_one(
+        {'_id': job['_id'], 'worker': job['worker']},
+        {'$set': {'status': 'done', 'finished_at': datetime.utcnow()}, '$unset': {'locked_until': ''}}
+    )
+
+@timed('mongo.fail_pdf_job')
+def fail_pdf_job(job, error, max_attempts, retry_base_seconds):
+    """Schedules a retry with exponential backoff, or gives up after max_attempts."""
+    now = datetime.utcnow()
+    if job['attempts'] >= max_attempts:
+        update = {'status': 'failed', 'finished_at': now, 'last_error': error}
+    else:
+        retry_in = retry_base_seconds * 2 ** (job['attempts'] - 1)
+        update = {'status': 'pending', 'run_after': now + timedelta(seconds=retry_in), 'last_error': error}
+    pdf_jobs_collection.update_one(
+        {'_id': job['_id'], 'worker': job['worker']},
+        {'$set': update, '$unset': {'locked_until': ''}}
+    )
+
+def _migrate_conversation(conv):
+    """
+    Moves one conversation's embedded versions into the version store and
+    gives it a version_count. Safe to run concurrently for the same
+    conversation. Returns the count moved.
+    """
+    moved = 0
+    versions = sorted(conv.get('document_versions') or [], key=lambda v: v['version_number'])
+    for version in versions:
+        if versions_collection.count_documents({'conversation_id': conv['_id'], 'version_number': version['version_number']}, limit=1):
+            continue
+        try:
+            _store_document_version(conv['_id'], version['version_number'], version['content'], version.get('uploaded_at'), version.get('uploaded_by'), version.get('notes'))
+        except DuplicateKeyError:
+            # Another writer moved it first.
+            continue
+        moved += 1
+    # Version numbers are allocated from version_count, so every conversation needs one.
+    latest = versions_collection.find_one({'conversation_id': conv['_id']}, {'version_number': 1}, sort=[('version_number', DESCENDING)])
+    conversations_collection.update_one(
+        {'_id': conv['_id'], 'version_count': {'$exists': False}},
+        {'$set': {'version_count': latest['version_number'] + 1 if latest else 0}},
+    )
+    conversations_collection.update_one({'_id': conv['_id']}, {'$unset': {'document_versions': ''}})
+    return moved
+
+def migrate_embedded_versions():
+    """Moves versions embedded in conversation documents into the version store. Returns the count moved."""
+    moved = 0
+    legacy = conversations_collection.find(
+        {'$or': [{'document_versions': {'$exists': True}}, {'version_count': {'$exists': False}}]},
+        {'document_versions': 1},
+    )
+    for conv in legacy:
+        moved += _migrate_conversation(conv)
+    return moved
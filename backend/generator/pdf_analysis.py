@@ -0,0 +1,300 @@
+"""
+Analysis of uploaded PDFs (leases, contracts): text is extracted page by page
+in worker processes, grouped into chunks, and each chunk is reviewed by the LLM
+(map) while later pages are still being extracted. The per-chunk findings are
+then merged into one summary (reduce), in several rounds for long documents.
+"""
+import json
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+MAP_INSTRUCTION = """You are a careful legal reviewer. You are given the text of some consecutive pages of a legal document (a lease, contract or similar); each page starts with a [Page N] marker.
+- List the points a person signing this document should know about: obligations, payments and amounts, deadlines and notice periods, termination and renewal terms, liabilities and penalties, and anything unusual, one-sided or ambiguous.
+- Only report what is in the given pages. If nothing is notable, return an empty list.
+- Reply only with JSON in this format: ```json{"findings": [{"title": "...", "category": "payment|term|obligation|liability|termination|risk|other", "severity": "low|medium|high", "page": 12, "detail": "...", "quote": "short exact quote from the page"}]}```
+"""
+
+REDUCE_INSTRUCTION = """You are a careful legal reviewer. You are given findings that were extracted separately from consecutive parts of one legal document, as JSON.
+- Merge findings that describe the same point, keeping the page of the first occurrence, and drop trivial ones.
+- Write a short plain-language summary of the document and its most important risks.
+- Reply only with JSON in this format: ```json{"summary": "...", "findings": [{"title": "...", "category": "...", "severity": "low|medium|high", "page": 12, "detail": "...", "quote": "..."}]}```
+"""
+
+SEVERITY_ORDER = {'high': 0, 'medium': 1, 'low': 2}
+
+# Reduce rounds before the remaining findings are cut down to the most severe ones.
+MAX_REDUCE_ROUNDS = 3
+
+
+class PdfAnalysisError(Exception):
+    """Raised for uploads that are not a readable PDF or have no extractable text."""
+
+
+def open_pdf(path):
+    """Returns a PyPDF2 reader for `path`, raising PdfAnalysisError for unreadable or protected files."""
+    from PyPDF2 import PdfReader
+
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted and not reader.decrypt(''):
+            raise PdfAnalysisError('The PDF is password-protected.')
+        return reader
+    except PdfAnalysisError:
+        raise
+    except Exception as e:
+        raise PdfAnalysisError(f'Not a readable PDF: {e}')
+
+
+def count_pages(path):
+    return len(open_pdf(path).pages)
+
+
+def extract_page_range(path, start, stop):
+    """
+    Returns the text of pages start..stop-1. Runs in a worker process, which
+    reads the file from disk itself so page text never goes through the parent.
+    """
+    pages = open_pdf(path).pages
+    texts = []
+    for number in range(start, stop):
+        try:
+            texts.append(pages[number].extract_text() or '')
+        except Exception:
+            # A page that cannot be decoded should not sink the whole document.
+            texts.append('')
+    return texts
+
+
+def chunk_pages(pages, max_chars):
+    """
+    Groups (page_number, text) pairs, in page order, into chunks of about
+    `max_chars` characters: {'first_page', 'last_page', 'text'}, pages numbered
+    from 1. A page longer than `max_chars` is split across chunks.
+    """
+    parts, size, first_page = [], 0, None
+    for number, text in pages:
+        page = f'[Page {number + 1}]\n{text.strip()}\n'
+        for start in range(0, len(page), max_chars):
+            piece = page[start:start + max_chars]
+            if parts and size + len(piece) > max_chars:
+                yield {'first_page': first_page, 'last_page': last_page, 'text': '\n'.join(parts)}
+                parts, size = [], 0
+            if not parts:
+                first_page = number + 1
+            parts.append(piece)
+            size += len(piece)
+            last_page = number + 1
+    if parts:
+        yield {'first_page': first_page, 'last_page': last_page, 'text': '\n'.join(parts)}
+
+
+def parse_json_reply(text):
+    """The JSON object in a model reply, with or without a ```json fence; raises ValueError."""
+    if '```json' in text:
+        text = text.split('```json')[1].split('```')[0]
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError('The model reply contains no JSON object.')
+    return json.loads(text[start:end + 1])
+
+
+def normalize_findings(findings, default_page=None):
+    """Keeps well-formed findings and fills in missing fields, so clients can rely on the shape."""
+    result = []
+    for finding in findings if isinstance(findings, list) else []:
+        if not isinstance(finding, dict) or not (finding.get('title') or finding.get('detail')):
+            continue
+        page = finding.get('page')
+        severity = str(finding.get('severity', '')).lower()
+        result.append({
+            'title': str(finding.get('title') or '')[:200],
+            'category': str(finding.get('category') or 'other'),
+            'severity': severity if severity in SEVERITY_ORDER else 'medium',
+            'page': page if isinstance(page, int) and not isinstance(page, bool) else default_page,
+            'detail': str(finding.get('detail') or ''),
+            'quote': str(finding.get('quote') or ''),
+        })
+    return result
+
+
+def _batches(findings, max_chars):
+    batch, size = [], 0
+    for finding in findings:
+        length = len(json.dumps(finding))
+        if batch and size + length > max_chars:
+            yield batch
+            batch, size = [], 0
+        batch.append(finding)
+        size += length
+    if batch:
+        yield batch
+
+
+class PdfAnalyzer:
+    """
+    Runs the extraction and LLM stages of an analysis.
+
+    Page text is extracted in up to `workers` spawned processes (inline with
+    `workers=0`), `pages_per_task` pages per task. At most `llm_concurrency`
+    model calls run at once per server process, and each analysis keeps only
+    that many chunks, plus the page ranges being extracted, in memory.
+    """
+
+    def __init__(self, workers, pages_per_task, chunk_chars, llm_concurrency):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.chunk_chars = chunk_chars
+        self.llm_concurrency = llm_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._llm_executor = ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix='pdf-analyze')
+
+    def pages(self, path, page_count):
+        """Yields (page_number, text) in page order; page ranges are extracted in parallel."""
+        in_flight = deque()
+        starts = iter(range(0, page_count, self.pages_per_task))
+        max_in_flight = max(self.workers, 1) * 2
+        while True:
+            while len(in_flight) < max_in_flight:
+                start = next(starts, None)
+                if start is None:
+                    break
+                stop = min(start + self.pages_per_task, page_count)
+                in_flight.append((start, self._submit(path, start, stop)))
+            if not in_flight:
+                return
+            start, future = in_flight.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+
+    def _submit(self, path, start, stop):
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(extract_page_range(path, start, stop))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        try:
+            return self._get_executor().submit(extract_page_range, path, start, stop)
+        except BrokenProcessPool:
+            # A worker died during an earlier job; start over with fresh processes.
+            self._reset_executor()
+            return self._get_executor().submit(extract_page_range, path, start, stop)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawned like the PDF render pool's workers; extraction needs nothing from Django.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset_executor(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _review_chunk(self, router, chunk, page_count):
+        prompt = f"Pages {chunk['first_page']}-{chunk['last_page']} of {page_count}:\n\n{chunk['text']}"
+        reply = router.complete(MAP_INSTRUCTION, [{'role': 'user', 'parts': [prompt]}])
+        return normalize_findings(parse_json_reply(reply.text).get('findings'), chunk['first_page'])
+
+    def _reduce(self, router, findings):
+        """Merges findings into {'summary', 'findings'}, in several rounds when they don't fit one prompt."""
+        for _ in range(MAX_REDUCE_ROUNDS):
+            batches = list(_batches(findings, self.chunk_chars))
+            if len(batches) <= 1:
+                break
+            futures = [self._llm_executor.submit(self._reduce_call, router, batch) for batch in batches]
+            merged = [finding for future in futures for finding in future.result()['findings']]
+            if len(merged) >= len(findings):
+                break
+            findings = merged
+        if len(list(_batches(findings, self.chunk_chars))) > 1:
+            # Whatever still does not fit goes by severity.
+            findings = next(_batches(sorted(findings, key=lambda f: SEVERITY_ORDER[f['severity']]), self.chunk_chars))
+        return self._reduce_call(router, findings)
+
+    def _reduce_call(self, router, findings):
+        prompt = json.dumps({'findings': findings})
+        reply = parse_json_reply(router.complete(REDUCE_INSTRUCTION, [{'role': 'user', 'parts': [prompt]}]).text)
+        return {'summary': str(reply.get('summary') or ''), 'findings': normalize_findings(reply.get('findings'))}
+
+    def analyze(self, path, router, page_count=None):
+        """
+        Yields (event, data) tuples for a PDF on disk: `start`, then `findings`
+        (or `chunk_error`) per chunk as each review finishes, `progress` as
+        pages are extracted, and finally `summary` and `done`.
+        """
+        started = time.monotonic()
+        page_count = page_count if page_count is not None else count_pages(path)
+        yield 'start', {'pages': page_count}
+
+        in_flight = {}
+        all_findings = []
+        chunk_count = failed = extracted = 0
+
+        def finished(futures):
+            nonlocal failed
+            for future in futures:
+                index, chunk = in_flight.pop(future)
+                pages = {'chunk': index, 'first_page': chunk['first_page'], 'last_page': chunk['last_page']}
+                try:
+                    findings = future.result()
+                except Exception as e:
+                    failed += 1
+                    yield 'chunk_error', {**pages, 'error': str(e)}
+                    continue
+                all_findings.extend(findings)
+                yield 'findings', {**pages, 'findings': findings}
+
+        def pages_with_text():
+            nonlocal extracted
+            for number, text in self.pages(path, page_count):
+                extracted += 1
+                if text.strip():
+                    yield number, text
+
+        try:
+            for chunk in chunk_pages(pages_with_text(), self.chunk_chars):
+                yield 'progress', {'pages_extracted': extracted, 'pages': page_count}
+                if len(in_flight) >= self.llm_concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from finished(done)
+                future = self._llm_executor.submit(self._review_chunk, router, chunk, page_count)
+                in_flight[future] = (chunk_count, {'first_page': chunk['first_page'], 'last_page': chunk['last_page']})
+                chunk_count += 1
+                # Report reviews that finished while this chunk was being extracted.
+                yield from finished([future for future in in_flight if future.done()])
+            yield 'progress', {'pages_extracted': extracted, 'pages': page_count}
+
+            if not chunk_count:
+                raise PdfAnalysisError('The PDF has no extractable text; scanned documents need OCR first.')
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        finally:
+            # The client went away or extraction failed: drop reviews that have not started.
+            for future in in_flight:
+                future.cancel()
+
+        if failed == chunk_count:
+            raise PdfAnalysisError('Every part of the document failed to be reviewed.')
+        yield 'summary', self._reduce(router, all_findings) if all_findings else {'summary': '', 'findings': []}
+        yield 'done', {'pages': page_count, 'chunks': chunk_count, 'failed_chunks': failed, 'seconds': round(time.monotonic() - started, 2)}
+
+
+pdf_analyzer = PdfAnalyzer(
+    workers=settings.PDF_ANALYZE_WORKERS,
+    pages_per_task=settings.PDF_ANALYZE_PAGES_PER_TASK,
+    chunk_chars=settings.PDF_ANALYZE_CHUNK_CHARS,
+    llm_concurrency=settings.PDF_ANALYZE_LLM_CONCURRENCY,
+)
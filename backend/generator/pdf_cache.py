@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+from .pdf_renderer import DEFAULT_PDF_RENDERER, render_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+def pdf_cache_key(markdown_content, renderer=DEFAULT_PDF_RENDERER):
+    """Content address for a rendered PDF: markdown bytes plus the renderer fingerprint."""
+    digest = hashlib.sha256()
+    digest.update(render_fingerprint(renderer).encode('ascii'))
+    digest.update(b'\0')
+    digest.update(markdown_content.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _InFlightRender:
+    """A render in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PdfCache:
+    """
+    Two-tier, content-addressed cache of rendered PDFs.
+
+    The memory tier is an LRU bounded by total bytes; the disk tier lives under
+    `directory` and survives restarts (and is shared between gunicorn workers).
+    Concurrent misses for the same key are collapsed into a single render.
+    """
+
+    def __init__(self, max_memory_bytes, directory=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = Path(directory) if directory else None
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def get_or_render(self, markdown_content, render, renderer=DEFAULT_PDF_RENDERER):
+        """
+        Returns PDF bytes for `markdown_content`, calling
+        `render(markdown_content, renderer)` on a miss.
+        """
+        key = pdf_cache_key(markdown_content, renderer)
+
+        with self._lock:
+            data = self._get_from_memory(key)
+            if data is not None:
+                return data
+            flight = self._in_flight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _InFlightRender()
+                self._in_flight[key] = flight
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            data = self._read_from_disk(key)
+            if data is None:
+                data = render(markdown_content, renderer)
+                self._write_to_disk(key, data)
+            with self._lock:
+                self._put_in_memory(key, data)
+            flight.result = data
+            return data
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+
+    def lookup(self, markdown_content, renderer=DEFAULT_PDF_RENDERER):
+        """Returns cached PDF bytes for `markdown_content`, or None; never renders."""
+        key = pdf_cache_key(markdown_content, renderer)
+        with self._lock:
+            data = self._get_from_memory(key)
+        if data is None:
+            data = self._read_from_disk(key)
+        return data
+
+    def store(self, markdown_content, renderer, data):
+        """Adds a PDF rendered outside get_or_render (e.g. by a batch export)."""
+        key = pdf_cache_key(markdown_content, renderer)
+        self._write_to_disk(key, data)
+        with self._lock:
+            self._put_in_memory(key, data)
+
+    def clear(self):
+        """Drops the memory tier (the disk tier is left in place)."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def _get_from_memory(self, key):
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def _put_in_memory(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path_for(self, key):
+        return self.directory / key[:2] / f'{key}.pdf'
+
+    def _read_from_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            return self._path_for(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error("Error reading cached PDF %s: %s", key, e)
+            return None
+
+    def _write_to_disk(self, key, data):
+        if not self.directory:
+            return
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial PDF.
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        except OSError as e:
+            logger.error("Error writing cached PDF %s: %s", key, e)
+            return
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("Error writing cached PDF %s: %s", key, e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+pdf_cache = PdfCache(
+    max_memory_bytes=settings.PDF_CACHE_MAX_MEMORY_BYTES,
+    directory=settings.PDF_CACHE_DIR,
+)
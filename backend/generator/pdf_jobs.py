@@ -0,0 +1,83 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+from .mongo_client import claim_pdf_job, complete_pdf_job, fail_pdf_job, get_document_version_content, renew_pdf_job
+from .pdf_cache import PdfCache
+from .pdf_pool import section_html_cache, signature_cache
+from .pdf_renderer import render_pdf
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_pdf_job(job, cache):
+    """Renders one queued version into the shared on-disk PDF cache."""
+    content = get_document_version_content(job['conversation_id'], job['version_number'])
+    if content is None:
+        raise LookupError(f"Version {job['version_number']} of conversation {job['conversation_id']} was not found.")
+    cache.get_or_render(
+        content,
+        lambda markdown_content, renderer: render_pdf(
+            markdown_content,
+            renderer,
+            signature_cache,
+            # Consecutive versions share most sections; only changed ones are reconverted.
+            section_html_cache.render(markdown_content) if renderer != 'native' else None,
+        ),
+        settings.PDF_RENDERER,
+    )
+
+
+def _keep_lease(job, finished):
+    """Renews the job's lease until `finished` is set, so a slow render is not taken over by another worker."""
+    while not finished.wait(settings.PDF_JOB_LEASE_SECONDS / 3):
+        try:
+            if not renew_pdf_job(job, settings.PDF_JOB_LEASE_SECONDS):
+                logger.warning("Lost the lease on PDF job %s", job['_id'])
+                return
+        except Exception as e:
+            logger.error("Error renewing the lease on PDF job %s: %s", job['_id'], e)
+
+
+def work(stop=None, drain=False):
+    """
+    Processes PDF render jobs until `stop` (a threading/multiprocessing Event)
+    is set, or, with `drain`, until no job is due. Returns the number of jobs
+    processed. Downloads read the results from the PDF cache's disk tier.
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    # Disk tier only: the web processes keep their own memory tier.
+    cache = PdfCache(max_memory_bytes=0, directory=settings.PDF_CACHE_DIR)
+    processed = 0
+    while not (stop and stop.is_set()):
+        try:
+            job = claim_pdf_job(worker_id, settings.PDF_JOB_LEASE_SECONDS, settings.PDF_JOB_MAX_ATTEMPTS)
+        except Exception as e:
+            logger.error("Error claiming PDF job: %s", e)
+            job = None
+        if job is None:
+            if drain:
+                break
+            time.sleep(settings.PDF_WORKER_POLL_INTERVAL)
+            continue
+
+        finished = threading.Event()
+        lease_keeper = threading.Thread(target=_keep_lease, args=(job, finished), daemon=True)
+        lease_keeper.start()
+        try:
+            run_pdf_job(job, cache)
+        except Exception as e:
+            logger.warning("PDF job %s failed (attempt %s): %s", job['_id'], job['attempts'], e)
+            fail_pdf_job(job, str(e), settings.PDF_JOB_MAX_ATTEMPTS, settings.PDF_JOB_RETRY_BASE_SECONDS)
+        else:
+            complete_pdf_job(job)
+        finally:
+            finished.set()
+            lease_keeper.join()
+        processed += 1
+    return processed
@@ -0,0 +1,177 @@
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .markdown_sections import SectionHtmlCache
+from .metrics import timed
+from .pdf_renderer import DEFAULT_PDF_RENDERER, MARKDOWN_EXTENSIONS, render_pdf
+from .signature_cache import SignatureCache
+
+
+class PdfRenderBusy(Exception):
+    """Raised when the render queue is full; callers should answer 503 + Retry-After."""
+
+    def __init__(self, retry_after):
+        super().__init__('PDF renderer is busy, please retry shortly.')
+        self.retry_after = retry_after
+
+
+class PdfRenderTimeout(Exception):
+    """Raised when a render job does not finish within the configured timeout."""
+
+
+class PdfRenderPool:
+    """
+    Runs PDF renders in a pool of worker processes.
+
+    At most `max_workers + max_queue` jobs are admitted at once; anything beyond
+    that is rejected immediately with PdfRenderBusy instead of piling up behind
+    slow renders. A slot is released when its job finishes; a job that runs past
+    `timeout` cannot be cancelled, so its worker processes are terminated and
+    replaced (see abandon()), which frees the slot. With `max_workers=0`
+    renders run inline in the calling thread, without a timeout.
+
+    With a `section_cache`, markdown is converted to HTML in the calling
+    process, reusing the HTML of sections it has converted before; workers
+    only lay the HTML out.
+    """
+
+    def __init__(self, max_workers, max_queue, timeout, retry_after, image_cache=None, section_cache=None):
+        self.max_workers = max_workers
+        self.image_cache = image_cache
+        self.section_cache = section_cache
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue) if max_workers else None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # The executor each job was submitted to, so abandon() never kills a replacement pool.
+        self._job_executors = weakref.WeakKeyDictionary()
+
+    @timed('pdf.render')
+    def render(self, markdown_content, renderer=DEFAULT_PDF_RENDERER):
+        """Renders markdown to PDF bytes in a worker process."""
+        if not self.max_workers:
+            return render_pdf(markdown_content, renderer, self.image_cache, self._html_for(markdown_content, renderer))
+
+        # A render killed along with another job's hung worker is tried once more.
+        for attempt in range(2):
+            if not self._slots.acquire(blocking=False):
+                raise PdfRenderBusy(self.retry_after)
+            future = self._start(markdown_content, renderer)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                self.abandon(future)
+                raise PdfRenderTimeout(f'PDF generation timed out after {self.timeout} seconds.')
+            except BrokenProcessPool:
+                self._reset_executor(self._job_executors.get(future))
+                if attempt:
+                    raise
+
+    def abandon(self, future):
+        """
+        Gives up on a job that has run too long. A queued job is cancelled; a
+        running one cannot be, so the processes of its pool are terminated and
+        the pool is rebuilt on next use. That releases the job's slot and fails
+        any other job still running there with BrokenProcessPool.
+        """
+        if future.cancel():
+            return
+        self._reset_executor(self._job_executors.get(future), terminate=True)
+        # The pool notices its dead workers shortly; after that the slot is free.
+        wait([future], timeout=5)
+
+    def submit(self, markdown_content, renderer=DEFAULT_PDF_RENDERER):
+        """
+        Starts a render and returns its Future. Unlike render(), this waits for
+        a free slot instead of raising PdfRenderBusy: it is meant for batch work
+        (exports) that bounds its own number of renders in flight.
+        """
+        if not self.max_workers:
+            future = Future()
+            try:
+                future.set_result(self.render(markdown_content, renderer))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._slots.acquire()
+        return self._start(markdown_content, renderer)
+
+    def _html_for(self, markdown_content, renderer):
+        if self.section_cache is not None and renderer != 'native':
+            return self.section_cache.render(markdown_content)
+        return None
+
+    def _start(self, markdown_content, renderer):
+        """Submits a render for a slot the caller has acquired; the slot is released when it finishes."""
+        try:
+            args = (render_pdf, markdown_content, renderer, self.image_cache, self._html_for(markdown_content, renderer))
+            executor = self._get_executor()
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                # A worker died during an earlier job; start over with fresh processes.
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(*args)
+        except Exception:
+            self._slots.release()
+            raise
+        self._job_executors[future] = executor
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # Workers are spawned rather than forked: the parent is a threaded
+                # server process, and the render function needs nothing from Django.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _reset_executor(self, executor=None, terminate=False):
+        """Drops `executor` (by default the current one) so the next job starts a fresh pool."""
+        with self._executor_lock:
+            executor = executor or self._executor
+            if executor is None:
+                return
+            if executor is self._executor:
+                self._executor = None
+        if terminate:
+            # ProcessPoolExecutor has no public way to stop a running job before Python 3.14.
+            if hasattr(executor, 'terminate_workers'):
+                executor.terminate_workers()
+            else:
+                for process in list((executor._processes or {}).values()):
+                    process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+signature_cache = SignatureCache(
+    directory=settings.SIGNATURE_CACHE_DIR,
+    allowed_hosts=settings.SIGNATURE_ALLOWED_HOSTS,
+    timeout=settings.SIGNATURE_FETCH_TIMEOUT,
+)
+
+section_html_cache = SectionHtmlCache(
+    max_bytes=settings.MARKDOWN_SECTION_CACHE_MAX_BYTES,
+    extensions=MARKDOWN_EXTENSIONS,
+)
+
+pdf_render_pool = PdfRenderPool(
+    max_workers=settings.PDF_RENDER_WORKERS,
+    max_queue=settings.PDF_RENDER_QUEUE_SIZE,
+    timeout=settings.PDF_RENDER_TIMEOUT,
+    retry_after=settings.PDF_RENDER_RETRY_AFTER,
+    image_cache=signature_cache,
+    section_cache=section_html_cache,
+)
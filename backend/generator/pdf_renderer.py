@@ -0,0 +1,208 @@
+import hashlib
+from io import BytesIO
+
+import markdown
+
+from .metrics import span, timed
+
+
+# Bump whenever the stylesheet, HTML template or renderer output changes in a way
+# that should invalidate previously cached PDFs.
+PDF_RENDERER_VERSION = '3'
+
+# Markdown extensions shared by both renderers.
+MARKDOWN_EXTENSIONS = ['tables']
+
+# Renderer names accepted by the PDF_RENDERER setting and the ?renderer= parameter.
+PDF_RENDERERS = ('xhtml2pdf', 'native')
+DEFAULT_PDF_RENDERER = 'xhtml2pdf'
+
+# Internal renderer for version redlines: xhtml2pdf with REDLINE_CSS added.
+REDLINE_RENDERER = 'redline'
+
+PDF_STYLE_CSS = """
+    @page {
+        size: a4 portrait;
+        margin: 1.2cm;
+    }
+    body {
+        font-family: "Times New Roman", Times, serif;
+        font-size: 11pt;
+        line-height: 1.3;
+        color: #000000;
+    }
+    h1, h2, h3, h4, h5, h6 {
+        font-family: "Times New Roman", Times, serif;
+        font-weight: bold;
+        color: #000000;
+        margin-top: 1.2em;
+        margin-bottom: 0.6em;
+        line-height: 1.15;
+    }
+    h1 {
+        font-size: 16pt;
+        text-align: center;
+        text-transform: uppercase;
+        margin-bottom: 1.5em;
+    }
+    h2 {
+        font-size: 14pt;
+        text-transform: uppercase;
+        border-bottom: 1px solid #000000;
+        padding-bottom: 0.2em;
+    }
+    h3 {
+        font-size: 12pt;
+        font-weight: bold;
+        text-decoration: underline;
+    }
+    p {
+        margin-bottom: 0.8em;
+        text-align: justify;
+        text-indent: 1.25cm; /* Indent first line of paragraphs */
+    }
+    /* Don't indent first paragraph after a heading */
+    h1 + p, h2 + p, h3 + p, h4 + p, h5 + p, h6 + p {
+        text-indent: 0;
+    }
+    ul, ol {
+        margin-bottom: 0.8em;
+        padding-left: 1.5cm;
+    }
+    li {
+        margin-bottom: 0.3em;
+        text-align: justify;
+    }
+    strong, b {
+        font-weight: bold;
+    }
+    em, i {
+        font-style: italic;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin-bottom: 1em;
+        border: 1px solid #333333;
+    }
+    th, td {
+        border: 1px solid #333333;
+        padding: 6px;
+        text-align: left;
+        vertical-align: top;
+    }
+    th {
+        background-color: #e0e0e0;
+        font-weight: bold;
+    }
+    hr {
+        width: 250px;
+        margin-left: 0;
+        border: 0.5px solid #000;
+    }
+    /* Signature sizing and spacing */
+    img[alt~="signature"][alt~="landlord"] {
+        display: block;
+        width: 180px;
+        height: 80px;
+        object-fit: contain;
+        margin-top: 8mm;   /* place below landlord text */
+        margin-bottom: 0;
+    }
+    img[alt~="signature"][alt~="tenant"] {
+        display: block;
+        width: 180px;
+        height: 80px;
+        object-fit: contain;
+        margin-top: 0;
+        margin-bottom: 8mm; /* place above tenant text */
+    }
+    /* Remove header and footer for a more traditional look */
+"""
+
+REDLINE_CSS = """
+    del {
+        color: #b00000;
+        text-decoration: line-through;
+    }
+    ins {
+        color: #006000;
+        text-decoration: underline;
+    }
+"""
+
+PDF_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Legal Document</title>
+    <meta charset="utf-8">
+    <style>{css}</style>
+</head>
+<body>{body}</body>
+</html>
+"""
+
+
+def stylesheet(renderer=DEFAULT_PDF_RENDERER):
+    return PDF_STYLE_CSS + REDLINE_CSS if renderer == REDLINE_RENDERER else PDF_STYLE_CSS
+
+
+def render_fingerprint(renderer=DEFAULT_PDF_RENDERER):
+    """Identifies the stylesheet/renderer combination used to produce a PDF."""
+    return hashlib.sha256(f"{PDF_RENDERER_VERSION}\n{renderer}\n{stylesheet(renderer)}".encode('utf-8')).hexdigest()
+
+
+def render_pdf(markdown_content, renderer=DEFAULT_PDF_RENDERER, image_cache=None, html_content=None):
+    """
+    Renders markdown to PDF bytes with the named renderer (one of PDF_RENDERERS).
+    `html_content`, the already converted body HTML, saves the xhtml2pdf
+    renderer the markdown conversion; the native renderer does not use it.
+    """
+    if renderer == 'native':
+        from .pdf_native import render_pdf_bytes_native
+        with span('pdf.native'):
+            return render_pdf_bytes_native(markdown_content, image_cache, MARKDOWN_EXTENSIONS)
+    if renderer in ('xhtml2pdf', REDLINE_RENDERER):
+        with span('pdf.xhtml2pdf'):
+            return render_pdf_bytes(markdown_content, image_cache, html_content, stylesheet(renderer))
+    raise ValueError(f'Unknown PDF renderer: {renderer}')
+
+
+@timed('markdown.convert')
+def markdown_to_html(markdown_content):
+    """The HTML body both the PDF and the HTML preview are built from."""
+    return markdown.markdown(markdown_content, extensions=MARKDOWN_EXTENSIONS)
+
+
+def render_html_document(html_content, css=PDF_STYLE_CSS):
+    """Wraps body HTML in the PDF stylesheet and template."""
+    return PDF_HTML_TEMPLATE.format(css=css, body=html_content)
+
+
+def render_pdf_bytes(markdown_content, image_cache=None, html_content=None, css=PDF_STYLE_CSS):
+    """
+    Converts a markdown string to PDF bytes (markdown -> HTML -> xhtml2pdf).
+    With an `image_cache` (a SignatureCache), remote images are loaded from
+    local pre-normalized copies instead of over the network on every render.
+    Raises an Exception if xhtml2pdf reports an error.
+    """
+    if html_content is None:
+        html_content = markdown_to_html(markdown_content)
+    full_html = render_html_document(html_content, css)
+
+    link_callback = None
+    if image_cache is not None:
+        local_images = image_cache.resolve_images(html_content)
+        link_callback = lambda uri, rel: local_images.get(uri, uri)
+
+    result_file = BytesIO()
+    # xhtml2pdf (with reportlab and pyHanko) takes most of a second to import.
+    from xhtml2pdf import pisa
+
+    pisa_status = pisa.CreatePDF(full_html, dest=result_file, link_callback=link_callback)
+
+    if pisa_status.err:
+        raise Exception(f'PDF generation error: {pisa_status.err}')
+
+    return result_file.getvalue()
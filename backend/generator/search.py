@@ -0,0 +1,110 @@
+"""
+Plain-text extraction for the Mongo text indexes, and highlighted snippets
+for search results.
+"""
+import html
+import re
+
+from .version_store import make_delta
+
+
+SNIPPET_LENGTH = 160
+SNIPPET_CONTEXT = 50
+MAX_SNIPPETS = 3
+
+_IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_MARKUP = re.compile(r'^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+|[*_`|~]+', re.MULTILINE)
+_QUERY_TOKEN = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+
+def searchable_text(markdown_text):
+    """The words of a Markdown document, without markup or URLs, on one line."""
+    text = _IMAGE.sub(r'\1', markdown_text or '')
+    text = _LINK.sub(r'\1', text)
+    text = _MARKUP.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def version_search_text(content, previous_content=None):
+    """
+    What a version record is indexed by: the text it added to its predecessor
+    (all of it for a first version). A clause that was later removed can
+    still be found in the version that introduced it.
+    """
+    if previous_content is None:
+        return searchable_text(content)
+    added = [op for op in make_delta(previous_content, content) if isinstance(op, str)]
+    return searchable_text('\n'.join(added))
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def highlight_pattern(query):
+    """
+    A regex matching the terms of a Mongo $text query: quoted phrases as
+    written, words by a rough stem (so "tenants" highlights "tenant"), and
+    nothing for negated terms. None if the query has no positive terms.
+    """
+    parts = []
+    for phrase_negated, phrase, word_negated, word in _QUERY_TOKEN.findall(query):
+        if phrase and not phrase_negated:
+            parts.append(r'\s+'.join(re.escape(token) for token in phrase.split()))
+        elif word and not word_negated:
+            word = re.sub(r'^\W+|\W+$', '', word)
+            if word:
+                parts.append(r'\b' + re.escape(_stem(word.lower())) + r'\w*')
+    if not parts:
+        return None
+    # Longest first, so a phrase wins over a word it contains.
+    return re.compile('|'.join(sorted(parts, key=len, reverse=True)), re.IGNORECASE)
+
+
+def highlight(text, pattern, start=0, end=None):
+    """HTML-escaped text[start:end] with each match wrapped in <mark>."""
+    end = len(text) if end is None else end
+    parts, position = [], start
+    for match in pattern.finditer(text, start, end):
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+    return ''.join(parts)
+
+
+def _word_boundary(text, index, forward):
+    """Moves `index` to the nearest space so snippets don't cut words in half."""
+    if index <= 0 or index >= len(text):
+        return max(0, min(index, len(text)))
+    found = text.find(' ', index) if forward else text.rfind(' ', 0, index)
+    if found == -1:
+        return len(text) if forward else 0
+    return found if forward else found + 1
+
+
+def make_snippets(text, pattern, max_snippets=MAX_SNIPPETS, length=SNIPPET_LENGTH):
+    """
+    Up to `max_snippets` highlighted excerpts of `text` around the matches
+    of `pattern`, in document order, as HTML. Empty if nothing matches.
+    """
+    if not text or pattern is None:
+        return []
+    snippets = []
+    window_end = -1
+    for match in pattern.finditer(text):
+        if match.start() < window_end:
+            continue
+        start = _word_boundary(text, match.start() - SNIPPET_CONTEXT, forward=False)
+        end = _word_boundary(text, start + length, forward=True)
+        snippet = highlight(text, pattern, start, end)
+        snippets.append(('…' if start > 0 else '') + snippet + ('…' if end < len(text) else ''))
+        window_end = end
+        if len(snippets) == max_snippets:
+            break
+    return snippets
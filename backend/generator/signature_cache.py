@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import html as html_lib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+# Signatures are drawn in a 180x80 CSS box; store them at twice that for print.
+SIGNATURE_BOX = (360, 160)
+
+IMG_SRC_RE = re.compile(r'<img\b[^>]*?\bsrc="([^"]+)"', re.IGNORECASE)
+
+
+class SignatureCache:
+    """
+    Local, pre-normalized copies of remote images (signatures) used in PDFs.
+
+    Each URL is fetched once, fitted inside SIGNATURE_BOX with its aspect ratio
+    kept (padded with transparency, since xhtml2pdf ignores object-fit and would
+    otherwise stretch it into the CSS box), and saved as an optimized PNG named
+    after the URL hash. Only hosts in `allowed_hosts` are fetched, since the
+    URLs come from document text. Django-free, so it can be passed to render
+    workers.
+    """
+
+    def __init__(self, directory, allowed_hosts, timeout=10, max_bytes=5 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.allowed_hosts = {host.lower() for host in allowed_hosts}
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def is_cacheable(self, url):
+        parts = urlsplit(url)
+        return parts.scheme in ('http', 'https') and (parts.hostname or '').lower() in self.allowed_hosts
+
+    def path_for(self, url):
+        return self.directory / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.png"
+
+    def resolve(self, url):
+        """Returns the local path for `url`, fetching and normalizing it on first use."""
+        path = self.path_for(url)
+        if path.exists():
+            return path
+        image_bytes = self._fetch(url)
+        normalized = normalize_signature(image_bytes)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(normalized)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
+
+    def resolve_images(self, html):
+        """
+        Resolves every cacheable <img> in `html` up front (in parallel) and
+        returns a {url: data URI} map for the renderer's link callback. Data URIs
+        need no network or file access at render time. URLs that cannot be
+        fetched are left out, so the renderer falls back to loading them itself.
+        """
+        urls = {url for url in map(html_lib.unescape, IMG_SRC_RE.findall(html)) if self.is_cacheable(url)}
+        if not urls:
+            return {}
+
+        def resolve(url):
+            try:
+                encoded = base64.b64encode(self.resolve(url).read_bytes()).decode('ascii')
+                return url, f'data:image/png;base64,{encoded}'
+            except Exception as e:
+                logger.warning("Could not cache image %s: %s", url, e)
+                return url, None
+
+        with ThreadPoolExecutor(max_workers=min(len(urls), 8)) as executor:
+            return {url: data_uri for url, data_uri in executor.map(resolve, urls) if data_uri}
+
+    def _fetch(self, url):
+        import requests
+
+        with requests.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+            response.raise_for_status()
+            data = BytesIO()
+            for chunk in response.iter_content(64 * 1024):
+                data.write(chunk)
+                if data.tell() > self.max_bytes:
+                    raise ValueError(f'Image is larger than {self.max_bytes} bytes.')
+            return data.getvalue()
+
+
+def normalize_signature(image_bytes, box=SIGNATURE_BOX):
+    """Fits an image inside `box` on a transparent canvas and returns optimized PNG bytes."""
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes))
+    image = image.convert('RGBA')
+    image.thumbnail(box, Image.LANCZOS)
+    canvas = Image.new('RGBA', box, (255, 255, 255, 0))
+    canvas.paste(image, ((box[0] - image.width) // 2, (box[1] - image.height) // 2), image)
+    output = BytesIO()
+    canvas.save(output, format='PNG', optimize=True)
+    return output.getvalue()
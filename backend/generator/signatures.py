@@ -0,0 +1,111 @@
+import asyncio
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import timed
+from .mongo_client import find_signature_asset, record_signature_asset
+
+
+SIGNATURE_FOLDER = 'signatures'
+
+_upload_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='signature-upload')
+
+_cloudinary_configured = False
+
+
+class SignatureUploadError(Exception):
+    """Raised when a signature upload started alongside a chat turn did not complete."""
+
+
+def cloudinary_sdk():
+    """The Cloudinary SDK, imported and configured on first use (it is slow to import)."""
+    global _cloudinary_configured
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.utils
+
+    if not _cloudinary_configured:
+        cloudinary.config(
+            cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+            api_key=settings.CLOUDINARY_API_KEY,
+            api_secret=settings.CLOUDINARY_API_SECRET,
+            secure=True,
+        )
+        _cloudinary_configured = True
+    return cloudinary
+
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def signature_public_id(data):
+    """Deterministic Cloudinary public_id for an image: the same bytes always map to the same asset."""
+    return f"{SIGNATURE_FOLDER}/{image_hash(data)[:32]}"
+
+
+def signature_url(public_id):
+    """The delivery URL Cloudinary will serve `public_id` from, known before the upload finishes."""
+    return cloudinary_sdk().utils.cloudinary_url(public_id, secure=True, resource_type='image')[0]
+
+
+@timed('cloudinary.upload')
+def upload_signature_bytes(data, public_id, filename=None):
+    """Uploads image bytes under `public_id`; an existing asset with that id is kept as is."""
+    return cloudinary_sdk().uploader.upload(
+        data,
+        public_id=public_id,
+        overwrite=False,
+        filename=filename,
+        timeout=settings.SIGNATURE_UPLOAD_TIMEOUT,
+    )
+
+
+def get_or_upload_signature(data, filename=None):
+    """
+    Returns the secure_url for an image, uploading it only when no identical
+    image has been uploaded before (looked up by content hash).
+    """
+    digest = image_hash(data)
+    asset = find_signature_asset(digest)
+    if asset:
+        return asset['secure_url']
+    public_id = signature_public_id(data)
+    upload_result = upload_signature_bytes(data, public_id, filename)
+    record_signature_asset(digest, public_id, upload_result['secure_url'])
+    return upload_result['secure_url']
+
+
+class PendingSignatureUpload:
+    """
+    A signature upload running in the background while the model generates.
+
+    The URL is fixed up front, so it can go into the prompt straight away;
+    `wait()` must succeed before a reply that references it is returned or saved.
+    The dedup lookup also runs in the background, so a known image costs the
+    request nothing and an unknown one only the upload it needed anyway.
+    """
+
+    def __init__(self, uploaded_file):
+        data = uploaded_file.read()
+        self.public_id = signature_public_id(data)
+        self.url = signature_url(self.public_id)
+        # Run in a copy of the request context so the upload's timings reach its Server-Timing header.
+        self._future = _upload_executor.submit(contextvars.copy_context().run, get_or_upload_signature, data, uploaded_file.name)
+
+    def wait(self):
+        try:
+            self._future.result(timeout=settings.SIGNATURE_UPLOAD_TIMEOUT)
+        except Exception as e:
+            raise SignatureUploadError(f'Error uploading signature: {e}') from e
+        return self.url
+
+    async def wait_async(self):
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(self._future), settings.SIGNATURE_UPLOAD_TIMEOUT)
+        except Exception as e:
+            raise SignatureUploadError(f'Error uploading signature: {e}') from e
+        return self.url
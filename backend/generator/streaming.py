@@ -0,0 +1,132 @@
+import json
+
+from asgiref.sync import sync_to_async
+
+
+DOCUMENT_MARKER = '```json'
+
+
+def sse_event(event, data):
+    """Formats a single Server-Sent Event frame as bytes."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+async def aiterate_sync(iterator):
+    """
+    Adapts a blocking iterator (such as a Gemini response stream) to an async one.
+
+    Each item is pulled in a worker thread so the ASGI event loop keeps serving
+    other requests while we wait on the model.
+    """
+    sentinel = object()
+    next_item = sync_to_async(next, thread_sensitive=False)
+    while True:
+        item = await next_item(iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+
+class ChatStreamParser:
+    """
+    Incrementally classifies model output as a question or a ```json document block.
+
+    Text is forwarded as `question` deltas until the ```json marker shows up. From
+    then on the JSON payload is buffered and the value of its "text" field is
+    decoded on the fly and forwarded as `document` deltas, so the client can render
+    the document before the closing fence arrives. `finish()` returns the same
+    payload the non-streaming `chat` view would have returned.
+    """
+
+    def __init__(self):
+        self.raw = ''
+        self.mode = 'question'
+        self._pending = ''
+        self._json_buffer = ''
+        self._text_start = None
+        self._decode_pos = 0
+
+    def feed(self, chunk):
+        """Consumes a chunk of model text and returns a list of (event, data) tuples."""
+        self.raw += chunk
+        if self.mode == 'question':
+            return self._feed_question(chunk)
+        return self._feed_document(chunk)
+
+    def flush(self):
+        """Releases any question text held back while checking for the ```json marker."""
+        if self.mode == 'question' and self._pending:
+            pending, self._pending = self._pending, ''
+            return [('question', {'text': pending})]
+        return []
+
+    def finish(self):
+        """Returns the final payload once the model stream is exhausted."""
+        if DOCUMENT_MARKER in self.raw:
+            json_str = self.raw.split(DOCUMENT_MARKER)[1].split('```')[0]
+            return json.loads(json_str)
+        return {'type': 'question', 'text': self.raw}
+
+    def _feed_question(self, chunk):
+        events = []
+        text = self._pending + chunk
+        self._pending = ''
+        marker_at = text.find(DOCUMENT_MARKER)
+        if marker_at != -1:
+            if marker_at:
+                events.append(('question', {'text': text[:marker_at]}))
+            self.mode = 'document'
+            events.append(('document_start', {'type': 'document'}))
+            events.extend(self._feed_document(text[marker_at + len(DOCUMENT_MARKER):]))
+            return events
+
+        # Hold back a trailing partial marker (e.g. "``" or "```js") so it is
+        # never forwarded to the client as question text.
+        for size in range(min(len(DOCUMENT_MARKER) - 1, len(text)), 0, -1):
+            if DOCUMENT_MARKER.startswith(text[-size:]):
+                self._pending = text[-size:]
+                text = text[:-size]
+                break
+        if text:
+            events.append(('question', {'text': text}))
+        return events
+
+    def _feed_document(self, chunk):
+        self._json_buffer += chunk
+        buffer = self._json_buffer
+        if self._text_start is None:
+            key_at = buffer.find('"text"')
+            colon_at = buffer.find(':', key_at + len('"text"')) if key_at != -1 else -1
+            quote_at = buffer.find('"', colon_at + 1) if colon_at != -1 else -1
+            if quote_at == -1:
+                return []
+            self._text_start = quote_at + 1
+            self._decode_pos = self._text_start
+
+        if self._decode_pos is None:
+            # The "text" string has already been closed; the rest is JSON framing.
+            return []
+
+        decoded = []
+        pos = self._decode_pos
+        closed = False
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                closed = True
+                break
+            if char == '\\':
+                size = 6 if buffer[pos + 1:pos + 2] == 'u' else 2
+                if pos + size > len(buffer):
+                    # Escape sequence split across chunks; wait for the rest.
+                    break
+                decoded.append(json.loads(f'"{buffer[pos:pos + size]}"'))
+                pos += size
+                continue
+            decoded.append(char)
+            pos += 1
+        self._decode_pos = None if closed else pos
+
+        if decoded:
+            return [('document', {'text': ''.join(decoded)})]
+        return []
@@ -1,3 +1,1240 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
+from unittest import skipUnless
 
-# Create your tests here.
+import markdown
+from PIL import Image
+from bson.objectid import ObjectId
+from django.conf import settings
+from django.http import HttpResponse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase
+
+from legal_doc_generator.middleware import CompressionMiddleware, ServerTimingMiddleware
+
+from .bulk_export import render_export, stream_export_zip
+from .chat_history import DOCUMENT_CONTEXT_PREFIX, build_budgeted_history, estimate_tokens
+from .document_patch import PatchError, apply_patches
+from .http_caching import etag_matches, version_etag
+from .llm_providers import FakeProvider, LLMRouter, LLMUnavailable
+from .markdown_sections import SectionHtmlCache, split_sections
+from .metrics import exposition, server_timing, span, timed
+from .pdf_analysis import PdfAnalyzer, chunk_pages
+from .pdf_cache import PdfCache, pdf_cache_key
+from .pdf_native import PX, _Builder, parse_markdown
+from .pdf_pool import PdfRenderBusy, PdfRenderPool, PdfRenderTimeout
+from .pdf_renderer import markdown_to_html, render_pdf, render_pdf_bytes
+from .search import highlight_pattern, make_snippets, searchable_text, version_search_text
+from .signature_cache import SIGNATURE_BOX, SignatureCache
+from .signatures import PendingSignatureUpload, SignatureUploadError, get_or_upload_signature
+from .streaming import ChatStreamParser
+from .version_diff import diff_versions, redline_markdown
+from .version_store import apply_delta, apply_untrusted_delta, encode_version, make_delta, rebuild_version
+from .views import _apply_edit_reply, _chat_event_stream, _parse_model_reply
+
+
+class LLMRouterTests(SimpleTestCase):
+    contents = [{'role': 'user', 'parts': ['Draft a rental agreement.']}]
+
+    def test_fails_over_to_next_provider(self):
+        broken = FakeProvider(name='broken', fail_rate=1.0)
+        backup = FakeProvider(name='backup', reply='ok')
+        router = LLMRouter([broken, backup])
+
+        reply = router.complete('system', self.contents)
+
+        self.assertEqual(reply.text, 'ok')
+        self.assertEqual(reply.provider, 'backup')
+        self.assertEqual(broken.stats.error_rate(), 1.0)
+
+    def test_routes_to_fastest_healthy_provider(self):
+        slow = FakeProvider(name='slow', latency=0.05)
+        fast = FakeProvider(name='fast', latency=0.0)
+        router = LLMRouter([slow, fast], min_samples=1)
+        for _ in range(3):
+            slow.stats.record(0.05, True)
+            fast.stats.record(0.001, True)
+
+        self.assertEqual(router.complete('system', self.contents).provider, 'fast')
+
+    def test_hedges_when_primary_exceeds_p95(self):
+        primary = FakeProvider(name='primary', latency=0.5)
+        backup = FakeProvider(name='backup', latency=0.0)
+        router = LLMRouter([primary, backup], hedge=True, min_samples=3)
+        for _ in range(5):
+            primary.stats.record(0.01, True)
+
+        reply = router.complete('system', self.contents)
+
+        self.assertEqual(reply.provider, 'backup')
+        self.assertEqual(backup.calls, 1)
+
+    def test_stream_fails_over_before_first_chunk(self):
+        broken = FakeProvider(name='broken', fail_rate=1.0)
+        backup = FakeProvider(name='backup', reply='abcdef', chunk_size=2)
+        session = LLMRouter([broken, backup]).start_chat('system')
+
+        chunks = [chunk.text for chunk in session.send_message('hi', stream=True)]
+
+        self.assertEqual(chunks, ['ab', 'cd', 'ef'])
+        self.assertEqual(session.history[-1], {'role': 'model', 'parts': ['abcdef']})
+
+    def test_raises_when_all_providers_fail(self):
+        router = LLMRouter([FakeProvider(fail_rate=1.0)])
+        with self.assertRaises(LLMUnavailable):
+            router.complete('system', self.contents)
+
+    def test_async_hedge_cancels_slow_primary(self):
+        primary = FakeProvider(name='primary', latency=5.0)
+        backup = FakeProvider(name='backup', latency=0.0)
+        router = LLMRouter([primary, backup], hedge=True, min_samples=3)
+        for _ in range(5):
+            primary.stats.record(0.01, True)
+
+        reply = asyncio.run(asyncio.wait_for(router.acomplete('system', self.contents), timeout=2))
+
+        self.assertEqual(reply.provider, 'backup')
+
+    def test_async_stream_fails_over_before_first_chunk(self):
+        broken = FakeProvider(name='broken', fail_rate=1.0)
+        backup = FakeProvider(name='backup', reply='abcdef', chunk_size=4)
+        session = LLMRouter([broken, backup]).start_chat('system')
+
+        async def collect():
+            return [chunk.text async for chunk in session.stream_message_async('hi')]
+
+        self.assertEqual(asyncio.run(collect()), ['abcd', 'ef'])
+        self.assertEqual(session.history[-1], {'role': 'model', 'parts': ['abcdef']})
+
+
+class ChatStreamParserTests(SimpleTestCase):
+    def feed(self, chunks):
+        parser = ChatStreamParser()
+        events = []
+        for chunk in chunks:
+            events.extend(parser.feed(chunk))
+        events.extend(parser.flush())
+        return parser, events
+
+    def text(self, events, kind):
+        return ''.join(data['text'] for event, data in events if event == kind)
+
+    def test_fence_split_across_chunks(self):
+        reply = 'Here it is. ```json{"type": "document", "text": "# Lease"}```'
+        parser, events = self.feed(['Here it is. ``', '`js', 'on{"type": "document", "te', 'xt": "# Le', 'ase"}```'])
+
+        self.assertEqual(self.text(events, 'question'), 'Here it is. ')
+        self.assertEqual([event for event, _ in events].count('document_start'), 1)
+        self.assertEqual(self.text(events, 'document'), '# Lease')
+        self.assertEqual(parser.finish(), _parse_model_reply(reply))
+
+    def test_escapes_split_across_chunks(self):
+        reply = '```json{"type": "document", "text": "Say \\"yes\\"\\n\\u00a7 1"}```'
+        chunks = [reply[i:i + 3] for i in range(0, len(reply), 3)]
+        parser, events = self.feed(chunks)
+
+        self.assertEqual(self.text(events, 'document'), 'Say "yes"\n\u00a7 1')
+        self.assertEqual(parser.finish(), {'type': 'document', 'text': 'Say "yes"\n\u00a7 1'})
+
+    def test_reply_without_a_fence_is_a_question(self):
+        reply = 'What is the monthly rent? Use `` for code.'
+        parser, events = self.feed([reply[:27], reply[27:]])
+
+        self.assertEqual(self.text(events, 'question'), reply)
+        self.assertNotIn('document_start', [event for event, _ in events])
+        self.assertEqual(parser.finish(), _parse_model_reply(reply))
+
+    def test_done_event_carries_the_chat_payload(self):
+        reply = 'Done. ```json{"type": "document", "text": "# Lease\\n\\nRent: \\"500\\""}```'
+        chunks = [mock.Mock(text=reply[i:i + 5]) for i in range(0, len(reply), 5)]
+        completed = []
+
+        frames = b''.join(_chat_event_stream(iter(chunks), on_complete=completed.append)).decode()
+        done = frames.rsplit('event: done\ndata: ', 1)[1]
+
+        self.assertEqual(json.loads(done), _parse_model_reply(reply))
+        self.assertEqual(completed, [_parse_model_reply(reply)])
+
+
+class BudgetedHistoryTests(SimpleTestCase):
+    document = '# Lease\n\nMonthly rent is $1000.\n'
+
+    def conversation(self, turns):
+        messages = []
+        for n in range(turns):
+            messages.append({'sender': 'user', 'type': 'display', 'text': f'Change clause {n}, please.'})
+            messages.append({'sender': 'bot', 'type': 'display', 'text': f'Clause {n} is updated.'})
+        return messages
+
+    def cost(self, history):
+        return sum(estimate_tokens(m['text']) for m in history[2:]) + estimate_tokens(self.document)
+
+    def test_stays_under_the_budget_and_keeps_the_newest_turns(self):
+        messages = self.conversation(100)
+
+        history = build_budgeted_history(messages, self.document, budget_tokens=200)
+
+        self.assertEqual(history[0]['text'], DOCUMENT_CONTEXT_PREFIX + self.document)
+        self.assertEqual(history[-1]['text'], 'Clause 99 is updated.')
+        self.assertLessEqual(self.cost(history), 200)
+        self.assertLess(len(history), len(messages))
+
+    def test_older_drafts_are_collapsed(self):
+        messages = [
+            {'sender': 'bot', 'type': 'document_context', 'text': '# Lease\n\n' + 'Old clause. ' * 500},
+            {'sender': 'user', 'type': 'display', 'text': 'Shorter, please.'},
+        ]
+
+        history = build_budgeted_history(messages, self.document, budget_tokens=200)
+
+        self.assertEqual(len(history), 4)
+        self.assertIn('Earlier draft of the document "Lease" omitted', history[2]['text'])
+
+    def test_oversized_latest_turn_is_shortened_not_dropped(self):
+        messages = self.conversation(3) + [{'sender': 'bot', 'type': 'display', 'text': 'x' * 4000 + ' Which clause?'}]
+
+        history = build_budgeted_history(messages, self.document, budget_tokens=100)
+
+        self.assertEqual(len(history), 3)
+        self.assertTrue(history[-1]['text'].endswith('Which clause?'))
+        self.assertLessEqual(self.cost(history), 100)
+
+    def test_oversized_first_message_does_not_hide_later_turns(self):
+        messages = [{'sender': 'user', 'type': 'display', 'text': 'x' * 4000}] + self.conversation(2)
+
+        history = build_budgeted_history(messages, None, budget_tokens=100)
+
+        self.assertEqual([m['text'] for m in history], [m['text'] for m in messages[1:]])
+
+
+class ChatViewParityTests(SimpleTestCase):
+    """The sync views and their async twins share validation and payloads."""
+
+    reply = 'Here it is. ```json{"type": "document", "text": "# Lease"}```'
+
+    def setUp(self):
+        router = LLMRouter([FakeProvider(reply=self.reply, chunk_size=7)])
+        for target in ('generator.views.get_llm_router', 'generator.async_views.get_llm_router'):
+            patcher = mock.patch(target, return_value=router)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post_both(self, path, body):
+        sync = Client(HTTP_HOST='localhost').post(f'/api/{path}', body, content_type='application/json')
+        asynchronous = asyncio.run(AsyncClient(HTTP_HOST='localhost').post(f'/api/async/{path}', body, content_type='application/json'))
+        return sync, asynchronous
+
+    def test_chat_replies_match(self):
+        sync, asynchronous = self.post_both('chat/', {'messages': [{'sender': 'user', 'text': 'Draft a lease.'}]})
+
+        self.assertEqual(sync.status_code, 200)
+        self.assertEqual(sync.json(), asynchronous.json())
+        self.assertEqual(sync.json(), _parse_model_reply(self.reply))
+
+    def test_invalid_requests_are_rejected_alike(self):
+        for path, body in (
+            ('chat/', {'messages': []}),
+            ('chat/', {'messages': 'not json'}),
+            ('chat/', {'messages': [{'sender': 'user', 'text': 5}]}),
+            ('chat/', {'messages': [{'sender': 'user', 'text': 'Hi'}], 'edit_mode': 'patch'}),
+            ('chat/', {'conversation_id': str(ObjectId())}),
+            ('chat/stream/', {'conversation_id': str(ObjectId()), 'message': 'Hi', 'edit_mode': 'patch'}),
+        ):
+            with self.subTest(path=path, body=body):
+                sync, asynchronous = self.post_both(path, body)
+                self.assertEqual(sync.status_code, 400)
+                self.assertEqual(asynchronous.status_code, 400)
+                self.assertEqual(sync.json(), json.loads(asynchronous.content))
+
+    def test_async_signature_attach_runs_off_the_event_loop(self):
+        def attach(request, messages):
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return None
+
+        with mock.patch('generator.async_views._attach_signature', side_effect=attach) as attach_signature:
+            response = asyncio.run(AsyncClient(HTTP_HOST='localhost').post(
+                '/api/async/chat/', {'messages': [{'sender': 'user', 'text': 'Draft a lease.'}]}, content_type='application/json',
+            ))
+
+        attach_signature.assert_called_once()
+        # An assertion failing inside the view would have turned into a 500.
+        self.assertEqual(response.status_code, 200)
+
+
+class DocumentPatchTests(SimpleTestCase):
+    document = (
+        '# Lease\n\n## Rent\n\nMonthly rent is $1000.\n\n## Deposit\n\nTwo months.\n\n'
+        '# Schedule\n\n## Rent\n\nPaid on the first.\n'
+    )
+
+    def test_replace_section_by_heading_path(self):
+        patched = apply_patches(self.document, [
+            {'op': 'replace_section', 'path': ['Lease', 'Rent'], 'text': '## Rent\n\nMonthly rent is $1200.'},
+        ])
+
+        self.assertIn('Monthly rent is $1200.\n\n## Deposit', patched)
+        self.assertIn('Paid on the first.', patched)
+
+    def test_ambiguous_or_missing_heading_path_is_rejected(self):
+        for path in (['Rent'], ['Lease', 'Utilities']):
+            with self.subTest(path=path), self.assertRaises(PatchError):
+                apply_patches(self.document, [{'op': 'replace_section', 'path': path, 'text': '## Rent\n'}])
+
+    def test_replace_text_must_match_exactly_once(self):
+        for find in ('Rent', 'Late fees'):
+            with self.subTest(find=find), self.assertRaises(PatchError):
+                apply_patches(self.document, [{'op': 'replace_text', 'find': find, 'replace': 'Fee'}])
+
+        patched = apply_patches(self.document, [{'op': 'replace_text', 'find': 'Two months.', 'replace': 'One month.'}])
+        self.assertIn('One month.', patched)
+
+    def test_malformed_operations_raise_patch_error(self):
+        for patch in (
+            {'op': 'replace_text', 'find': 1000, 'replace': '1200'},
+            {'op': 'replace_text', 'find': ['Rent'], 'replace': 'Fee'},
+            {'op': 'replace_section', 'path': ['Lease', 2], 'text': '## Rent\n'},
+            {'op': 'replace_section', 'path': {'Lease': 'Rent'}, 'text': '## Rent\n'},
+        ):
+            with self.subTest(patch=patch), self.assertRaises(PatchError):
+                apply_patches(self.document, [patch])
+
+    @mock.patch('generator.views.update_conversation', return_value=True)
+    def test_document_reply_without_text_falls_back(self, update):
+        chat_session = mock.Mock()
+        chat_session.send_message.return_value = mock.Mock(text='```json{"type": "document", "text": "# Lease\\n\\nRewritten."}```')
+
+        with self.assertLogs('generator.views', 'WARNING'):
+            result = _apply_edit_reply(chat_session, {'_id': 'abc', 'latest_document': self.document}, {'type': 'document'}, 'anonymous')
+
+        self.assertEqual(result['text'], '# Lease\n\nRewritten.')
+        self.assertEqual(update.call_args.args[3], '# Lease\n\nRewritten.')
+
+    @mock.patch('generator.views.update_conversation', return_value=True)
+    def test_fallback_without_a_document_is_not_stored(self, update):
+        chat_session = mock.Mock()
+        conversation = {'_id': 'abc', 'latest_document': self.document}
+        reply = {'type': 'patch', 'patches': [{'op': 'replace_text', 'find': 7, 'replace': 'Fee'}]}
+
+        chat_session.send_message.return_value = mock.Mock(text='Which clause do you mean?')
+        with self.assertLogs('generator.views', 'WARNING'):
+            self.assertEqual(_apply_edit_reply(chat_session, conversation, reply, 'anonymous')['type'], 'question')
+
+        chat_session.send_message.return_value = mock.Mock(text='```json{"type": "document"}```')
+        with self.assertLogs('generator.views', 'WARNING'), self.assertRaises(Exception):
+            _apply_edit_reply(chat_session, conversation, reply, 'anonymous')
+        update.assert_not_called()
+
+    @mock.patch('generator.views.update_conversation', return_value=True)
+    def test_failed_patch_falls_back_to_the_full_document(self, update):
+        chat_session = mock.Mock()
+        chat_session.send_message.return_value = mock.Mock(text='```json{"type": "document", "text": "# Lease\\n\\nRewritten."}```')
+        conversation = {'_id': 'abc', 'latest_document': self.document}
+        reply = {'type': 'patch', 'patches': [{'op': 'replace_text', 'find': 'Rent', 'replace': 'Fee'}]}
+
+        with self.assertLogs('generator.views', 'WARNING'):
+            result = _apply_edit_reply(chat_session, conversation, reply, 'anonymous')
+
+        self.assertEqual(result, {'type': 'document', 'text': '# Lease\n\nRewritten.', 'edit': 'full'})
+        self.assertIn('2 times', chat_session.send_message.call_args.args[0])
+        self.assertEqual(update.call_args.args[3], '# Lease\n\nRewritten.')
+
+
+class HttpCachingTests(SimpleTestCase):
+    def test_etag_matches_after_compression_made_it_weak(self):
+        etag = version_etag('abc123')
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH='W/"abc123", "other"')
+
+        self.assertTrue(etag_matches(request, etag))
+        self.assertFalse(etag_matches(request, version_etag('def456')))
+
+    def test_brotli_preferred_and_pdf_left_alone(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+
+        response = HttpResponse(b'{"messages": []}' * 100, content_type='application/json')
+        response['ETag'] = '"abc"'
+        response = middleware.process_response(request, response)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+        pdf = middleware.process_response(request, HttpResponse(b'%PDF' * 100, content_type='application/pdf'))
+        self.assertFalse(pdf.has_header('Content-Encoding'))
+
+
+class SignatureCacheTests(SimpleTestCase):
+    """Runs against a local HTTP server standing in for Cloudinary."""
+
+    def setUp(self):
+        image = BytesIO()
+        Image.new('RGB', (1200, 300), 'white').save(image, format='PNG')
+        image_bytes = image.getvalue()
+        self.hits = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                self.hits.append(handler.path)
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'image/png')
+                handler.send_header('Content-Length', str(len(image_bytes)))
+                handler.end_headers()
+                handler.wfile.write(image_bytes)
+
+            def log_message(handler, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_port}/signature.png'
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SignatureCache(directory.name, allowed_hosts=['127.0.0.1'], timeout=5)
+
+    def test_fetches_once_and_fits_the_signature_box(self):
+        path = self.cache.resolve(self.url)
+        self.cache.resolve(self.url)
+
+        self.assertEqual(self.hits, ['/signature.png'])
+        with Image.open(path) as image:
+            self.assertEqual(image.size, SIGNATURE_BOX)
+
+    def test_renderer_loads_images_from_the_cache(self):
+        markdown_content = f'# Agreement\n\n![Signature]({self.url})\n'
+
+        without_image = render_pdf_bytes('# Agreement\n')
+        first = render_pdf_bytes(markdown_content, self.cache)
+        second = render_pdf_bytes(markdown_content, self.cache)
+
+        self.assertEqual(len(self.hits), 1)
+        # The image is embedded in both renders even though it was fetched once.
+        self.assertIn(b'/Subtype /Image', first)
+        self.assertIn(b'/Subtype /Image', second)
+        self.assertNotIn(b'/Subtype /Image', without_image)
+
+    def test_native_renderer_loads_images_from_the_cache(self):
+        markdown_content = f'# Agreement\n\n![Landlord signature]({self.url})\n'
+
+        first = render_pdf(markdown_content, 'native', self.cache)
+        second = render_pdf(markdown_content, 'native', self.cache)
+
+        self.assertEqual(len(self.hits), 1)
+        self.assertIn(b'/Subtype /Image', first)
+        self.assertIn(b'/Subtype /Image', second)
+
+    def test_hosts_outside_the_allow_list_are_not_fetched(self):
+        self.cache.allowed_hosts = {'res.cloudinary.com'}
+
+        self.assertEqual(self.cache.resolve_images(f'<img alt="Signature" src="{self.url}"/>'), {})
+        self.assertEqual(self.hits, [])
+
+
+class SectionHtmlCacheTests(SimpleTestCase):
+    document = (
+        'Preamble text.\n\n# Lease\n\nBetween **A** and B.\n\n## 1. Rent\n\n- Monthly\n- In advance\n\n'
+        '## 2. Deposit\n\n| Item | Amount |\n|------|--------|\n| Deposit | $2000 |\n\n'
+        '> Quoted\n# Not split here\n'
+    )
+
+    def test_sections_render_like_the_whole_document(self):
+        cache = SectionHtmlCache(max_bytes=1024 * 1024, extensions=['tables'])
+
+        self.assertEqual(len(split_sections(self.document)), 4)
+        self.assertEqual(cache.render(self.document), markdown_to_html(self.document))
+
+    def test_only_changed_sections_are_converted(self):
+        cache = SectionHtmlCache(max_bytes=1024 * 1024, extensions=['tables'])
+        cache.render(self.document)
+        edited = self.document.replace('In advance', 'In arrears')
+
+        with mock.patch('generator.markdown_sections.markdown.markdown', wraps=markdown.markdown) as convert:
+            html = cache.render(edited)
+
+        self.assertEqual(convert.call_count, 1)
+        self.assertIn('In arrears', convert.call_args.args[0])
+        self.assertEqual(html, markdown_to_html(edited))
+
+    def test_reference_links_keep_the_document_whole(self):
+        document = '# A\n\nSee [terms][t].\n\n# B\n\n[t]: https://example.com\n'
+
+        self.assertEqual(split_sections(document), [document])
+
+
+class PdfRendererSelectionTests(SimpleTestCase):
+    markdown_content = (
+        '# Lease\n\nBetween **A** & B.\n\n## Rent\n\n- Monthly\n\n'
+        '| Item | Amount |\n|------|--------|\n| Rent | $1000 |\n'
+    )
+
+    def test_both_renderers_produce_pdfs(self):
+        for renderer in ('xhtml2pdf', 'native'):
+            with self.subTest(renderer=renderer):
+                self.assertTrue(render_pdf(self.markdown_content, renderer).startswith(b'%PDF'))
+
+    def test_unknown_renderer_is_rejected(self):
+        with self.assertRaises(ValueError):
+            render_pdf(self.markdown_content, 'wkhtmltopdf')
+
+    def test_native_signatures_shrink_into_the_box_but_never_grow(self):
+        for size, expected in (((360, 160), (180, 80)), ((720, 80), (180, 20)), ((90, 40), (90, 40))):
+            image = BytesIO()
+            Image.new('RGB', size, 'white').save(image, format='PNG')
+            src = 'data:image/png;base64,' + base64.b64encode(image.getvalue()).decode('ascii')
+            root, md = parse_markdown(f'![Signature]({src})')
+            [flowable] = _Builder(md, None).flowables(root)
+            with self.subTest(size=size):
+                self.assertEqual((flowable.drawWidth, flowable.drawHeight), (expected[0] * PX, expected[1] * PX))
+
+    def test_native_renderer_shows_alt_text_for_unreadable_images(self):
+        garbage = 'data:image/png;base64,' + base64.b64encode(b'\x89PNG not really an image').decode('ascii')
+        markdown_content = f'# Lease\n\n![Landlord signature]({garbage})\n'
+
+        root, md = parse_markdown(markdown_content)
+        with self.assertLogs('generator.pdf_native', 'WARNING'):
+            flowable = _Builder(md, None).flowables(root)[-1]
+            pdf = render_pdf(markdown_content, 'native')
+
+        self.assertIn('Landlord signature', flowable.text)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertNotIn(b'/Subtype /Image', pdf)
+
+    def test_cache_key_depends_on_the_renderer(self):
+        self.assertNotEqual(
+            pdf_cache_key(self.markdown_content, 'xhtml2pdf'),
+            pdf_cache_key(self.markdown_content, 'native'),
+        )
+
+
+class PdfCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.renders = []
+
+    def render(self, markdown_content, renderer):
+        """Counting stub renderer: the 'PDF' is 100 bytes per document."""
+        self.renders.append(markdown_content)
+        return markdown_content.encode('utf-8').ljust(100, b'.')
+
+    def test_memory_tier_evicts_least_recently_used_by_bytes(self):
+        cache = PdfCache(max_memory_bytes=250)
+        cache.get_or_render('a', self.render)
+        cache.get_or_render('b', self.render)
+        cache.get_or_render('a', self.render)
+        cache.get_or_render('c', self.render)
+
+        self.assertEqual(cache._memory_bytes, 200)
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertEqual(self.renders, ['a', 'b', 'c'])
+
+    def test_disk_tier_hit_after_memory_eviction(self):
+        cache = PdfCache(max_memory_bytes=100, directory=self.directory)
+        first = cache.get_or_render('a', self.render)
+        cache.get_or_render('b', self.render)
+
+        self.assertNotIn(pdf_cache_key('a'), cache._entries)
+        self.assertEqual(cache.get_or_render('a', self.render), first)
+        self.assertEqual(self.renders, ['a', 'b'])
+
+    def test_failed_disk_write_leaves_no_partial_file(self):
+        cache = PdfCache(max_memory_bytes=1000, directory=self.directory)
+
+        with mock.patch('generator.pdf_cache.os.replace', side_effect=OSError('disk full')), self.assertLogs('generator.pdf_cache', 'ERROR'):
+            cache.get_or_render('a', self.render)
+
+        self.assertEqual([files for _, _, files in os.walk(self.directory) if files], [])
+        cache.clear()
+        cache.get_or_render('a', self.render)
+        self.assertEqual(self.renders, ['a', 'a'])
+        self.assertIsNotNone(cache._read_from_disk(pdf_cache_key('a')))
+
+    def test_concurrent_misses_share_one_render(self):
+        cache = PdfCache(max_memory_bytes=1000, directory=self.directory)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_render(markdown_content, renderer):
+            started.set()
+            release.wait(5)
+            return self.render(markdown_content, renderer)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_render('a', slow_render))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to find the render in flight before it finishes.
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.renders, ['a'])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(set(results)), 1)
+
+
+def _stub_render(markdown_content, renderer, image_cache=None, html_content=None):
+    """Stands in for render_pdf in pool workers (module level, so spawned workers can import it)."""
+    if markdown_content == 'slow':
+        time.sleep(30)
+    elif markdown_content == 'crash':
+        os._exit(1)
+    return f'%PDF {markdown_content}'.encode('utf-8')
+
+
+@mock.patch('generator.pdf_pool.render_pdf', _stub_render)
+class PdfRenderPoolTests(SimpleTestCase):
+    def pool(self, max_workers=1, max_queue=0, timeout=10):
+        pool = PdfRenderPool(max_workers=max_workers, max_queue=max_queue, timeout=timeout, retry_after=7)
+        self.addCleanup(pool._reset_executor, terminate=True)
+        return pool
+
+    def test_inline_pool_renders_in_the_calling_thread(self):
+        self.assertEqual(self.pool(max_workers=0).render('# Lease'), b'%PDF # Lease')
+
+    def test_full_pool_rejects_renders_as_busy(self):
+        pool = self.pool()
+        slow = pool.submit('slow')
+        self.addCleanup(pool.abandon, slow)
+
+        with self.assertRaises(PdfRenderBusy) as busy:
+            pool.render('# Lease')
+        self.assertEqual(busy.exception.retry_after, 7)
+
+    def test_timed_out_render_frees_its_worker_and_slot(self):
+        pool = self.pool(timeout=1)
+        started = time.monotonic()
+        with self.assertRaises(PdfRenderTimeout):
+            pool.render('slow')
+
+        self.assertLess(time.monotonic() - started, 10)
+        # The replacement worker is spawned from scratch, which can take longer than a second.
+        pool.timeout = 10
+        self.assertEqual(pool.render('# Lease'), b'%PDF # Lease')
+
+    def test_broken_pool_is_rebuilt(self):
+        pool = self.pool()
+        with self.assertRaises(BrokenProcessPool):
+            pool.render('crash')
+
+        self.assertEqual(pool.render('# Lease'), b'%PDF # Lease')
+
+    def test_busy_and_timeout_map_to_503_and_504(self):
+        client = Client(HTTP_HOST='localhost')
+        for error, code, retry_after in ((PdfRenderBusy(7), 503, '7'), (PdfRenderTimeout('too slow'), 504, None)):
+            with self.subTest(code=code), mock.patch('generator.views.pdf_render_pool.render', side_effect=error):
+                response = client.post('/api/download-pdf/', {'document_content': '# Lease'}, content_type='application/json')
+                self.assertEqual(response.status_code, code)
+                self.assertEqual(response.get('Retry-After'), retry_after)
+
+
+class BulkExportTests(SimpleTestCase):
+    class FakePool:
+        def submit(self, markdown_content, renderer):
+            future = Future()
+            future.set_result(f'%PDF {markdown_content}'.encode('utf-8'))
+            return future
+
+    def test_streams_a_zip_with_a_manifest_and_bounds_documents_in_flight(self):
+        items = [{'conversation_id': f'{i:024x}', 'title': f'Lease {i}', 'version_number': 0} for i in range(6)]
+        items.append({'conversation_id': 'f' * 24, 'title': None, 'version_number': None})
+        started = []
+        in_flight = []
+
+        def read_content(conversation_id, version_number):
+            started.append(conversation_id)
+            return f'# {conversation_id}'
+
+        def collected(results):
+            for done, result in enumerate(results, start=1):
+                in_flight.append(len(started) - done)
+                yield result
+
+        with mock.patch('generator.bulk_export.get_document_version_content', side_effect=read_content):
+            results = render_export(iter(items), self.FakePool(), max_in_flight=2)
+            archive = zipfile.ZipFile(BytesIO(b''.join(stream_export_zip(collected(results)))))
+
+        names = archive.namelist()
+        self.assertEqual(len(names), 7)
+        self.assertEqual(names[-1], 'manifest.ndjson')
+        manifest = archive.read('manifest.ndjson').decode('utf-8').splitlines()
+        self.assertEqual(len(manifest), 7)
+        self.assertEqual(sum('"error"' in line for line in manifest), 1)
+        self.assertLessEqual(max(in_flight), 2)
+
+    def test_hung_render_is_abandoned_and_reported(self):
+        class HangingPool(self.FakePool):
+            abandoned = []
+
+            def submit(self, markdown_content, renderer):
+                return Future() if 'hang' in markdown_content else super().submit(markdown_content, renderer)
+
+            def abandon(self, future):
+                self.abandoned.append(future)
+
+        items = [{'conversation_id': name * 12, 'title': name, 'version_number': 0} for name in ('ab', 'cd')]
+        contents = {'ab' * 12: '# hang', 'cd' * 12: '# Lease'}
+        with mock.patch('generator.bulk_export.get_document_version_content', side_effect=lambda pk, number: contents[pk]):
+            results = list(render_export(items, HangingPool(), timeout=0.2))
+
+        errors = {item['title']: error for item, _, error in results}
+        self.assertEqual(errors, {'cd': None, 'ab': 'PDF generation timed out after 0.2 seconds.'})
+        self.assertEqual(len(HangingPool.abandoned), 1)
+
+    def test_export_streams_asynchronously_under_asgi(self):
+        async def export():
+            with mock.patch('generator.views.export_items', return_value=[]):
+                response = await AsyncClient(HTTP_HOST='localhost').post('/api/export/', {'conversation_ids': []}, content_type='application/json')
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        response, body = asyncio.run(export())
+        self.assertTrue(response.is_async)
+        self.assertIn(b'manifest.ndjson', body)
+
+
+class PendingSignatureUploadTests(SimpleTestCase):
+    def setUp(self):
+        self.assets = {}
+        patchers = [
+            mock.patch('generator.signatures.signature_url', lambda public_id: f'https://res.cloudinary.com/demo/image/upload/{public_id}'),
+            mock.patch('generator.signatures.find_signature_asset', self.assets.get),
+            mock.patch('generator.signatures.record_signature_asset', lambda digest, public_id, url: self.assets.setdefault(digest, {'secure_url': url})),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_url_is_known_before_the_upload_finishes(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def upload(data, **options):
+            started.set()
+            release.wait(5)
+            return {'secure_url': 'unused'}
+
+        with mock.patch('cloudinary.uploader.upload', side_effect=upload):
+            pending = PendingSignatureUpload(SimpleUploadedFile('sig.png', b'signature bytes'))
+            started.wait(5)
+            again = PendingSignatureUpload(SimpleUploadedFile('other.png', b'signature bytes'))
+            self.assertEqual(pending.url, again.url)
+            self.assertIn(pending.public_id, pending.url)
+            release.set()
+            self.assertEqual(pending.wait(), pending.url)
+            again.wait()
+
+    def test_known_images_are_not_uploaded_again(self):
+        with mock.patch('cloudinary.uploader.upload', return_value={'secure_url': 'https://res.cloudinary.com/demo/v1/sig'}) as upload:
+            first = get_or_upload_signature(b'signature bytes', 'sig.png')
+            second = get_or_upload_signature(b'signature bytes', 'again.png')
+
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(first, second)
+
+    def test_failed_upload_raises(self):
+        with mock.patch('cloudinary.uploader.upload', side_effect=RuntimeError('down')):
+            pending = PendingSignatureUpload(SimpleUploadedFile('sig.png', b'signature bytes'))
+            with self.assertRaises(SignatureUploadError):
+                pending.wait()
+
+
+class _FakeConversations:
+    """Just enough of a Collection for list_conversations: its keyset query, sort and limit."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.projections = []
+
+    def find(self, query, projection):
+        self.projections.append(projection)
+        docs = self.docs
+        if query:
+            newer, tie = query['$or']
+            docs = [
+                d for d in docs
+                if d['updated_at'] < newer['updated_at']['$lt']
+                or (d['updated_at'] == tie['updated_at'] and d['_id'] < tie['_id']['$lt'])
+            ]
+        return self._Cursor([{k: v for k, v in d.items() if k == '_id' or projection.get(k)} for d in docs])
+
+    class _Cursor(list):
+        def sort(self, keys):
+            for field, direction in reversed(keys):
+                super().sort(key=lambda d: d[field], reverse=direction < 0)
+            return self
+
+        def limit(self, n):
+            return type(self)(self[:n])
+
+
+class ConversationListTests(SimpleTestCase):
+    def setUp(self):
+        same_time = datetime(2026, 1, 1, 12, 0)
+        self.docs = [
+            {'_id': ObjectId(), 'title': f'Lease {n}', 'updated_at': same_time if n < 5 else same_time - timedelta(hours=n),
+             'created_at': same_time, 'messages': [{'text': 'x' * 1000}], 'document_versions': [{'content': '# Lease'}],
+             'search_text': 'lease', 'latest_preview': 'Lease', 'latest_size': 7}
+            for n in range(8)
+        ]
+        self.collection = _FakeConversations(self.docs)
+        patcher = mock.patch('generator.mongo_client.conversations_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cursor_round_trip(self):
+        from .mongo_client import decode_cursor, encode_cursor
+
+        self.assertEqual(decode_cursor(encode_cursor(self.docs[0])), (self.docs[0]['updated_at'], self.docs[0]['_id']))
+
+    def test_pages_cover_ties_on_updated_at_exactly_once(self):
+        from .mongo_client import list_conversations
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = list_conversations(limit=2, cursor=cursor)
+            seen.extend(conv['_id'] for conv in page)
+            if cursor is None:
+                break
+
+        expected = sorted(self.docs, key=lambda d: (d['updated_at'], d['_id']), reverse=True)
+        self.assertEqual(seen, [str(d['_id']) for d in expected])
+
+    def test_list_leaves_out_message_and_version_bodies(self):
+        from .mongo_client import list_conversations
+
+        page, _ = list_conversations(limit=3)
+
+        for field in ('messages', 'document_versions', 'search_text'):
+            self.assertNotIn(field, self.collection.projections[0])
+            self.assertNotIn(field, page[0])
+        self.assertEqual(set(page[0]), {'_id', 'title', 'created_at', 'updated_at', 'latest_preview', 'latest_size'})
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        for cursor in ('not-base64!', base64.urlsafe_b64encode(b'{"u": "yesterday"}').decode('ascii')):
+            with self.subTest(cursor=cursor):
+                response = Client(HTTP_HOST='localhost').get('/api/conversations/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid cursor', response.json()['error'])
+
+
+@skipUnless(os.getenv('RUN_MONGO_TESTS'), 'requires a local mongod: set MONGO_URI and RUN_MONGO_TESTS=1')
+class VersionAllocationTests(SimpleTestCase):
+    def test_parallel_saves_get_unique_version_numbers(self):
+        from .mongo_client import (
+            delete_conversation, ensure_indexes, list_document_versions, save_conversation, update_conversation,
+        )
+
+        ensure_indexes()
+        conversation_id = save_conversation('Concurrency test', [], 'v0')
+        self.addCleanup(delete_conversation, conversation_id)
+        results = []
+
+        def save(index):
+            results.append(update_conversation(conversation_id, None, [{'sender': 'user', 'text': f'edit {index}'}], f'v{index}'))
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(results))
+        numbers = [v['version_number'] for v in list_document_versions(conversation_id)]
+        self.assertEqual(numbers, list(range(21)))
+
+    def test_parallel_saves_on_the_same_base_version_conflict(self):
+        from .mongo_client import (
+            VersionConflict, delete_conversation, ensure_indexes, list_document_versions, save_conversation, update_conversation,
+        )
+
+        ensure_indexes()
+        conversation_id = save_conversation('Conflict test', [], 'v0')
+        self.addCleanup(delete_conversation, conversation_id)
+        conflicts = []
+
+        def save(index):
+            try:
+                update_conversation(conversation_id, None, None, f'v{index}', base_version=0, base_content='v0')
+            except VersionConflict as e:
+                conflicts.append(e.latest_version)
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(1, 11)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(conflicts, [1] * 9)
+        self.assertEqual([v['version_number'] for v in list_document_versions(conversation_id)], [0, 1])
+
+
+    def test_failed_version_write_gives_the_number_back(self):
+        from .mongo_client import delete_conversation, ensure_indexes, get_conversation_summary, list_document_versions, save_conversation, update_conversation
+
+        ensure_indexes()
+        conversation_id = save_conversation('Rollback test', [], 'v0')
+        self.addCleanup(delete_conversation, conversation_id)
+        with mock.patch('generator.mongo_client.versions_collection.insert_one', side_effect=RuntimeError('write failed')):
+            self.assertFalse(update_conversation(conversation_id, None, [], 'v1'))
+
+        self.assertEqual(get_conversation_summary(conversation_id)['latest_version'], 0)
+        self.assertTrue(update_conversation(conversation_id, None, [], 'v1 again'))
+        self.assertEqual([v['version_number'] for v in list_document_versions(conversation_id)], [0, 1])
+
+    def test_saving_a_legacy_conversation_migrates_it_first(self):
+        from .mongo_client import (
+            conversations_collection, delete_conversation, ensure_indexes, get_document_version_content, list_document_versions, update_conversation,
+        )
+
+        ensure_indexes()
+        conversation_id = str(conversations_collection.insert_one({
+            'title': 'Legacy', 'messages': [],
+            'document_versions': [{'version_number': n, 'content': f'legacy v{n}', 'notes': None} for n in range(2)],
+        }).inserted_id)
+        self.addCleanup(delete_conversation, conversation_id)
+
+        self.assertTrue(update_conversation(conversation_id, None, [], 'v2'))
+        self.assertEqual([v['version_number'] for v in list_document_versions(conversation_id)], [0, 1, 2])
+        self.assertEqual([get_document_version_content(conversation_id, n) for n in range(3)], ['legacy v0', 'legacy v1', 'v2'])
+
+
+@skipUnless(os.getenv('RUN_MONGO_TESTS'), 'requires a local mongod: set MONGO_URI and RUN_MONGO_TESTS=1')
+class PdfJobQueueTests(SimpleTestCase):
+    def test_saved_versions_are_prerendered_by_workers(self):
+        from .mongo_client import delete_conversation, ensure_indexes, pdf_jobs_collection, save_conversation, update_conversation
+        from .pdf_cache import PdfCache
+        from .pdf_jobs import work
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        ensure_indexes()
+        with self.settings(PDF_CACHE_DIR=directory.name, PDF_PRECOMPUTE=True):
+            conversation_id = save_conversation('Queue test', [], '# Lease\n\nv0\n')
+            self.addCleanup(delete_conversation, conversation_id)
+            update_conversation(conversation_id, None, None, '# Lease\n\nv1\n')
+            work(drain=True)
+
+        jobs = list(pdf_jobs_collection.find({'conversation_id': ObjectId(conversation_id)}))
+        self.assertEqual(sorted(job['status'] for job in jobs), ['done', 'done'])
+        cache = PdfCache(0, directory.name)
+        render = mock.Mock(side_effect=AssertionError('should have been prerendered'))
+        self.assertTrue(cache.get_or_render('# Lease\n\nv1\n', render).startswith(b'%PDF'))
+
+
+    def expired_job(self, attempts):
+        from .mongo_client import pdf_jobs_collection
+
+        job_id = pdf_jobs_collection.insert_one({
+            'conversation_id': ObjectId(), 'version_number': 1, 'status': 'running', 'worker': 'crashed:1',
+            'attempts': attempts, 'run_after': datetime.utcnow(), 'locked_until': datetime.utcnow() - timedelta(seconds=1),
+        }).inserted_id
+        self.addCleanup(pdf_jobs_collection.delete_one, {'_id': job_id})
+        return job_id
+
+    def test_expired_job_out_of_attempts_is_failed_not_reclaimed(self):
+        from .mongo_client import claim_pdf_job, pdf_jobs_collection
+
+        job_id = self.expired_job(attempts=5)
+
+        self.assertIsNone(claim_pdf_job('worker:2', 300, max_attempts=5))
+        job = pdf_jobs_collection.find_one({'_id': job_id})
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['attempts'], 5)
+
+    def test_expired_job_is_reclaimed_and_its_lease_renewed(self):
+        from .mongo_client import claim_pdf_job, renew_pdf_job
+
+        job_id = self.expired_job(attempts=2)
+
+        job = claim_pdf_job('worker:2', 300, max_attempts=5)
+        self.assertEqual((job['_id'], job['worker'], job['attempts']), (job_id, 'worker:2', 3))
+        self.assertTrue(renew_pdf_job(job, 300))
+        self.assertFalse(renew_pdf_job({**job, 'worker': 'crashed:1'}, 300))
+
+
+@skipUnless(os.getenv('RUN_MONGO_TESTS'), 'requires a local mongod: set MONGO_URI and RUN_MONGO_TESTS=1')
+class SearchTests(SimpleTestCase):
+    def test_finds_latest_content_and_clauses_removed_since(self):
+        from .mongo_client import delete_conversation, ensure_indexes, save_conversation, search_conversations, update_conversation
+
+        ensure_indexes()
+        conversation_id = save_conversation('Zanzibar lease', [], '# Lease\n\nPets are allowed with a quokka deposit.\n')
+        self.addCleanup(delete_conversation, conversation_id)
+        update_conversation(conversation_id, None, [], '# Lease\n\nNo pets.\n')
+
+        results, _ = search_conversations('zanzibar')
+        self.assertEqual([r['_id'] for r in results], [conversation_id])
+        self.assertEqual(results[0]['title_html'], '<mark>Zanzibar</mark> lease')
+
+        self.assertEqual(search_conversations('quokka')[0], [])
+        results, _ = search_conversations('quokka', include_versions=True)
+        self.assertEqual(results[0]['snippets'], [
+            {'version_number': 0, 'latest': False, 'html': 'Lease Pets are allowed with a <mark>quokka</mark> deposit.'},
+        ])
+
+
+class VersionDiffTests(SimpleTestCase):
+    old = '# Lease\n\n## Rent\n\nThe rent is $1,000 per month.\n\n| Item | Amount |\n|---|---|\n| Rent | $1000 |\n\nOld clause.\n'
+    new = '# Lease\n\n## Monthly Rent\n\nThe rent is $1,200 per month.\n\n| Item | Amount |\n|---|---|\n| Rent | $1200 |\n'
+
+    def test_hunks_reproduce_both_versions(self):
+        patch = diff_versions(self.old, self.new)
+        old_lines = self.old.splitlines(keepends=True)
+        new_lines = self.new.splitlines(keepends=True)
+
+        self.assertEqual(patch['stats']['hunks'], len(patch['hunks']))
+        for hunk in patch['hunks']:
+            old_text = ''.join(text for op, text in hunk['ops'] if op != '+')
+            new_text = ''.join(text for op, text in hunk['ops'] if op != '-')
+            self.assertEqual(old_text, ''.join(old_lines[hunk['old_start']:hunk['old_start'] + hunk['old_lines']]))
+            self.assertEqual(new_text, ''.join(new_lines[hunk['new_start']:hunk['new_start'] + hunk['new_lines']]))
+        # Unchanged lines are not part of the patch.
+        self.assertNotIn('# Lease', str(patch))
+
+    def test_redline_keeps_markdown_structure(self):
+        redline = redline_markdown(self.old, self.new)
+
+        self.assertIn('## <ins>Monthly </ins>Rent', redline)
+        self.assertIn('$1,<del>000</del><ins>200</ins>', redline)
+        self.assertIn('| Rent | $<del>1000</del><ins>1200</ins> |', redline)
+        self.assertIn('<del>Old clause.</del>', redline)
+
+
+class VersionStoreTests(SimpleTestCase):
+    def store(self, contents, snapshot_interval):
+        """Encodes contents as consecutive versions, as _store_document_version does."""
+        records = []
+        for number, content in enumerate(contents):
+            previous = contents[number - 1] if number else None
+            records.append({'version_number': number, **encode_version(content, number, previous, snapshot_interval)})
+        return records
+
+    def rebuild(self, records, number):
+        return rebuild_version(reversed(records[:number + 1]))
+
+    def test_round_trip_across_snapshot_boundaries(self):
+        contents = ['# Lease\n\n' + ''.join(f'Clause {n}: rent is due monthly.\n' for n in range(50))]
+        for number in range(1, 12):
+            contents.append(contents[-1].replace(f'Clause {number}:', f'Clause {number} (amended):'))
+        records = self.store(contents, snapshot_interval=5)
+
+        self.assertEqual([r['kind'] for r in records], ['snapshot'] + ['delta'] * 4 + ['snapshot'] + ['delta'] * 4 + ['snapshot', 'delta'])
+        for number, content in enumerate(contents):
+            with self.subTest(version=number):
+                self.assertEqual(self.rebuild(records, number), content)
+
+    def test_rewritten_document_falls_back_to_a_snapshot(self):
+        contents = ['aaa\nbbb\n', ''.join(f'{n} entirely new line\n' for n in range(200))]
+        records = self.store(contents, snapshot_interval=10)
+
+        self.assertEqual(records[1]['kind'], 'snapshot')
+        self.assertEqual(self.rebuild(records, 1), contents[1])
+
+    def test_version_without_a_stored_predecessor_is_a_snapshot(self):
+        record = encode_version('v3 content\n', 3, None, snapshot_interval=10)
+
+        self.assertEqual(record['kind'], 'snapshot')
+        self.assertEqual(rebuild_version([record]), 'v3 content\n')
+        # A delta chain that never reaches a snapshot cannot be rebuilt.
+        base = ''.join(f'Clause {n}: the tenant keeps the premises tidy.\n' for n in range(100))
+        delta = encode_version(base + 'One more clause.\n', 1, base, snapshot_interval=10)
+        self.assertEqual(delta['kind'], 'delta')
+        self.assertIsNone(rebuild_version([delta]))
+
+    def test_delta_round_trip(self):
+        base, target = 'a\nb\nc\n', 'a\nB\nc\nd'
+        self.assertEqual(apply_delta(base, make_delta(base, target)), target)
+
+
+@skipUnless(os.getenv('RUN_MONGO_TESTS'), 'requires a local mongod: set MONGO_URI and RUN_MONGO_TESTS=1')
+class LegacyVersionReadTests(SimpleTestCase):
+    def test_embedded_versions_are_read_from_the_conversation(self):
+        from .mongo_client import conversations_collection, delete_conversation, get_document_version_content, list_document_versions
+
+        conversation_id = str(conversations_collection.insert_one({
+            'title': 'Legacy', 'messages': [],
+            'document_versions': [{'version_number': n, 'content': f'legacy v{n}', 'notes': None} for n in range(3)],
+        }).inserted_id)
+        self.addCleanup(delete_conversation, conversation_id)
+
+        self.assertEqual(get_document_version_content(conversation_id, 1), 'legacy v1')
+        self.assertIsNone(get_document_version_content(conversation_id, 5))
+        self.assertEqual([v['version_number'] for v in list_document_versions(conversation_id)], [0, 1, 2])
+
+
+class UntrustedDeltaTests(SimpleTestCase):
+    base = '# Lease\n\nRent is $1000.\n\nDeposit is $2000.\n'
+
+    def test_applies_a_valid_delta(self):
+        new = self.base.replace('$1000', '$1200')
+
+        self.assertEqual(apply_untrusted_delta(self.base, make_delta(self.base, new)), new)
+
+    def test_rejects_repeated_or_overlapping_copies(self):
+        for ops in ([[0, 5]] * 1000, [[2, 5], [0, 1]], [[0, 3], [2, 5]]):
+            with self.subTest(ops=ops[:2]), self.assertRaises(ValueError):
+                apply_untrusted_delta(self.base, ops)
+
+    def test_rejects_malformed_operations(self):
+        for ops in ({'0': 1}, [[0, 99]], [[2, 1]], [[0]], [['0', 1]], [[True, 1]], [3]):
+            with self.subTest(ops=ops), self.assertRaises(ValueError):
+                apply_untrusted_delta(self.base, ops)
+
+
+    @mock.patch('generator.views.update_conversation')
+    @mock.patch('generator.views.get_conversation_summary', return_value={'latest_version': 1})
+    def test_conversation_patch_rejects_wrong_field_types(self, summary, update):
+        client = Client(HTTP_HOST='localhost')
+        bodies = (
+            {'title': 42},
+            {'title': 'Lease', 'notes': ['v2']},
+            {'title': 'Lease', 'content_hash': 123},
+            {'new_document_content': {'text': '# Lease'}, 'base_version': 1},
+            {'new_document_content': 7, 'base_version': 1},
+            {'document_delta': 'Rent is $1200.', 'base_version': 1},
+            {'document_delta': [[0, 2], 5], 'base_version': 1},
+            {'new_messages': ['Hello']},
+        )
+        for body in bodies:
+            with self.subTest(body=body):
+                response = client.patch(f'/api/conversations/{ObjectId()}/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+        summary.assert_not_called()
+        update.assert_not_called()
+
+
+class SearchSnippetTests(SimpleTestCase):
+    def test_searchable_text_drops_markup_and_urls(self):
+        text = searchable_text('# Lease\n\n* **Tenant:** [Jane](https://x.test)\n\n![Signature](https://x.test/sig.png)\n')
+
+        self.assertEqual(text, 'Lease Tenant: Jane Signature')
+
+    def test_versions_are_indexed_by_the_text_they_added(self):
+        base = '# Lease\n\nRent is due monthly.\n'
+
+        self.assertEqual(version_search_text(base + '\nPets are allowed.\n', base), 'Pets are allowed.')
+
+    def test_snippets_highlight_stems_and_phrases_and_escape_html(self):
+        text = 'The <b>tenants</b> pay rent. ' + 'Filler words here. ' * 20 + 'Late rent payment incurs a fee.'
+        pattern = highlight_pattern('tenant "late rent" -fee')
+        snippets = make_snippets(text, pattern)
+
+        self.assertEqual(len(snippets), 2)
+        self.assertTrue(snippets[0].startswith('The &lt;b&gt;<mark>tenants</mark>&lt;/b&gt; pay rent.'))
+        self.assertTrue(snippets[1].startswith('…'))
+        self.assertIn('<mark>Late rent</mark> payment incurs a fee.', snippets[1])
+        self.assertIsNone(highlight_pattern('-fee'))
+
+
+class PdfAnalysisTests(SimpleTestCase):
+    def test_chunks_follow_page_order_and_split_long_pages(self):
+        pages = [(0, 'a' * 30), (1, 'b' * 30), (2, 'c' * 150)]
+        chunks = list(chunk_pages(pages, 100))
+
+        self.assertEqual([(c['first_page'], c['last_page']) for c in chunks], [(1, 2), (3, 3), (3, 3)])
+        self.assertTrue(all(len(c['text']) <= 101 for c in chunks))
+        self.assertIn('[Page 2]', chunks[0]['text'])
+
+    def test_streams_findings_per_chunk_then_a_summary(self):
+        document = '\n\n'.join(f'## Clause {n}\n\n' + 'The tenant pays rent monthly. ' * 40 for n in range(12))
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf:
+            pdf.write(render_pdf(document, 'native'))
+            pdf.flush()
+
+            def reply(system_instruction, contents):
+                if 'summary' in system_instruction:
+                    return '```json{"summary": "A lease.", "findings": [{"title": "Rent", "severity": "HIGH", "page": 1}]}```'
+                return 'Here you go: {"findings": [{"title": "Monthly rent", "detail": "Due monthly."}, "junk"]}'
+
+            router = LLMRouter([FakeProvider(reply=reply)])
+            events = list(PdfAnalyzer(workers=0, pages_per_task=2, chunk_chars=2000, llm_concurrency=2).analyze(pdf.name, router))
+
+        names = [event for event, _ in events]
+        self.assertEqual((names[0], names[-2], names[-1]), ('start', 'summary', 'done'))
+        chunks = [data for event, data in events if event == 'findings']
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(events[-1][1]['chunks'], len(chunks))
+        self.assertEqual(chunks[0]['findings'][0]['page'], chunks[0]['first_page'])
+        self.assertEqual(events[-2][1], {'summary': 'A lease.', 'findings': [
+            {'title': 'Rent', 'category': 'other', 'severity': 'high', 'page': 1, 'detail': '', 'quote': ''},
+        ]})
+
+
+class ServerTimingTests(SimpleTestCase):
+    def test_request_spans_are_summed_into_server_timing(self):
+        @timed('mongo.test_lookup')
+        def lookup():
+            return 'doc'
+
+        def view(request):
+            lookup()
+            lookup()
+            with span('json.test_extract'):
+                pass
+            return HttpResponse('ok')
+
+        response = ServerTimingMiddleware(view)(RequestFactory().get('/'))
+        entries = response['Server-Timing'].split(', ')
+
+        self.assertRegex(entries[0], r'^mongo\.test_lookup;dur=[\d.]+;desc="2 calls"$')
+        self.assertRegex(entries[1], r'^json\.test_extract;dur=[\d.]+$')
+        self.assertRegex(entries[2], r'^total;dur=[\d.]+$')
+        self.assertIn(b'docgen_stage_duration_seconds_count{stage="mongo.test_lookup"} 2.0', exposition()[0])
+
+    def test_spans_outside_a_request_only_feed_histograms(self):
+        with span('json.test_outside'):
+            pass
+
+        self.assertEqual(server_timing([]), '')
+        self.assertIn(b'docgen_stage_duration_seconds_count{stage="json.test_outside"} 1.0', exposition()[0])
+
+
+class BenchmarkCoverageTests(SimpleTestCase):
+    def test_every_route_has_a_benchmark_scenario(self):
+        from benchmarks.routes import scenarios
+        from .urls import urlpatterns
+
+        fixture = {key: 'id' for key in ('pk', 'put_pk', 'patch_pk', 'chat_pk')}
+        fixture.update({'document': '# Lease\n', 'latest': 1, 'middle': 0})
+        covered = {scenario.route for scenario in scenarios(fixture)}
+
+        self.assertEqual({str(pattern.pattern) for pattern in urlpatterns} - covered, set())
+
+
+class LazyImportTests(SimpleTestCase):
+    # Slow to import; loaded on first use (or by the warm-up thread), never by the URLconf.
+    DEFERRED_MODULES = ('cloudinary', 'google.generativeai', 'xhtml2pdf', 'reportlab', 'langchain_core', 'motor', 'httpx', 'PIL')
+
+    def test_urlconf_import_defers_heavy_sdks_and_mongo(self):
+        code = (
+            'import sys, django; django.setup(); import generator.urls, generator.mongo_client as mongo; '
+            f'print([m for m in {self.DEFERRED_MODULES!r} if m in sys.modules], mongo._db is None)'
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'legal_doc_generator.settings', 'WARMUP_ON_START': 'false'}
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[] True')
@@ -1,13 +1,28 @@
 from django.urls import path
-from .views import chat, download_pdf, conversation_list, conversation_detail, download_latest_conversation_pdf, upload_signature, get_version_content, download_version_pdf
+from . import async_views
+from .views import chat, chat_stream, analyze_pdf, download_pdf, conversation_list, conversation_detail, search, download_latest_conversation_pdf, upload_signature, get_version_content, download_version_pdf, preview_latest_conversation_html, preview_version_html, export_pdfs, get_version_diff, metrics
 
 urlpatterns = [
     path('chat/', chat, name='chat'),
+    path('chat/stream/', chat_stream, name='chat-stream'),
     path('download-pdf/', download_pdf, name='download_pdf'), # This is for download_pdf from markdown string
     path('upload-signature/', upload_signature, name='upload-signature'),
+    path('analyze-pdf/', analyze_pdf, name='analyze-pdf'),
+    path('export/', export_pdfs, name='export-pdfs'),
+    path('metrics/', metrics, name='metrics'),
     path('conversations/', conversation_list, name='conversation-list'),
+    path('conversations/search/', search, name='conversation-search'),
     path('conversations/<str:pk>/', conversation_detail, name='conversation-detail'),
     path('conversations/<str:pk>/download/', download_latest_conversation_pdf, name='download-latest-conversation-pdf'),
     path('conversations/<str:pk>/versions/<int:version_number>/content/', get_version_content, name='get-version-content'),
     path('conversations/<str:pk>/versions/<int:version_number>/download/', download_version_pdf, name='download-version-pdf'),
+    path('conversations/<str:pk>/versions/<int:version_a>/diff/<int:version_b>/', get_version_diff, name='get-version-diff'),
+    path('conversations/<str:pk>/preview/', preview_latest_conversation_html, name='preview-latest-conversation-html'),
+    path('conversations/<str:pk>/versions/<int:version_number>/preview/', preview_version_html, name='preview-version-html'),
+    # Async (ASGI) variants of the chat and read endpoints; see ASYNC.md.
+    path('async/chat/', async_views.chat, name='async-chat'),
+    path('async/chat/stream/', async_views.chat_stream, name='async-chat-stream'),
+    path('async/conversations/', async_views.conversation_list, name='async-conversation-list'),
+    path('async/conversations/<str:pk>/', async_views.conversation_detail, name='async-conversation-detail'),
+    path('async/conversations/<str:pk>/versions/<int:version_number>/content/', async_views.get_version_content, name='async-get-version-content'),
 ]
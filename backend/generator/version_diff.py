@@ -0,0 +1,131 @@
+import re
+from difflib import SequenceMatcher
+
+
+# Words, runs of whitespace and single punctuation marks (so markdown syntax
+# such as `**` or `|` is diffed on its own).
+TOKEN_RE = re.compile(r'\s+|\w+|[^\w\s]')
+
+# Replaced regions larger than this are diffed by line only; a word-level
+# diff of a rewritten document is both slow and unreadable.
+WORD_DIFF_MAX_LINES = 200
+
+# Block markers kept outside redline markup so the line keeps its structure.
+BLOCK_PREFIX_RE = re.compile(r'^\s*(?:(?:#{1,6}|[-*+]|\d+[.)]|>)[ \t]+)*')
+
+
+def diff_versions(old, new):
+    """
+    Line diff between two document versions, with word-level detail inside
+    changed lines. Only changed regions are included, so the size of the
+    result follows the size of the edit.
+
+    Each hunk gives 0-based line spans (`old_start`/`old_lines` in the old
+    version, `new_start`/`new_lines` in the new one) and `ops`, a list of
+    `[op, text]` pairs where op is '=' (unchanged words inside the hunk),
+    '-' (removed) or '+' (added).
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    hunks = []
+    removed = added = 0
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        hunks.append({
+            'old_start': i1,
+            'old_lines': i2 - i1,
+            'new_start': j1,
+            'new_lines': j2 - j1,
+            'ops': _hunk_ops(tag, ''.join(old_lines[i1:i2]), ''.join(new_lines[j1:j2]), (i2 - i1) + (j2 - j1)),
+        })
+        removed += i2 - i1
+        added += j2 - j1
+    return {'hunks': hunks, 'stats': {'hunks': len(hunks), 'lines_removed': removed, 'lines_added': added}}
+
+
+def _hunk_ops(tag, old_text, new_text, line_count):
+    if tag == 'replace' and line_count <= WORD_DIFF_MAX_LINES:
+        return word_ops(old_text, new_text)
+    ops = []
+    if old_text:
+        ops.append(['-', old_text])
+    if new_text:
+        ops.append(['+', new_text])
+    return ops
+
+
+def word_ops(old_text, new_text):
+    """Word-level `[op, text]` pairs turning `old_text` into `new_text`."""
+    old_tokens = TOKEN_RE.findall(old_text)
+    new_tokens = TOKEN_RE.findall(new_text)
+    ops = []
+
+    def add(op, tokens):
+        text = ''.join(tokens)
+        if not text:
+            return
+        if ops and ops[-1][0] == op:
+            ops[-1][1] += text
+        else:
+            ops.append([op, text])
+
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            add('=', old_tokens[i1:i2])
+            continue
+        add('-', old_tokens[i1:i2])
+        add('+', new_tokens[j1:j2])
+    return ops
+
+
+def redline_markdown(old, new, patch=None):
+    """
+    The new version as markdown with removed text in <del> and added text in
+    <ins>, for rendering with the regular stylesheet. Markup is applied line by
+    line, leaving heading/list markers and table pipes outside the tags so the
+    document structure survives.
+    """
+    patch = patch or diff_versions(old, new)
+    new_lines = new.splitlines(keepends=True)
+    parts = []
+    position = 0
+    for hunk in patch['hunks']:
+        parts.extend(new_lines[position:hunk['new_start']])
+        parts.append(_redline_hunk(hunk['ops']))
+        position = hunk['new_start'] + hunk['new_lines']
+    parts.extend(new_lines[position:])
+    return ''.join(parts)
+
+
+def _redline_hunk(ops):
+    lines = [[]]
+    for op, text in ops:
+        for index, piece in enumerate(text.split('\n')):
+            if index:
+                lines.append([])
+            if piece:
+                lines[-1].append((op, piece))
+    return '\n'.join(_redline_line(segments) for segments in lines)
+
+
+def _redline_line(segments):
+    out = []
+    for index, (op, text) in enumerate(segments):
+        if op == '=':
+            out.append(text)
+            continue
+        if index == 0:
+            prefix = BLOCK_PREFIX_RE.match(text).group(0)
+            out.append(prefix)
+            text = text[len(prefix):]
+        if not text.strip():
+            # Whitespace-only changes have nothing to strike through.
+            out.append(text if op == '+' else '')
+            continue
+        tag = 'del' if op == '-' else 'ins'
+        # Table pipes stay outside the tags so rows keep their cells.
+        out.append('|'.join(f'<{tag}>{cell}</{tag}>' if cell.strip() else cell for cell in text.split('|')))
+    return ''.join(out)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import zlib
+from difflib import SequenceMatcher
+
+from bson.binary import Binary
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def make_delta(base, target):
+    """
+    Line-level delta from `base` to `target`.
+
+    The delta is a list of ops: `[start, end]` copies base lines start..end,
+    and a string inserts literal text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base, ops):
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, list):
+            parts.extend(base_lines[op[0]:op[1]])
+        else:
+            parts.append(op)
+    return ''.join(parts)
+
+
+def apply_untrusted_delta(base, ops):
+    """
+    apply_delta for deltas sent by clients: raises ValueError unless `ops` is
+    a list of strings and in-range `[start, end]` copies that move forward
+    through the base without overlapping, as make_delta produces. That keeps
+    the result no larger than the base plus the delta itself, however many
+    copy operations a client sends.
+    """
+    line_count = len(base.splitlines(keepends=True))
+    if not isinstance(ops, list):
+        raise ValueError('The delta must be a list of operations.')
+    copied_to = 0
+    for op in ops:
+        if isinstance(op, str):
+            continue
+        if not (
+            isinstance(op, list) and len(op) == 2
+            and all(isinstance(n, int) and not isinstance(n, bool) for n in op)
+            and 0 <= op[0] <= op[1] <= line_count
+        ):
+            raise ValueError(f'Invalid delta operation: {op!r}. Use [start, end] line ranges of the base version or strings.')
+        if op[0] < copied_to:
+            raise ValueError(f'Invalid delta operation: {op!r}. Copied line ranges must be in order and must not overlap.')
+        copied_to = op[1]
+    return apply_delta(base, ops)
+
+
+def _pack(value):
+    return Binary(zlib.compress(json.dumps(value).encode('utf-8'), 6))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def encode_version(content, version_number, previous_content, snapshot_interval):
+    """
+    Returns the storage fields for a new version.
+
+    Every `snapshot_interval`-th version (and any version without a stored
+    predecessor) is a compressed full snapshot; the rest are compressed deltas
+    against the previous version, falling back to a snapshot when the delta
+    would not be smaller.
+    """
+    snapshot = _pack(content)
+    fields = {
+        'size': len(content),
+        'content_hash': content_hash(content),
+    }
+    if previous_content is None or version_number % snapshot_interval == 0:
+        return {**fields, 'kind': 'snapshot', 'data': snapshot}
+
+    delta = _pack(make_delta(previous_content, content))
+    if len(delta) >= len(snapshot):
+        return {**fields, 'kind': 'snapshot', 'data': snapshot}
+    return {**fields, 'kind': 'delta', 'data': delta}
+
+
+def rebuild_version(records):
+    """
+    Rebuilds a version's content from its chain of records, newest first, as
+    returned by a descending `version_number` query. Stops at the first
+    snapshot, so only the records needed are consumed from the cursor.
+    """
+    deltas = []
+    for record in records:
+        if record['kind'] == 'snapshot':
+            content = _unpack(record['data'])
+            for delta in reversed(deltas):
+                content = apply_delta(content, delta)
+            return content
+        deltas.append(_unpack(record['data']))
+    return None
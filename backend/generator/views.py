@@ -1,98 +1,346 @@
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
 from django.conf import settings
-import google.generativeai as genai
 import json
-from django.http import FileResponse
-import markdown
-from xhtml2pdf import pisa
+import logging
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.handlers.asgi import ASGIRequest
 from io import BytesIO
-from .mongo_client import get_all_conversations, get_conversation_by_id, save_conversation, update_conversation, delete_conversation, get_document_version_content
+from .mongo_client import list_conversations, search_conversations, get_conversation_by_id, get_conversation_summary, get_conversation_revision, save_conversation, update_conversation, delete_conversation, get_document_version_content, get_document_version_hash, append_conversation_messages, find_version_diff, record_version_diff, VersionConflict
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.utils.crypto import get_random_string
+from django.utils.crypto import constant_time_compare, get_random_string
 import os
-import cloudinary.uploader
+import tempfile
+from .document_patch import PatchError, apply_patches
+from .http_caching import conversation_etag, etag_matches, has_conditional_request, diff_etag, not_modified, pdf_etag, preview_etag, set_validators, version_etag
+from .version_diff import diff_versions, redline_markdown
+from .version_store import apply_untrusted_delta, content_hash
+from .bulk_export import export_items, render_export, stream_export_zip
+from .chat_requests import (
+    NO_PROVIDER_ERROR, STREAM_OPEN, ChatEventEncoder, ChatRequestError,
+    conversation_messages, latest_version_number, parse_chat_request, turn_messages,
+)
+from .llm_providers import get_llm_router
+from .metrics import exposition, timed
+from .pdf_analysis import PdfAnalysisError, count_pages, pdf_analyzer
+from .pdf_cache import PdfCache, pdf_cache
+from .pdf_pool import PdfRenderBusy, PdfRenderTimeout, pdf_render_pool, section_html_cache
+from .pdf_renderer import PDF_RENDERERS, PDF_STYLE_CSS, REDLINE_RENDERER, render_html_document, stylesheet
+from .signatures import PendingSignatureUpload, get_or_upload_signature
+from .streaming import aiterate_sync, sse_event
+
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_PAGE_SIZE = 20
+MAX_CONVERSATION_PAGE_SIZE = 100
+# Ranking is merged in memory, so search pages stop this deep.
+MAX_SEARCH_RESULTS = 500
+
+
+SYSTEM_INSTRUCTION = """You are a helpful legal assistant. Your goal is to help the user create a legal document.
+- First, ask follow-up questions to gather all the necessary details.
+- When you have enough information, generate the full legal document.
+- The document **must** be in well-structured **Markdown format**. Use headings (`#`, `##`), lists (`*`, `-`), bold (`**text**`), and italics (`*text`*) to create a professional and readable document.
+- When you are ready to generate the document, provide it in a JSON format like this: ```json{"type": "document", "text": "...your Markdown document here..."}```.
+- If the user asks to update some information, you must look for the previous document you generated in the conversation history. You will use that document as the basis for your new version.
+- You must then regenerate the **entire** document, incorporating the user's requested changes, and provide it again in the same JSON format. Do not just provide the updated line or a confirmation message.
+- **Signature Handling:** If the user uploads a signature, you will see a system message like `(System: The user has uploaded a signature...)` with a URL. When you generate the document, you **must** include this signature at the appropriate signature lines using the provided URL in the correct markdown format: `![Signature](URL)`. **Do NOT acknowledge the system message about the signature upload in your conversational response.**
+"""
+
+PATCH_SYSTEM_INSTRUCTION = """You are a helpful legal assistant. Your goal is to help the user create a legal document.
+- First, ask follow-up questions to gather all the necessary details.
+- When you have enough information, generate the full legal document.
+- The document **must** be in well-structured **Markdown format**. Use headings (`#`, `##`), lists (`*`, `-`), bold (`**text**`), and italics (`*text`*) to create a professional and readable document.
+- When you are ready to generate the document, provide it in a JSON format like this: ```json{"type": "document", "text": "...your Markdown document here..."}```.
+- If the user asks to update an existing document, do **not** regenerate it. The latest version is at the start of the conversation history. Reply only with targeted patches against it in this JSON format: ```json{"type": "patch", "patches": [...]}```.
+- Each patch is either `{"op": "replace_section", "path": ["Heading", "Sub-heading"], "text": "## Sub-heading\n...new section markdown, including its heading line..."}` to replace a whole section (the path lists the headings leading to it, exactly as written in the document), or `{"op": "replace_text", "find": "exact existing text", "replace": "new text"}` to change a span. The `find` text must appear exactly once in the document; include enough surrounding words to make it unique.
+- Use as few and as small patches as possible. Do not include a confirmation message.
+- **Signature Handling:** If the user uploads a signature, you will see a system message like `(System: The user has uploaded a signature...)` with a URL. When you generate the document, you **must** include this signature at the appropriate signature lines using the provided URL in the correct markdown format: `![Signature](URL)`. **Do NOT acknowledge the system message about the signature upload in your conversational response.**
+"""
+
+PATCH_FALLBACK_PROMPT = """(System: Your patch could not be applied to the latest document: {error}. Regenerate the **entire** updated document instead and provide it in the ```json{{"type": "document", "text": "..."}}``` format.)"""
+
+
+def _attach_signature(request, messages):
+    """
+    Starts uploading an attached signature (if any) and tells the model where to
+    place it. The upload runs concurrently with generation under a deterministic
+    public_id, so its URL is known up front. Returns the PendingSignatureUpload,
+    which must be waited on before the reply is returned or saved, or None.
+    """
+    signature_file = request.FILES.get('signature')
+    if not signature_file:
+        return None
+    signature_upload = PendingSignatureUpload(signature_file)
+    # Append a system message to the user's message
+    messages[-1]['text'] += f"\n\n(System: The user has uploaded a signature. Please place it in the appropriate section of the document using the following markdown: ![Signature]({signature_upload.url}))"
+    return signature_upload
 
-from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate, AIMessagePromptTemplate
+
+def _resolve_chat_messages(data, streaming=False):
+    """
+    Returns (messages, conversation, patch_mode) for a chat request, loading
+    the stored conversation's history when one is given. Raises ChatRequestError.
+    """
+    messages, conversation_id, new_message, patch_mode = parse_chat_request(data, streaming)
+    if messages is not None:
+        return messages, None, patch_mode
+
+    conversation = get_conversation_by_id(conversation_id)
+    if not conversation:
+        raise ChatRequestError('Conversation not found', status.HTTP_404_NOT_FOUND)
+    version_number = latest_version_number(conversation)
+    conversation['latest_document'] = None
+    if version_number is not None:
+        conversation['latest_document'] = get_document_version_content(conversation_id, version_number)
+    return conversation_messages(conversation, new_message), conversation, patch_mode
+
+
+def _store_chat_turn(conversation_id, user_message, payload):
+    """Appends the user's message and the model's reply to a stored conversation."""
+    if not append_conversation_messages(conversation_id, turn_messages(user_message, payload)):
+        logger.error("Error storing chat turn for conversation %s", conversation_id)
+
+
+def _start_chat_session(messages, system_instruction=SYSTEM_INSTRUCTION):
+    """
+    Builds a chat session on the shared LLM router from the client's message history.
+    Returns the session and the text of the message to send.
+    """
+    # Separate history from the current message
+    history = messages[:-1]
+    current_message = messages[-1]['text']
+
+    gemini_history = []
+    for message in history:
+        role = 'user' if message['sender'] == 'user' else 'model'
+        gemini_history.append({'role': role, 'parts': [message['text']]})
+
+    return get_llm_router().start_chat(system_instruction, gemini_history), current_message
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def chat(request):
-    from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate, AIMessagePromptTemplate
     """
     API endpoint for the conversational legal document generator.
     """
-    if not settings.GEMINI_API_KEY or settings.GEMINI_API_KEY == '':
-        return Response({'error': 'GEMINI_API_KEY is not configured in your .env file or is empty.'}, status=500)
+    if not get_llm_router().providers:
+        return Response({'error': NO_PROVIDER_ERROR}, status=500)
 
-    messages = request.data.get('messages', [])
-    if not messages:
-        return Response({'error': 'Messages are required'}, status=400)
+    try:
+        messages, conversation, patch_mode = _resolve_chat_messages(request.data)
+    except ChatRequestError as e:
+        return Response({'error': str(e)}, status=e.status)
+    user_message = messages[-1]['text']
 
     try:
-        signature_file = request.FILES.get('signature')
-        if signature_file:
-            try:
-                upload_result = cloudinary.uploader.upload(signature_file)
-                signature_url = upload_result['secure_url']
-                # Append a system message to the user's message
-                messages[-1]['text'] += f"\n\n(System: The user has uploaded a signature. Please place it in the appropriate section of the document using the following markdown: ![Signature]({signature_url}))"
-            except Exception as e:
-                return Response({'error': f'Error uploading signature: {e}'}, status=500)
+        signature_upload = _attach_signature(request, messages)
 
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+        system_instruction = PATCH_SYSTEM_INSTRUCTION if patch_mode else SYSTEM_INSTRUCTION
+        chat_session, current_message = _start_chat_session(messages, system_instruction)
+        response = chat_session.send_message(current_message)
+        if signature_upload:
+            # The reply may reference the signature URL; it must exist before we answer.
+            signature_upload.wait()
 
-        system_instruction_text = """You are a helpful legal assistant. Your goal is to help the user create a legal document.
-- First, ask follow-up questions to gather all the necessary details.
-- When you have enough information, generate the full legal document.
-- The document **must** be in well-structured **Markdown format**. Use headings (`#`, `##`), lists (`*`, `-`), bold (`**text**`), and italics (`*text`*) to create a professional and readable document.
-- When you are ready to generate the document, provide it in a JSON format like this: ```json{"type": "document", "text": "...your Markdown document here..."}```.
-- If the user asks to update some information, you must look for the previous document you generated in the conversation history. You will use that document as the basis for your new version.
-- You must then regenerate the **entire** document, incorporating the user's requested changes, and provide it again in the same JSON format. Do not just provide the updated line or a confirmation message.
-- **Signature Handling:** If the user uploads a signature, you will see a system message like `(System: The user has uploaded a signature...)` with a URL. When you generate the document, you **must** include this signature at the appropriate signature lines using the provided URL in the correct markdown format: `![Signature](URL)`. **Do NOT acknowledge the system message about the signature upload in your conversational response.**
-"""
+        logger.debug("Model reply from %s: %d characters", response.provider, len(response.text))
 
-        model = genai.GenerativeModel(
-            'models/gemini-2.5-flash-lite',
-            system_instruction=system_instruction_text
-        )
+        document_data = _parse_model_reply(response.text)
+        if patch_mode and document_data.get('type') in ('patch', 'document'):
+            uploaded_by = request.user.username if request.user.is_authenticated else 'anonymous'
+            document_data = _apply_edit_reply(chat_session, conversation, document_data, uploaded_by)
+
+        if conversation:
+            _store_chat_turn(conversation['_id'], user_message, document_data)
+        return Response(document_data)
 
-        # Separate history from the current message
-        history = messages[:-1]
-        current_message = messages[-1]['text']
+    except Exception as e:
+        logger.exception("Error in chat view: %s", e)
+        return Response({'error': str(e)}, status=500)
 
-        gemini_history = []
-        for message in history:
-            role = 'user' if message['sender'] == 'user' else 'model'
-            gemini_history.append({'role': role, 'parts': [message['text']]})
 
-        chat_session = model.start_chat(history=gemini_history)
-        response = chat_session.send_message(current_message)
+@timed('json.extract')
+def _parse_model_reply(text):
+    """Turns raw model text into a reply payload (question, document or patch)."""
+    # The response from the model is just text, so we need to parse it to see
+    # if it is a question or the final document.
+    # For now, we will assume that if the response contains "```json", it is the final document in JSON format.
+    # Otherwise, it is a question.
+    if '```json' in text:
+        # It's the final document
+        # Extract the JSON part from the response
+        json_str = text.split('```json')[1].split('```')[0]
+        return json.loads(json_str)
+    # It's a question
+    return {'type': 'question', 'text': text}
 
-        print(f"Raw model response object: {response}")
-        print(f"Model response text: {response.text}")
-
-        # The response from the model is just text, so we need to parse it to see
-        # if it is a question or the final document.
-        # For now, we will assume that if the response contains "```json", it is the final document in JSON format.
-        # Otherwise, it is a question.
-        if '```json' in response.text:
-            # It's the final document
-            # Extract the JSON part from the response
-            json_str = response.text.split('```json')[1].split('```')[0]
-            document_data = json.loads(json_str)
-            return Response(document_data)
-        else:
-            # It's a question
-            return Response({'type': 'question', 'text': response.text})
 
+def _apply_edit_reply(chat_session, conversation, reply, uploaded_by):
+    """
+    Applies a patch-mode reply to the latest stored version and saves the result
+    as a new document version. Falls back to asking the model for the full
+    document when the patch does not apply cleanly.
+    """
+    edit = 'full'
+    new_content = reply.get('text')
+    try:
+        if reply.get('type') == 'patch':
+            if conversation.get('latest_document') is None:
+                raise PatchError('There is no stored document version to patch.')
+            new_content = apply_patches(conversation['latest_document'], reply.get('patches'))
+            edit = 'patch'
+        elif not isinstance(new_content, str) or not new_content.strip():
+            raise PatchError('The reply contains no document text.')
+    except PatchError as e:
+        logger.warning("Edit did not apply cleanly, regenerating the full document: %s", e)
+        fallback = _parse_model_reply(chat_session.send_message(PATCH_FALLBACK_PROMPT.format(error=e)).text)
+        if fallback.get('type') == 'question':
+            return fallback
+        new_content = fallback.get('text')
+        if fallback.get('type') != 'document' or not isinstance(new_content, str) or not new_content.strip():
+            raise Exception('The model did not return the full document after a failed patch.')
+
+    notes = 'Patch edit via AI editor' if edit == 'patch' else 'Version update via AI editor'
+    if not update_conversation(conversation['_id'], None, None, new_content, uploaded_by=uploaded_by, notes=notes):
+        raise Exception('Failed to save the edited document version.')
+    return {'type': 'document', 'text': new_content, 'edit': edit}
+
+
+def _chat_event_stream(model_stream, on_complete=None, signature_upload=None):
+    """
+    Converts a model response stream into Server-Sent Events (see
+    ChatEventEncoder). `on_complete` is called with the final payload once the
+    stream has finished. A pending signature upload must complete before
+    `done` is sent.
+    """
+    encoder = ChatEventEncoder()
+    # Send something immediately so proxies and the browser commit to the stream.
+    yield STREAM_OPEN
+    try:
+        for chunk in model_stream:
+            yield from encoder.chunk(chunk)
+        frames, payload = encoder.end()
+        yield from frames
+        if signature_upload:
+            signature_upload.wait()
+        yield encoder.done(payload)
+        if on_complete:
+            on_complete(payload)
     except Exception as e:
-        print(f"Error in chat view: {e}")
-        print(f"Type of error: {type(e)}")
+        logger.exception("Error in chat_stream: %s", e)
+        yield encoder.error(e)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser, JSONParser])
+def chat_stream(request):
+    """
+    Streaming variant of `chat` that forwards model output as Server-Sent Events.
+    """
+    if not get_llm_router().providers:
+        return Response({'error': NO_PROVIDER_ERROR}, status=500)
+
+    try:
+        messages, conversation, _ = _resolve_chat_messages(request.data, streaming=True)
+    except ChatRequestError as e:
+        return Response({'error': str(e)}, status=e.status)
+    user_message = messages[-1]['text']
+
+    try:
+        signature_upload = _attach_signature(request, messages)
+        chat_session, current_message = _start_chat_session(messages)
+        model_stream = iter(chat_session.send_message(current_message, stream=True))
+    except Exception as e:
+        logger.exception("Error in chat_stream view: %s", e)
         return Response({'error': str(e)}, status=500)
 
+    on_complete = None
+    if conversation:
+        on_complete = lambda payload: _store_chat_turn(conversation['_id'], user_message, payload)
+
+    events = _chat_event_stream(model_stream, on_complete, signature_upload)
+    if isinstance(request._request, ASGIRequest):
+        # Under ASGI a sync iterator would be buffered in full before sending,
+        # so hand Django an async iterator that pulls each chunk off-thread.
+        events = aiterate_sync(events)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def analyze_pdf(request):
+    """
+    Analyzes an uploaded PDF (`file`) and streams what the model finds as
+    Server-Sent Events: `start`, `progress`, `findings` per chunk of pages,
+    `summary` and `done` (or `error`). See generator/pdf_analysis.py.
+    """
+    if not get_llm_router().providers:
+        return Response({'error': 'No LLM provider is configured. Set GEMINI_API_KEY (or another provider key) in your .env file.'}, status=500)
+    max_bytes = settings.PDF_ANALYZE_MAX_UPLOAD_BYTES
+    if int(request.META.get('CONTENT_LENGTH') or 0) > max_bytes:
+        return Response({'error': f'The PDF is larger than {max_bytes // (1024 * 1024)} MB.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    try:
+        # Write the upload straight to a temporary file, whatever its size, so
+        # extraction workers can read it from disk.
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+    except AttributeError:
+        # Already parsed, by the CSRF check of a session-authenticated request.
+        pass
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'A PDF file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    path, cleanup = _upload_path(upload)
+    try:
+        page_count = count_pages(path)
+    except PdfAnalysisError as e:
+        cleanup()
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if page_count > settings.PDF_ANALYZE_MAX_PAGES:
+        cleanup()
+        return Response({'error': f'The PDF has {page_count} pages; at most {settings.PDF_ANALYZE_MAX_PAGES} can be analyzed.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    events = _analysis_event_stream(upload, path, page_count, cleanup)
+    if isinstance(request._request, ASGIRequest):
+        events = aiterate_sync(events)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _upload_path(upload):
+    """
+    Returns (path, cleanup) for an uploaded file on disk. Uploads that were
+    already read into memory are copied to a temporary file chunk by chunk.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        return upload.temporary_file_path(), lambda: None
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as copy:
+        for chunk in upload.chunks():
+            copy.write(chunk)
+    return copy.name, lambda: os.unlink(copy.name)
+
+def _analysis_event_stream(upload, path, page_count, cleanup):
+    """Yields the analysis as SSE frames. Holds `upload` so its temporary file outlives the stream."""
+    try:
+        for event, data in pdf_analyzer.analyze(path, get_llm_router(), page_count):
+            yield sse_event(event, data)
+    except PdfAnalysisError as e:
+        yield sse_event('error', {'error': str(e)})
+    except Exception as e:
+        logger.exception("Error in analyze_pdf for %s: %s", upload.name, e)
+        yield sse_event('error', {'error': str(e)})
+    finally:
+        cleanup()
+
 
 @api_view(['POST'])
 def download_pdf(request):
@@ -102,142 +350,56 @@ def download_pdf(request):
     document_content = request.data.get('document_content')
     if not document_content:
         return Response({'error': 'Document content is required'}, status=400)
+    renderer = _pdf_renderer(request)
+    if renderer is None:
+        return _unknown_renderer_response()
 
     try:
-        pdf_file = _generate_pdf_from_markdown(document_content)
+        pdf_file = _generate_pdf_from_markdown(document_content, renderer)
         response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = 'attachment; filename="legal_document.pdf"'
         return response
+    except (PdfRenderBusy, PdfRenderTimeout) as e:
+        return _pdf_unavailable_response(e)
     except Exception as e:
         return Response({'error': f'Error generating PDF: {e}'}, status=500)
 
-def _generate_pdf_from_markdown(markdown_content):
+def _generate_pdf_from_markdown(markdown_content, renderer=None):
     """
     Helper function to convert markdown string to a PDF file response.
     This function is used by the download_pdf view.
     """
-    html_content = markdown.markdown(markdown_content)
-
-    pdf_style_css = """
-        @page {
-            size: a4 portrait;
-            margin: 1.2cm;
-        }
-        body {
-            font-family: "Times New Roman", Times, serif;
-            font-size: 11pt;
-            line-height: 1.3;
-            color: #000000;
-        }
-        h1, h2, h3, h4, h5, h6 {
-            font-family: "Times New Roman", Times, serif;
-            font-weight: bold;
-            color: #000000;
-            margin-top: 1.2em;
-            margin-bottom: 0.6em;
-            line-height: 1.15;
-        }
-        h1 {
-            font-size: 16pt;
-            text-align: center;
-            text-transform: uppercase;
-            margin-bottom: 1.5em;
-        }
-        h2 {
-            font-size: 14pt;
-            text-transform: uppercase;
-            border-bottom: 1px solid #000000;
-            padding-bottom: 0.2em;
-        }
-        h3 {
-            font-size: 12pt;
-            font-weight: bold;
-            text-decoration: underline;
-        }
-        p {
-            margin-bottom: 0.8em;
-            text-align: justify;
-            text-indent: 1.25cm; /* Indent first line of paragraphs */
-        }
-        /* Don't indent first paragraph after a heading */
-        h1 + p, h2 + p, h3 + p, h4 + p, h5 + p, h6 + p {
-            text-indent: 0;
-        }
-        ul, ol {
-            margin-bottom: 0.8em;
-            padding-left: 1.5cm;
-        }
-        li {
-            margin-bottom: 0.3em;
-            text-align: justify;
-        }
-        strong, b {
-            font-weight: bold;
-        }
-        em, i {
-            font-style: italic;
-        }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-            margin-bottom: 1em;
-            border: 1px solid #333333;
-        }
-        th, td {
-            border: 1px solid #333333;
-            padding: 6px;
-            text-align: left;
-            vertical-align: top;
-        }
-        th {
-            background-color: #e0e0e0;
-            font-weight: bold;
-        }
-        hr {
-            width: 250px;
-            margin-left: 0;
-            border: 0.5px solid #000;
-        }
-        /* Signature sizing and spacing */
-        img[alt~="signature"][alt~="landlord"] {
-            display: block;
-            width: 180px;
-            height: 80px;
-            object-fit: contain;
-            margin-top: 8mm;   /* place below landlord text */
-            margin-bottom: 0;
-        }
-        img[alt~="signature"][alt~="tenant"] {
-            display: block;
-            width: 180px;
-            height: 80px;
-            object-fit: contain;
-            margin-top: 0;
-            margin-bottom: 8mm; /* place above tenant text */
-        }
-        /* Remove header and footer for a more traditional look */
-    """
-
-    full_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Legal Document</title>
-        <meta charset=\"utf-8\">
-        <style>{pdf_style_css}</style>
-    </head>
-    <body>{html_content}</body>
-    </html>
-    """
-
-    result_file = BytesIO()
-    pisa_status = pisa.CreatePDF(full_html, dest=result_file)
-
-    if pisa_status.err:
-        raise Exception(f'PDF generation error: {pisa_status.err}')
-
-    result_file.seek(0)
-    return result_file
+    return BytesIO(pdf_render_pool.render(markdown_content, renderer or settings.PDF_RENDERER))
+
+def _pdf_renderer(request):
+    """
+    The PDF renderer for a request: the `renderer` query parameter (or, for
+    POST, body field) when given, otherwise settings.PDF_RENDERER. Returns
+    None for an unknown name.
+    """
+    renderer = request.query_params.get('renderer') or (request.data.get('renderer') if request.method == 'POST' else None)
+    renderer = renderer or settings.PDF_RENDERER
+    return renderer if renderer in PDF_RENDERERS else None
+
+def _unknown_renderer_response():
+    return Response({'error': f"Unknown PDF renderer. Use one of: {', '.join(PDF_RENDERERS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+def _get_cached_pdf(markdown_content, renderer=None):
+    """
+    Returns a stored document version as a PDF file, rendering it at most once.
+    Stored versions never change, so the result is cached by content hash.
+    Saving a version queues a background render into the same cache's disk
+    tier (see pdf_jobs), so this only renders if that job has not finished.
+    """
+    return BytesIO(pdf_cache.get_or_render(markdown_content, pdf_render_pool.render, renderer or settings.PDF_RENDERER))
+
+def _pdf_unavailable_response(error):
+    """Maps render pool backpressure/timeouts to 503/504 responses."""
+    if isinstance(error, PdfRenderBusy):
+        response = Response({'error': str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(error.retry_after)
+        return response
+    return Response({'error': str(error)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
@@ -250,8 +412,8 @@ def upload_signature(request):
         return Response({'error': 'No file uploaded. Use form field name "signature".'}, status=400)
 
     try:
-        upload_result = cloudinary.uploader.upload(file_obj)
-        return Response({'url': upload_result['secure_url']}, status=201)
+        # Identical images are uploaded once; later uploads return the stored URL.
+        return Response({'url': get_or_upload_signature(file_obj.read(), file_obj.name)}, status=201)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -260,19 +422,32 @@ def upload_signature(request):
 def download_latest_conversation_pdf(request, pk):
     """
     Downloads the latest document content from a conversation as a PDF.
+    The URL's content changes with each new version, so clients must revalidate.
     """
-    conversation = get_conversation_by_id(pk)
-    if not conversation or 'document_versions' not in conversation or not conversation['document_versions']:
+    renderer = _pdf_renderer(request)
+    if renderer is None:
+        return _unknown_renderer_response()
+    conversation = get_conversation_summary(pk)
+    if conversation and conversation.get('latest_version') is not None and has_conditional_request(request):
+        latest_hash = get_document_version_hash(pk, conversation['latest_version'])
+        if latest_hash and etag_matches(request, pdf_etag(latest_hash, renderer)):
+            return not_modified(pdf_etag(latest_hash, renderer), 'no-cache')
+
+    latest_version_content = None
+    if conversation and conversation.get('latest_version') is not None:
+        # Get the content of the latest version
+        latest_version_content = get_document_version_content(pk, conversation['latest_version'])
+    if latest_version_content is None:
         return Response({'error': 'No document content found for this conversation.'}, status=status.HTTP_404_NOT_FOUND)
 
     try:
-        # Get the content of the latest version
-        latest_version_content = conversation['document_versions'][-1]['content']
-        pdf_file = _generate_pdf_from_markdown(latest_version_content)
+        pdf_file = _get_cached_pdf(latest_version_content, renderer)
         
         response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="{conversation.get("title", "legal_document")}.pdf"'
-        return response
+        return set_validators(response, pdf_etag(content_hash(latest_version_content), renderer), 'no-cache')
+    except (PdfRenderBusy, PdfRenderTimeout) as e:
+        return _pdf_unavailable_response(e)
     except Exception as e:
         return Response({'error': f'Error generating PDF: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -280,52 +455,221 @@ def download_latest_conversation_pdf(request, pk):
 def get_version_content(request, pk, version_number):
     """
     Retrieves the content of a specific document version from a conversation.
+    Versions are immutable, so the response carries a strong ETag (the content
+    hash) and a matching If-None-Match is answered without reading the content.
     """
     try:
-        conversation = get_conversation_by_id(pk)
-        if not conversation or 'document_versions' not in conversation or not conversation['document_versions']:
-            return Response({'error': 'No document versions found for this conversation.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        version = next((v for v in conversation['document_versions'] if v['version_number'] == version_number), None)
-        if version:
-            return Response({'content': version['content']}, status=status.HTTP_200_OK)
+        if has_conditional_request(request):
+            version_hash = get_document_version_hash(pk, version_number)
+            if version_hash and etag_matches(request, version_etag(version_hash)):
+                return not_modified(version_etag(version_hash), settings.VERSION_CACHE_CONTROL)
+
+        content = get_document_version_content(pk, version_number)
+        if content is not None:
+            response = Response({'content': content}, status=status.HTTP_200_OK)
+            return set_validators(response, version_etag(content_hash(content)), settings.VERSION_CACHE_CONTROL)
         return Response({'error': 'Version content not found'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        print(f"Error in get_version_content: {e}")
+        logger.exception("Error in get_version_content: %s", e)
         return Response({'error': f'Error retrieving version content: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 def download_version_pdf(request, pk, version_number):
     """
     Downloads a specific document version from a conversation as a PDF.
+    A matching If-None-Match skips both the content read and the render.
     """
+    renderer = _pdf_renderer(request)
+    if renderer is None:
+        return _unknown_renderer_response()
     try:
-        conversation = get_conversation_by_id(pk)
-        if not conversation or 'document_versions' not in conversation or not conversation['document_versions']:
+        if has_conditional_request(request):
+            version_hash = get_document_version_hash(pk, version_number)
+            if version_hash and etag_matches(request, pdf_etag(version_hash, renderer)):
+                return not_modified(pdf_etag(version_hash, renderer), settings.VERSION_CACHE_CONTROL)
+
+        conversation = get_conversation_summary(pk)
+        if not conversation:
             return Response({'error': 'No document versions found for this conversation.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        version = next((v for v in conversation['document_versions'] if v['version_number'] == version_number), None)
-        if not version:
+
+        content = get_document_version_content(pk, version_number)
+        if content is None:
             return Response({'error': 'Version content not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        pdf_file = _generate_pdf_from_markdown(version['content'])
-        filename = f"{conversation.get("title", "legal_document")}_v{version_number}.pdf"
+        pdf_file = _get_cached_pdf(content, renderer)
+        filename = f"{conversation.get('title', 'legal_document')}_v{version_number}.pdf"
         
         response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        return set_validators(response, pdf_etag(content_hash(content), renderer), settings.VERSION_CACHE_CONTROL)
+    except (PdfRenderBusy, PdfRenderTimeout) as e:
+        return _pdf_unavailable_response(e)
     except Exception as e:
-        print(f"Error in download_version_pdf: {e}")
+        logger.exception("Error in download_version_pdf: %s", e)
         return Response({'error': f'Error generating PDF: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _html_preview_response(markdown_content, css=PDF_STYLE_CSS):
+    """
+    The document as a standalone HTML page styled like the PDF. The HTML comes
+    from the same per-section cache as PDF renders, so previewing a new version
+    only converts the sections that changed.
+    """
+    response = HttpResponse(render_html_document(section_html_cache.render(markdown_content), css), content_type='text/html; charset=utf-8')
+    # Document markdown may contain raw HTML: never run scripts from it on this origin.
+    response['Content-Security-Policy'] = "sandbox; default-src 'none'; img-src https: data:; style-src 'unsafe-inline'"
+    return response
+
+@api_view(['GET'])
+def preview_latest_conversation_html(request, pk):
+    """
+    Previews the latest document content from a conversation as HTML.
+    The URL's content changes with each new version, so clients must revalidate.
+    """
+    conversation = get_conversation_summary(pk)
+    if conversation and conversation.get('latest_version') is not None and has_conditional_request(request):
+        latest_hash = get_document_version_hash(pk, conversation['latest_version'])
+        if latest_hash and etag_matches(request, preview_etag(latest_hash)):
+            return not_modified(preview_etag(latest_hash), 'no-cache')
+
+    latest_version_content = None
+    if conversation and conversation.get('latest_version') is not None:
+        latest_version_content = get_document_version_content(pk, conversation['latest_version'])
+    if latest_version_content is None:
+        return Response({'error': 'No document content found for this conversation.'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        response = _html_preview_response(latest_version_content)
+        return set_validators(response, preview_etag(content_hash(latest_version_content)), 'no-cache')
+    except Exception as e:
+        logger.exception("Error in preview_latest_conversation_html: %s", e)
+        return Response({'error': f'Error rendering preview: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def preview_version_html(request, pk, version_number):
+    """
+    Previews a specific document version as HTML.
+    A matching If-None-Match skips both the content read and the conversion.
+    """
+    try:
+        if has_conditional_request(request):
+            version_hash = get_document_version_hash(pk, version_number)
+            if version_hash and etag_matches(request, preview_etag(version_hash)):
+                return not_modified(preview_etag(version_hash), settings.VERSION_CACHE_CONTROL)
+
+        content = get_document_version_content(pk, version_number)
+        if content is None:
+            return Response({'error': 'Version content not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = _html_preview_response(content)
+        return set_validators(response, preview_etag(content_hash(content)), settings.VERSION_CACHE_CONTROL)
+    except Exception as e:
+        logger.exception("Error in preview_version_html: %s", e)
+        return Response({'error': f'Error rendering preview: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+DIFF_MODES = ('patch', 'html', 'pdf')
+
+@api_view(['GET'])
+def get_version_diff(request, pk, version_a, version_b):
+    """
+    Compares version `version_a` of a conversation with version `version_b`.
+    `?mode=patch` (default) returns the compact JSON patch from
+    version_diff.diff_versions, sized by the edit rather than the document.
+    `?mode=html` and `?mode=pdf` return version b as a redline (removed text
+    struck through, added text underlined) in the PDF stylesheet.
+    Versions never change, so patches are stored by content hash and
+    responses are cacheable like other per-version URLs.
+    """
+    mode = request.query_params.get('mode', 'patch')
+    if mode not in DIFF_MODES:
+        return Response({'error': f"Unknown diff mode. Use one of: {', '.join(DIFF_MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        old_hash = get_document_version_hash(pk, version_a)
+        new_hash = get_document_version_hash(pk, version_b)
+        if not old_hash or not new_hash:
+            return Response({'error': 'Version content not found'}, status=status.HTTP_404_NOT_FOUND)
+        etag = diff_etag(old_hash, new_hash, mode)
+        if etag_matches(request, etag):
+            return not_modified(etag, settings.VERSION_CACHE_CONTROL)
+
+        patch = find_version_diff(old_hash, new_hash)
+        if patch is None or mode != 'patch':
+            old_content = get_document_version_content(pk, version_a)
+            new_content = get_document_version_content(pk, version_b)
+            if old_content is None or new_content is None:
+                return Response({'error': 'Version content not found'}, status=status.HTTP_404_NOT_FOUND)
+            if patch is None:
+                patch = diff_versions(old_content, new_content)
+                record_version_diff(old_hash, new_hash, patch)
+
+        if mode == 'patch':
+            payload = {'from_version': version_a, 'to_version': version_b, 'from_hash': old_hash, 'to_hash': new_hash, **patch}
+            return set_validators(Response(payload, status=status.HTTP_200_OK), etag, settings.VERSION_CACHE_CONTROL)
+
+        redline = redline_markdown(old_content, new_content, patch)
+        if mode == 'html':
+            response = _html_preview_response(redline, stylesheet(REDLINE_RENDERER))
+        else:
+            pdf_file = BytesIO(pdf_cache.get_or_render(redline, pdf_render_pool.render, REDLINE_RENDERER))
+            response = FileResponse(pdf_file, content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="redline_v{version_a}_v{version_b}.pdf"'
+        return set_validators(response, etag, settings.VERSION_CACHE_CONTROL)
+    except (PdfRenderBusy, PdfRenderTimeout) as e:
+        return _pdf_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Error in get_version_diff: %s", e)
+        return Response({'error': f'Error comparing versions: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+def export_pdfs(request):
+    """
+    Streams a ZIP of PDFs for the selected conversations (all of them when
+    `conversation_ids` is omitted): their latest version, or every version with
+    `"versions": "all"`. Documents are rendered in parallel on the PDF render
+    pool and each ZIP entry is sent as soon as its render finishes.
+    manifest.ndjson at the end of the archive lists every document, including
+    any that failed.
+    """
+    conversation_ids = request.data.get('conversation_ids')
+    if conversation_ids is not None and (not isinstance(conversation_ids, list) or not all(isinstance(i, str) for i in conversation_ids)):
+        return Response({'error': 'conversation_ids must be a list of conversation IDs.'}, status=status.HTTP_400_BAD_REQUEST)
+    versions = request.data.get('versions', 'latest')
+    if versions not in ('latest', 'all'):
+        return Response({'error': 'versions must be "latest" or "all".'}, status=status.HTTP_400_BAD_REQUEST)
+    renderer = _pdf_renderer(request)
+    if renderer is None:
+        return _unknown_renderer_response()
+
+    results = render_export(
+        export_items(conversation_ids, all_versions=versions == 'all'),
+        pdf_render_pool,
+        # Disk tier only: reuses precomputed PDFs without flushing the memory tier.
+        cache=PdfCache(max_memory_bytes=0, directory=settings.PDF_CACHE_DIR),
+        renderer=renderer,
+        max_in_flight=settings.PDF_EXPORT_MAX_IN_FLIGHT,
+        timeout=settings.PDF_RENDER_TIMEOUT,
+    )
+    chunks = stream_export_zip(results)
+    if isinstance(request._request, ASGIRequest):
+        # As in chat_stream: a sync iterator would be buffered in full under ASGI.
+        chunks = aiterate_sync(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="legal_documents.zip"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['GET', 'POST'])
 def conversation_list(request):
     """
-    List all conversations or create a new one.
+    List conversations (keyset-paginated via ?limit=&cursor=) or create a new one.
     """
     if request.method == 'GET':
-        conversations = get_all_conversations()
-        return Response(conversations)
+        try:
+            limit = min(max(int(request.query_params.get('limit', CONVERSATION_PAGE_SIZE)), 1), MAX_CONVERSATION_PAGE_SIZE)
+            conversations, next_cursor = list_conversations(limit, request.query_params.get('cursor'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': conversations, 'next_cursor': next_cursor})
 
     elif request.method == 'POST':
         title = request.data.get('title')
@@ -333,7 +677,7 @@ def conversation_list(request):
         initial_document_content = request.data.get('initial_document_content')
         notes = request.data.get('notes', 'Initial Version')
 
-        print(f"[DEBUG Backend] conversation_list (POST) - Received messages: {messages}")
+        logger.debug("conversation_list (POST) - received %d messages", len(messages or []))
 
         if not title or not messages:
             return Response({'error': 'Title and messages are required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -344,38 +688,169 @@ def conversation_list(request):
         else:
             return Response({'error': 'Failed to save conversation'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET', 'PUT', 'DELETE'])
+@api_view(['GET'])
+def search(request):
+    """
+    Ranked search over conversation titles and latest documents (?q=, with
+    ?limit= and ?offset=). ?versions=true also searches text added by earlier
+    versions. Results carry highlighted snippets, not documents.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'A search query (q) is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', CONVERSATION_PAGE_SIZE)), 1), MAX_CONVERSATION_PAGE_SIZE)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if offset + limit > MAX_SEARCH_RESULTS:
+        return Response({'error': f'Only the first {MAX_SEARCH_RESULTS} results can be paged through; refine the query.'}, status=status.HTTP_400_BAD_REQUEST)
+    include_versions = request.query_params.get('versions', '').lower() in ('1', 'true')
+    results, has_more = search_conversations(query, limit, offset, include_versions)
+    return Response({'results': results, 'next_offset': offset + limit if has_more else None})
+
+@api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 def conversation_detail(request, pk):
     """
     Retrieve, update or delete a single conversation.
+    PATCH takes only what changed; see _patch_conversation.
     """
     if request.method == 'GET':
+        if has_conditional_request(request):
+            revision = get_conversation_revision(pk)
+            if revision and etag_matches(request, conversation_etag(revision)):
+                return not_modified(conversation_etag(revision), 'no-cache')
+
         conversation = get_conversation_by_id(pk)
         if conversation:
-            return Response(conversation)
+            return set_validators(Response(conversation), conversation_etag(conversation), 'no-cache')
         else:
             return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
     
     elif request.method == 'PUT':
         title = request.data.get('title')
+        new_messages = request.data.get('new_messages')
         messages = request.data.get('messages')
         new_document_content = request.data.get('new_document_content')
         notes = request.data.get('notes', f'Version update via AI editor')
 
-        print(f"[DEBUG Backend] conversation_detail (PUT) - Received messages: {messages}")
+        logger.debug("conversation_detail (PUT) - received %d new messages", len(new_messages or []))
 
-        if not title or not messages:
-            return Response({'error': 'Title and messages are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not title or (new_messages is None and not messages):
+            return Response({'error': 'Title and new_messages (or messages) are required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        success = update_conversation(pk, title, messages, new_document_content, uploaded_by=(request.user.username if request.user.is_authenticated else 'anonymous'), notes=notes)
+        # `new_messages` are appended; a full `messages` array from older clients replaces the history.
+        success = update_conversation(pk, title, new_messages, new_document_content, uploaded_by=(request.user.username if request.user.is_authenticated else 'anonymous'), notes=notes, messages=None if new_messages is not None else messages)
         if success:
             return Response({'status': 'success'}, status=status.HTTP_200_OK)
         else:
             return Response({'error': 'Failed to update conversation'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    elif request.method == 'PATCH':
+        return _patch_conversation(request, pk)
+
     elif request.method == 'DELETE':
         success = delete_conversation(pk)
         if success:
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
-            return Response({'error': 'Failed to delete conversation'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': 'Failed to delete conversation'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def _patch_conversation(request, pk):
+    """
+    Delta update: the body carries only what changed, so its size (and what the
+    server writes) follows the edit rather than the conversation's length.
+
+    - `title` (optional) replaces the title;
+    - `new_messages` (optional) are appended to the history;
+    - `document_delta` with `base_version` creates a new version from the base
+      version's content. The delta uses the version store's format: a list of
+      `[start, end]` ranges of base lines to copy and strings to insert.
+      `new_document_content` may be sent instead of a delta.
+    - `content_hash` (optional) is the sha256 of the expected new content.
+
+    If `base_version` is no longer the latest version, nothing is written and
+    the response is 409 with `latest_version`, so the client can rebase.
+    """
+    title = request.data.get('title')
+    new_messages = request.data.get('new_messages')
+    document_delta = request.data.get('document_delta')
+    new_document_content = request.data.get('new_document_content')
+    base_version = request.data.get('base_version')
+    notes = request.data.get('notes', 'Version update via AI editor')
+
+    if new_messages is not None and not (isinstance(new_messages, list) and all(isinstance(m, dict) for m in new_messages)):
+        return Response({'error': 'new_messages must be a list of message objects.'}, status=status.HTTP_400_BAD_REQUEST)
+    for field, value in (('title', title), ('new_document_content', new_document_content), ('notes', notes), ('content_hash', request.data.get('content_hash'))):
+        if value is not None and not isinstance(value, str):
+            return Response({'error': f'{field} must be a string.'}, status=status.HTTP_400_BAD_REQUEST)
+    if document_delta is not None and not (isinstance(document_delta, list) and all(isinstance(op, (str, list)) for op in document_delta)):
+        return Response({'error': 'document_delta must be a list of [start, end] line ranges and strings.'}, status=status.HTTP_400_BAD_REQUEST)
+    if document_delta is not None and new_document_content is not None:
+        return Response({'error': 'Send either document_delta or new_document_content, not both.'}, status=status.HTTP_400_BAD_REQUEST)
+    changes_document = document_delta is not None or new_document_content is not None
+    if changes_document and (not isinstance(base_version, int) or isinstance(base_version, bool)):
+        return Response({'error': 'base_version (the version the change is based on) is required with a document change.'}, status=status.HTTP_400_BAD_REQUEST)
+    if title is None and not new_messages and not changes_document:
+        return Response({'error': 'Nothing to update.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    base_content = None
+    if changes_document:
+        summary = get_conversation_summary(pk)
+        if not summary:
+            return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+        if base_version != summary.get('latest_version'):
+            return _version_conflict_response(summary.get('latest_version'))
+        base_content = get_document_version_content(pk, base_version)
+        if base_content is None:
+            return Response({'error': 'Base version content not found'}, status=status.HTTP_404_NOT_FOUND)
+        if document_delta is not None:
+            try:
+                new_document_content = apply_untrusted_delta(base_content, document_delta)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        expected_hash = request.data.get('content_hash')
+        if expected_hash and expected_hash != content_hash(new_document_content):
+            return Response({'error': 'The patched document does not match content_hash.'}, status=status.HTTP_400_BAD_REQUEST)
+        if new_document_content == base_content:
+            # Nothing changed in the document; don't store an identical version.
+            new_document_content = base_content = None
+            changes_document = False
+
+    try:
+        success = update_conversation(
+            pk, title, new_messages, new_document_content,
+            uploaded_by=(request.user.username if request.user.is_authenticated else 'anonymous'),
+            notes=notes,
+            base_version=base_version if changes_document else None,
+            base_content=base_content,
+        )
+    except VersionConflict as e:
+        return _version_conflict_response(e.latest_version)
+    if not success:
+        return Response({'error': 'Failed to update conversation'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    payload = {'status': 'success'}
+    if changes_document:
+        payload.update({'version_number': base_version + 1, 'content_hash': content_hash(new_document_content)})
+    return Response(payload, status=status.HTTP_200_OK)
+
+def _version_conflict_response(latest_version):
+    return Response(
+        {'error': 'The document has changed since base_version; rebase onto the latest version.', 'latest_version': latest_version},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+@api_view(['GET'])
+def metrics(request):
+    """
+    Stage and request latency histograms in Prometheus text format.
+    With METRICS_TOKEN set, scrapers must send it as a bearer token.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), expected):
+            return Response({'error': 'Invalid or missing metrics token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    body, content_type = exposition()
+    return HttpResponse(body, content_type=content_type)
@@ -0,0 +1,51 @@
+"""
+Optional warm-up after boot. Heavy dependencies (xhtml2pdf, the Cloudinary SDK,
+the LLM clients) and the Mongo connection are loaded lazily so that a server
+process starts quickly; this loads them in a background thread right after
+startup, so the first requests usually find them ready. Requests that arrive
+earlier simply wait on the same imports.
+"""
+import importlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODULES = ('xhtml2pdf.pisa', 'PIL.Image', 'requests', 'PyPDF2')
+ASYNC_WARMUP_MODULES = ('motor.motor_asyncio', 'httpx')
+
+
+def warm_up(asgi=False):
+    """Imports heavy modules, connects to Mongo, builds the LLM router and renders a tiny PDF."""
+    from .llm_providers import get_llm_router
+    from .mongo_client import get_db
+    from .pdf_pool import pdf_render_pool
+    from .signatures import cloudinary_sdk
+
+    started = time.perf_counter()
+    steps = [(f'import {name}', lambda name=name: importlib.import_module(name)) for name in WARMUP_MODULES + (ASYNC_WARMUP_MODULES if asgi else ())]
+    steps += [
+        ('Cloudinary SDK', cloudinary_sdk),
+        ('Mongo connection', lambda: get_db().command('ping')),
+        ('LLM router', get_llm_router),
+        ('PDF renderer', lambda: pdf_render_pool.render('# Warm-up\n\nText.\n', settings.PDF_RENDERER)),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+    logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def start_background_warmup(asgi=False):
+    """Starts warm_up() in a daemon thread when WARMUP_ON_START is enabled; returns the thread or None."""
+    if not settings.WARMUP_ON_START:
+        return None
+    thread = threading.Thread(target=warm_up, kwargs={'asgi': asgi}, name='docgen-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,15 @@
+import logging
+import random
+
+
+class SampledDebugFilter(logging.Filter):
+    """Passes every record at INFO and above, and a `rate` fraction of DEBUG records."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or self.rate >= 1:
+            return True
+        return random.random() < self.rate
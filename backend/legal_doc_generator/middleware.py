@@ -0,0 +1,122 @@
+import re
+import time
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from generator import metrics
+
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# PDFs and ZIPs are already compressed, and event streams must not be buffered.
+UNCOMPRESSED_CONTENT_TYPES = ('application/pdf', 'application/zip', 'text/event-stream')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Brotli-compresses responses for clients that accept it, falling back to gzip.
+    PDFs and Server-Sent Events are passed through untouched.
+    """
+    min_length = 200
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return response
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if response.streaming or not re_accepts_brotli.search(accept_encoding):
+            return super().process_response(request, response)
+        if len(response.content) < self.min_length or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=5)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+        # A strong ETag must change with the encoding; see GZipMiddleware.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise is sync-only, which makes Django run every request under ASGI
+    through a per-request worker thread. Static lookups are a dict lookup, so
+    this subclass serves them inline and keeps the async view chain async.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """
+    Records request latency per route and collects the timing spans recorded
+    while handling the request (generator.metrics.span) into a Server-Timing
+    header. Spans inside a streamed body happen after the headers are sent, so
+    they only reach the histograms.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            spans = metrics.end_request(token)
+        return self._finish(request, response, spans, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            spans = metrics.end_request(token)
+        return self._finish(request, response, spans, time.perf_counter() - started)
+
+    def _finish(self, request, response, spans, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        metrics.request_duration.labels(request.method, route, str(response.status_code)).observe(elapsed)
+        if settings.SERVER_TIMING_HEADER:
+            response.headers['Server-Timing'] = metrics.server_timing(spans, total=elapsed)
+        return response
@@ -67,9 +67,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'legal_doc_generator.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'legal_doc_generator.middleware.CompressionMiddleware',
+    'legal_doc_generator.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -153,6 +155,56 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered PDF cache (in-memory LRU in front of an on-disk tier under MEDIA_ROOT)
+PDF_CACHE_MAX_MEMORY_BYTES = int(os.getenv('PDF_CACHE_MAX_MEMORY_BYTES', 64 * 1024 * 1024))
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', str(MEDIA_ROOT / 'pdf_cache'))
+
+# Per-section markdown -> HTML cache (per process) shared by PDF renders and HTML previews
+MARKDOWN_SECTION_CACHE_MAX_BYTES = int(os.getenv('MARKDOWN_SECTION_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# PDF renderer: "xhtml2pdf" (markdown -> HTML/CSS -> PDF) or "native" (markdown tree laid
+# out directly with reportlab). Download endpoints also accept ?renderer=<name>.
+PDF_RENDERER = os.getenv('PDF_RENDERER', 'xhtml2pdf')
+
+# Server processes on this machine (gunicorn reads the same variable for its -w default).
+WEB_CONCURRENCY = max(int(os.getenv('WEB_CONCURRENCY', 1)), 1)
+
+# PDF render pool, one per server process: the machine runs
+# WEB_CONCURRENCY x PDF_RENDER_WORKERS render processes in total, so by default
+# the server processes split the cores between them. Set PDF_RENDER_WORKERS=0 to render inline.
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+PDF_RENDER_QUEUE_SIZE = int(os.getenv('PDF_RENDER_QUEUE_SIZE', PDF_RENDER_WORKERS * 4))
+PDF_RENDER_TIMEOUT = float(os.getenv('PDF_RENDER_TIMEOUT', 60))
+PDF_RENDER_RETRY_AFTER = int(os.getenv('PDF_RENDER_RETRY_AFTER', 5))
+# Renders a bulk export keeps in flight (and PDFs it holds in memory) at once.
+PDF_EXPORT_MAX_IN_FLIGHT = int(os.getenv('PDF_EXPORT_MAX_IN_FLIGHT', max(PDF_RENDER_WORKERS, 1) * 2))
+
+# Uploaded PDF analysis (/api/analyze-pdf/). Page text is extracted in worker processes
+# (0 extracts inline), PDF_ANALYZE_PAGES_PER_TASK pages at a time, and reviewed by the
+# LLM in chunks of about PDF_ANALYZE_CHUNK_CHARS characters with at most
+# PDF_ANALYZE_LLM_CONCURRENCY model calls in flight per server process.
+PDF_ANALYZE_WORKERS = int(os.getenv('PDF_ANALYZE_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+PDF_ANALYZE_PAGES_PER_TASK = int(os.getenv('PDF_ANALYZE_PAGES_PER_TASK', 8))
+PDF_ANALYZE_CHUNK_CHARS = int(os.getenv('PDF_ANALYZE_CHUNK_CHARS', 12000))
+PDF_ANALYZE_LLM_CONCURRENCY = int(os.getenv('PDF_ANALYZE_LLM_CONCURRENCY', 4))
+PDF_ANALYZE_MAX_UPLOAD_BYTES = int(os.getenv('PDF_ANALYZE_MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+PDF_ANALYZE_MAX_PAGES = int(os.getenv('PDF_ANALYZE_MAX_PAGES', 1000))
+
+# Background PDF precompute: saving a version queues a render job (Mongo-backed) that
+# `python manage.py run_pdf_workers` processes. Workers must share PDF_CACHE_DIR.
+# Off by default: without a running worker the queue only grows.
+PDF_PRECOMPUTE = os.getenv('PDF_PRECOMPUTE', 'false').lower() == 'true'
+PDF_JOB_MAX_ATTEMPTS = int(os.getenv('PDF_JOB_MAX_ATTEMPTS', 5))
+PDF_JOB_LEASE_SECONDS = int(os.getenv('PDF_JOB_LEASE_SECONDS', 300))
+PDF_JOB_RETRY_BASE_SECONDS = int(os.getenv('PDF_JOB_RETRY_BASE_SECONDS', 10))
+PDF_WORKER_POLL_INTERVAL = float(os.getenv('PDF_WORKER_POLL_INTERVAL', 1))
+
+# Local, pre-resized copies of signature images embedded in PDFs
+SIGNATURE_CACHE_DIR = os.getenv('SIGNATURE_CACHE_DIR', str(MEDIA_ROOT / 'signature_cache'))
+SIGNATURE_FETCH_TIMEOUT = float(os.getenv('SIGNATURE_FETCH_TIMEOUT', 10))
+SIGNATURE_UPLOAD_TIMEOUT = float(os.getenv('SIGNATURE_UPLOAD_TIMEOUT', 30))
+SIGNATURE_ALLOWED_HOSTS = [host.strip() for host in os.getenv('SIGNATURE_ALLOWED_HOSTS', 'res.cloudinary.com').split(',') if host.strip()]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -164,14 +216,76 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 
-# Cloudinary configuration
-import cloudinary
-cloudinary.config(
-    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key = os.getenv("CLOUDINARY_API_KEY"),
-    api_secret = os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True
-)
+# LLM provider routing. Providers are tried in this order until latency stats
+# exist; entries without an API key are skipped. "fake" is an offline stand-in.
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "gemini").split(",") if name.strip()]
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash-lite")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 120))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", 50))
+LLM_HEDGE_REQUESTS = os.getenv("LLM_HEDGE_REQUESTS", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", 0))
+
+# Approximate token budget for history rebuilt server-side from a stored conversation
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 8000))
+
+# Cloudinary configuration, applied when the SDK is first used (generator.signatures)
+CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
+CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
+CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
 # MongoDB configuration
-MONGO_URI = os.getenv("MONGO_URI")
\ No newline at end of file
+MONGO_URI = os.getenv("MONGO_URI")
+
+# Document versions are stored as deltas, with a full snapshot every N versions
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", 10))
+
+# Stemming and stop words for the search text indexes (a MongoDB text search language,
+# or "none"). Changing it needs the indexes dropped and recreated.
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+
+# Cache-Control for per-version URLs (content and PDF). Versions never change once
+# written; use "private, ..." to keep them out of shared caches such as a CDN.
+VERSION_CACHE_CONTROL = os.getenv("VERSION_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+# Observability. Stage and request latency histograms are served in Prometheus
+# format at /api/metrics/; set METRICS_TOKEN to require "Authorization: Bearer <token>".
+# With several server processes, set PROMETHEUS_MULTIPROC_DIR (see prometheus_client).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Echo each request's stage timings in a Server-Timing response header.
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"
+
+# Logging. DEBUG records are noisy on busy servers, so with LOG_LEVEL=DEBUG only a
+# LOG_DEBUG_SAMPLE_RATE fraction of them is written.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample_debug': {
+            '()': 'legal_doc_generator.log_filters.SampledDebugFilter',
+            'rate': LOG_DEBUG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'plain',
+            'filters': ['sample_debug'],
+        },
+    },
+    'loggers': {
+        'generator': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Heavy dependencies and the Mongo connection load on first use. With this on, server
+# processes (wsgi.py/asgi.py) load them in a background thread right after boot.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() == "true"
\ No newline at end of file
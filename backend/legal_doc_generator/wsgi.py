@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'legal_doc_generator.settings')
 
 application = get_wsgi_application()
+
+from generator.warmup import start_background_warmup  # noqa: E402 (needs the app registry)
+
+start_background_warmup()
@@ -0,0 +1,75 @@
+"""
+Compares the PDF renderers (xhtml2pdf and native reportlab) on generated legal
+documents of increasing size: median render time and peak Python heap
+allocated during a render (tracemalloc).
+
+    python pdf_benchmark.py
+    python pdf_benchmark.py --sections 5 50 200 --runs 5
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from generator.pdf_renderer import PDF_RENDERERS, render_pdf
+
+
+CLAUSE = (
+    "The Tenant shall pay the Landlord the monthly rent of **$1,250.00** on or before the first day "
+    "of each calendar month, without demand or deduction, by bank transfer to the account designated "
+    "in writing by the Landlord. Any payment received after the fifth day of the month shall incur a "
+    "late fee of *five percent (5%)* of the overdue amount."
+)
+
+
+def build_document(sections):
+    """A lease with `sections` numbered sections, each with paragraphs, a list and (every 5th) a table."""
+    parts = ['# Residential Lease Agreement\n', f'This Lease Agreement is made on 1 January 2025.\n\n{CLAUSE}\n']
+    for number in range(1, sections + 1):
+        parts.append(f'## {number}. Section {number}\n')
+        parts.append(f'{CLAUSE}\n\n{CLAUSE}\n')
+        parts.append('### Obligations\n')
+        parts.append('\n'.join(f'- Obligation {number}.{item}: {CLAUSE[:120]}' for item in range(1, 4)) + '\n')
+        if number % 5 == 0:
+            rows = '\n'.join(f'| Item {row} | ${row * 100}.00 | Due monthly |' for row in range(1, 6))
+            parts.append(f'| Item | Amount | Notes |\n|------|--------|-------|\n{rows}\n')
+    parts.append('---\n\n**Landlord:** John Doe\n\n**Tenant:** Jane Roe\n')
+    return '\n'.join(parts)
+
+
+def measure(renderer, markdown_content, runs):
+    render_pdf(markdown_content, renderer)  # warm-up: font loading, imports
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        data = render_pdf(markdown_content, renderer)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    render_pdf(markdown_content, renderer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--renderers', nargs='+', default=list(PDF_RENDERERS), choices=PDF_RENDERERS)
+    args = parser.parse_args()
+
+    print(f"| {'Sections':>8} | {'Markdown':>9} | {'Renderer':<9} | {'Median time':>11} | {'Peak heap':>9} | {'PDF size':>8} |")
+    print(f"|{'-' * 9}:|{'-' * 10}:|{'-' * 11}|{'-' * 12}:|{'-' * 10}:|{'-' * 9}:|")
+    for sections in args.sections:
+        markdown_content = build_document(sections)
+        for renderer in args.renderers:
+            seconds, peak, size = measure(renderer, markdown_content, args.runs)
+            print(
+                f"| {sections:>8} | {len(markdown_content) / 1024:>7.1f}KB | {renderer:<9} | "
+                f"{seconds * 1000:>9.0f}ms | {peak / 2**20:>7.1f}MB | {size / 1024:>6.0f}KB |"
+            )
+
+
+if __name__ == '__main__':
+    main()
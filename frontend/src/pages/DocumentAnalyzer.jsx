@@ -34,12 +34,15 @@ const DocumentAnalyzer = () => {
     fetchConversation();
   }, [conversationId, navigate]);
 
-  const handleVersionChange = (event) => {
+  const handleVersionChange = async (event) => {
     const versionNum = parseInt(event.target.value);
     setSelectedVersionNumber(versionNum);
-    const version = conversation.document_versions.find(v => v.version_number === versionNum);
-    if (version) {
-      setSelectedVersionContent(version.content);
+    try {
+      const response = await axios.get(`conversations/${conversationId}/versions/${versionNum}/content/`);
+      setSelectedVersionContent(response.data.content);
+    } catch (error) {
+      console.error('Error fetching version content:', error);
+      toast.error(`Could not load version ${versionNum}.`);
     }
   };
 
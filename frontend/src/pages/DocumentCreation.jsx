@@ -119,6 +119,7 @@ const DocumentCreation = () => {
   const versionToLoad = queryParams.get('version');
   
   const [messages, setMessages] = useState([]);
+  const [savedMessageCount, setSavedMessageCount] = useState(0); // Messages already stored on the server
   const [title, setTitle] = useState('');
   const [chatMessage, setChatMessage] = useState('');
   const [isGenerating, setIsGenerating] = useState(false);
@@ -150,21 +151,22 @@ const DocumentCreation = () => {
         console.log("[DEBUG Frontend] Fetched conversation messages:", conversation.messages);
         setTitle(conversation.title || '');
         setMessages(conversation.messages || []);
+        setSavedMessageCount((conversation.messages || []).length);
         
         if (conversation.document_versions && conversation.document_versions.length > 0) {
-          let contentToLoad = '';
+          // Versions only carry metadata; fetch the content of the one we need.
+          const latestVersion = conversation.document_versions[conversation.document_versions.length - 1];
+          let versionNumber = latestVersion.version_number; // Default to latest
           if (versionToLoad) {
             const specificVersion = conversation.document_versions.find(v => v.version_number === parseInt(versionToLoad));
             if (specificVersion) {
-              contentToLoad = specificVersion.content;
+              versionNumber = specificVersion.version_number;
             } else {
-              toast.error(`Version ${versionToLoad} not found.`);
-              contentToLoad = conversation.document_versions[conversation.document_versions.length - 1].content; // Fallback to latest
+              toast.error(`Version ${versionToLoad} not found.`); // Fallback to latest
             }
-          } else {
-            contentToLoad = conversation.document_versions[conversation.document_versions.length - 1].content; // Default to latest
           }
-          setFinalDocument(contentToLoad);
+          const contentResponse = await axios.get(`conversations/${idToFetch}/versions/${versionNumber}/content/`);
+          setFinalDocument(contentResponse.data.content);
         } else {
           setFinalDocument(''); // Clear document if no versions
         }
@@ -177,6 +179,7 @@ const DocumentCreation = () => {
       console.log("[DEBUG Frontend] Resetting state for new document creation.");
       setTitle('');
       setMessages([]);
+      setSavedMessageCount(0);
       setFinalDocument('');
     }
   };
@@ -255,10 +258,10 @@ const DocumentCreation = () => {
     // Payload for the conversation history + new version content
     const conversationPayload = {
       title: title,
-      messages: messages, // <--- Debug: Check this value
+      new_messages: messages.slice(savedMessageCount), // Only messages the server hasn't stored yet
       new_document_content: finalDocument // Send new document content to be saved as a new version
     };
-    console.log("[DEBUG Frontend] handleSaveConversation - messages being sent:", conversationPayload.messages);
+    console.log("[DEBUG Frontend] handleSaveConversation - new messages being sent:", conversationPayload.new_messages);
 
     try {
       let idToUseForFetch = mongoConversationId; // Use the ID from params initially
@@ -8,6 +8,7 @@ const MyDocuments = () => {
   const [conversations, setConversations] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
   const [filteredConversations, setFilteredConversations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -22,10 +23,12 @@ const MyDocuments = () => {
       });
       setFilteredConversations(filtered);
     }, [searchTerm, conversations]);
-  const fetchConversations = async () => {
+  const fetchConversations = async (cursor = null) => {
     try {
-      const response = await axios.get('conversations/');
-      setConversations(response.data);
+      const response = await axios.get('conversations/', { params: cursor ? { cursor } : {} });
+      const { results, next_cursor } = response.data;
+      setConversations(prev => (cursor ? [...prev, ...results] : results));
+      setNextCursor(next_cursor);
     } catch (error) {
       console.error('Error fetching conversations:', error);
       toast.error('Failed to load documents.');
@@ -141,6 +144,14 @@ const MyDocuments = () => {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <button
+                onClick={() => fetchConversations(nextCursor)}
+                className="px-6 py-3 bg-white text-blue-600 border border-blue-300 rounded-xl hover:bg-blue-50 transition-colors shadow"
+              >
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>